@@ -0,0 +1,178 @@
+"""
+Harmonic, closeness and betweenness centralities of unweighted graphs,
+computed together from one breadth-first search per source node.
+"""
+
+import os
+import concurrent.futures
+
+import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
+import networkx as nx
+
+import mappertools.features.core as mfc
+
+
+CENTRALITIES = ('harmonic', 'closeness', 'betweenness')
+
+
+def _source_sweep(indptr, indices, source, dist, sigma, delta, harmonic, distance_sum, betweenness):
+    """
+    Breadth-first search from source, with shortest path counting (Brandes' algorithm),
+    accumulating contributions of source to the centralities of all other nodes.
+
+    dist, sigma, delta are work arrays, equal to -1, 0, 0 before and after the call.
+    """
+    dist[source] = 0
+    sigma[source] = 1
+    reached = [np.array([source])]
+    dag_edges = []
+
+    frontier = reached[0]
+    while True:
+        owners, neighbors = mfc.gather_neighbors(indptr, indices, frontier)
+        depth = len(reached)
+
+        new = np.unique(neighbors[dist[neighbors] < 0])
+        if len(new) == 0:
+            break
+        dist[new] = depth
+
+        # edges of the shortest path DAG from this level to the next one
+        forward = dist[neighbors] == depth
+        u, w = frontier[owners[forward]], neighbors[forward]
+        np.add.at(sigma, w, sigma[u])
+
+        dag_edges.append((u, w))
+        reached.append(new)
+        frontier = new
+
+    for u, w in reversed(dag_edges):
+        np.add.at(delta, u, sigma[u] / sigma[w] * (1 + delta[w]))
+
+    targets = np.concatenate(reached[1:]) if len(reached) > 1 else np.empty(0, dtype=int)
+    harmonic[targets] += 1 / dist[targets]
+    distance_sum[targets] += dist[targets]
+    betweenness[targets] += delta[targets]
+
+    everything = np.concatenate(reached)
+    dist[everything] = -1
+    sigma[everything] = 0
+    delta[everything] = 0
+
+
+def _component_centralities(task):
+    """
+    Sums over sources of their contributions to centralities, in one connected component.
+
+    Parameters
+    ----------
+    task : tuple (indptr, indices, sources)
+        CSR adjacency of the component, and positions of source nodes.
+
+    Returns
+    -------
+    (harmonic, distance_sum, betweenness) : tuple of arrays
+    """
+    indptr, indices, sources = task
+    n = len(indptr) - 1
+
+    dist = np.full(n, -1)
+    sigma = np.zeros(n)
+    delta = np.zeros(n)
+    harmonic, distance_sum, betweenness = np.zeros(n), np.zeros(n), np.zeros(n)
+    for source in sources:
+        _source_sweep(indptr, indices, source, dist, sigma, delta, harmonic, distance_sum, betweenness)
+    return harmonic, distance_sum, betweenness
+
+
+@nx.utils.not_implemented_for("directed")
+def compute_centralities(G, k=None, seed=None, n_jobs=1, min_component_size=100):
+    """
+    Harmonic, closeness and betweenness centrality of nodes, from shared breadth-first searches.
+
+    With k=None, the results are those of networkx.harmonic_centrality,
+    networkx.closeness_centrality and networkx.betweenness_centrality with default options
+    (edges unweighted, closeness with wf_improved, betweenness normalized).
+
+    Parameters
+    ----------
+    G : networkx graph
+        Undirected graph. Edge weights are ignored.
+
+    k : int, optional
+        If given, approximate centralities from about k sampled source nodes ("pivots").
+        Pivots are spread over connected components in proportion to their sizes,
+        with at least one per component, and contributions are scaled up accordingly.
+        Components with no more nodes than their share of pivots are computed exactly.
+
+    seed : int, optional
+        Seed of the random choice of pivots.
+
+    n_jobs : int
+        Number of processes. Connected components are distributed over a process pool.
+        -1 means use all processors. 1 means no pool is created.
+
+    min_component_size : int
+        Components with fewer nodes are computed in the calling process.
+
+    Returns
+    -------
+    centralities : dict {name : dict {node : centrality}}
+        For each name in CENTRALITIES.
+    """
+    arrays = mfc.GraphArrays(G)
+    n = len(arrays.nodes)
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    rng = np.random.default_rng(seed)
+
+    A = scipy.sparse.csr_matrix((np.ones(len(arrays.indices)), arrays.indices, arrays.indptr), shape=(n, n))
+    n_components, labels = scipy.sparse.csgraph.connected_components(A, directed=False)
+    order = np.argsort(labels, kind='stable')
+    components = np.split(order, np.cumsum(np.bincount(labels, minlength=n_components))[:-1])
+
+    tasks = []
+    scales = []
+    for component in components:
+        size = len(component)
+        sub = A[component][:,component]
+
+        if k is None:
+            n_sources = size
+        else:
+            n_sources = min(size, max(1, round(k * size / n)))
+        sources = np.arange(size) if n_sources == size else np.sort(rng.choice(size, n_sources, replace=False))
+
+        tasks.append((sub.indptr, sub.indices, sources))
+        scales.append(size / n_sources)
+
+    results = [None] * len(tasks)
+    large = [i for i, component in enumerate(components) if len(component) >= min_component_size]
+    if n_jobs != 1 and len(large) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            for i, result in zip(large, pool.map(_component_centralities, [tasks[i] for i in large])):
+                results[i] = result
+    for i, task in enumerate(tasks):
+        if results[i] is None:
+            results[i] = _component_centralities(task)
+
+    harmonic, closeness, betweenness = np.zeros(n), np.zeros(n), np.zeros(n)
+    for component, scale, (h, d, b) in zip(components, scales, results):
+        size = len(component)
+        harmonic[component] = scale * h
+        betweenness[component] = scale * b
+
+        distance_sum = scale * d
+        with np.errstate(divide='ignore', invalid='ignore'):
+            c = np.where(distance_sum > 0, (size - 1) / distance_sum, 0.0)
+        if n > 1:
+            c *= (size - 1) / (n - 1)
+        closeness[component] = c
+
+    if n > 2:
+        betweenness /= (n - 1) * (n - 2)
+
+    return {name: dict(zip(arrays.nodes, values.tolist()))
+            for name, values in zip(CENTRALITIES, (harmonic, closeness, betweenness))}
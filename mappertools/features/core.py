@@ -1,10 +1,52 @@
+import warnings
 from functools import lru_cache
 
+import numpy as np
+import networkx as nx
 
+from mappertools.mapper.mapper_graph import MapperGraph
 
 
 
-def get_nodes_containing_entity(G, entity, query_data='unique_members'):
+class EntityNodeIndex(object):
+    """
+    Inverted index from entities to the nodes of a Mapper graph containing them.
+
+    Built once in a single pass over the 'unique members' of all nodes.
+    Functions taking an index parameter use it in place of scanning all nodes for each entity.
+
+    Parameters
+    ----------
+    G : networkx graph
+        The Mapper graph to index.
+
+    query_data : str
+        node attribute key containing 'unique members' (names of entities) of each node
+    """
+
+    def __init__(self, G, query_data='unique_members'):
+        self.query_data = query_data
+        self.nodes = {}
+        for node, entities in G.nodes.data(query_data):
+            for entity in entities:
+                entity_nodes = self.nodes.setdefault(entity, [])
+                if len(entity_nodes) == 0 or entity_nodes[-1] != node:
+                    entity_nodes.append(node)
+
+    def __getitem__(self, entity):
+        return self.nodes.get(entity, [])
+
+    def __contains__(self, entity):
+        return entity in self.nodes
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def entities(self):
+        return self.nodes.keys()
+
+
+def get_nodes_containing_entity(G, entity, query_data='unique_members', index=None):
     """
     Given a Mapper graph, where each node is a set of observations of
     different entities, we find the ndoes containing a given entity.
@@ -23,18 +65,25 @@ def get_nodes_containing_entity(G, entity, query_data='unique_members'):
     query_data : str
         node attribute key containing 'unique members' (names of entities) of each node
 
+    index : EntityNodeIndex, optional
+        Precomputed index of G, used instead of scanning all nodes.
+
     Returns
     -------
-    nodes : list
-        list of nodes containing at least one observation of entity
+    nodes : iterable
+        nodes containing at least one observation of entity
     """
 
+    if index is not None:
+        return iter(index[entity])
+
     nodes = (node for node in G if entity in G.nodes[node][query_data])
     return nodes
 
 
 @lru_cache(maxsize=None)
 def get_nodes_containing_entity_cached(G, entity, query_data='unique_members'):
+    warnings.warn("get_nodes_containing_entity_cached is planned to be deprecated. Use EntityNodeIndex instead.", PendingDeprecationWarning)
     return list(get_nodes_containing_entity(G, entity, query_data))
 
 
@@ -69,3 +118,59 @@ def compute_core_shell(G, H):
             core.append(x)
 
     return core, shell
+
+
+class GraphArrays(object):
+    """
+    Compact adjacency of a graph, as CSR arrays over positions of nodes.
+
+    Neighbors of the node at position i are at positions indices[indptr[i]:indptr[i+1]].
+
+    Parameters
+    ----------
+    G : networkx graph, or mappertools.mapper.mapper_graph.MapperGraph
+        The adjacency arrays of a MapperGraph are used as is.
+    """
+
+    def __init__(self, G):
+        if isinstance(G, MapperGraph):
+            self.nodes = G.node_ids
+            self.position = G.position
+            self.indptr, self.indices = G.adjacency()
+            return
+
+        self.nodes = list(G)
+        self.position = {node: i for i, node in enumerate(self.nodes)}
+
+        A = nx.to_scipy_sparse_array(G, nodelist=self.nodes, weight=None, format='csr')
+        self.indptr, self.indices = A.indptr, A.indices
+
+    def positions(self, nodes):
+        """
+        Sorted array of positions of given nodes.
+        """
+        return np.sort(np.fromiter((self.position[node] for node in nodes), dtype=np.int64))
+
+
+def gather_neighbors(indptr, indices, nodes):
+    """
+    Neighbors of several nodes at once, from CSR adjacency arrays.
+
+    Parameters
+    ----------
+    indptr, indices : arrays
+        CSR adjacency, as in GraphArrays.
+
+    nodes : array of int
+        positions of nodes
+
+    Returns
+    -------
+    (owners, neighbors) : tuple of arrays
+        neighbors[i] is a neighbor of nodes[owners[i]].
+    """
+    starts = indptr[nodes]
+    counts = indptr[nodes + 1] - starts
+    owners = np.repeat(np.arange(len(nodes)), counts)
+    offsets = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owners, indices[np.repeat(starts, counts) + offsets]
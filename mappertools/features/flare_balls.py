@@ -1,13 +1,26 @@
+import os
+import math
+import concurrent.futures
+
 import networkx as nx
 import numpy as np
 
 import pandas
 
 import mappertools.features.core as mfc
+from mappertools.mapper.mapper_graph import MapperGraph
+
+
+def unit_weight(v, u, e):
+    """
+    Default edge weight for flareness computations: all edges have length 1.
+    """
+    return 1
+
 
 def compute_flareness(G, entity,
-                      weight=(lambda v,u,e: 1), query_data='unique_members',
-                      verbose=0):
+                      weight=unit_weight, query_data='unique_members',
+                      verbose=0, index=None, unweighted=None, arrays=None):
     """
     Compute "flareness" of entity in Mapper graph G using the proposed definition in
     Escolar et al., "Mapping Firms' Locations in Technological Space"
@@ -17,30 +30,68 @@ def compute_flareness(G, entity,
 
     Parameters
     ----------
-    G : networkx graph
+    G : networkx graph, or mappertools.mapper.mapper_graph.MapperGraph
         Represents a Mapper graph, where each node may be
         a set of observations of different entities.
 
     entity :
         The particular entity whose flareness in the graph G we want to compute.
 
-    weight :
+    weight : function or str
+        Edge lengths, as in networkx.multi_source_dijkstra_path_length.
+        Default unit_weight gives length 1 to every edge.
 
     query_data : str
         The node attribute key containing 'unique members' (names of entities) of each node.
 
     verbose : bool
         whether or not to print diagnostic messages
+
+    index : mappertools.features.core.EntityNodeIndex, optional
+        Precomputed index of entities of G.
+
+    unweighted : bool, optional
+        Whether all edge lengths are equal, so that breadth-first search can be used
+        in place of Dijkstra's algorithm. If None, this is detected for weight=unit_weight,
+        and for weight given as an edge attribute with constant value over the edges involved.
+
+    arrays : mappertools.features.core.GraphArrays, optional
+        Precomputed adjacency arrays of G, used for breadth-first search
+        when computing flareness of many entities.
+
+    Returns
+    -------
+    (k, components) : tuple of lists
+        Flare signature, and the corresponding components of the core (as sets of nodes),
+        ordered by their first node in G. (None, None) if the entity is not found.
     """
 
 
-    G_entity = set(mfc.get_nodes_containing_entity(G, entity, query_data))
-    core, shell = mfc.compute_core_shell(G, G_entity)
+    G_entity = set(mfc.get_nodes_containing_entity(G, entity, query_data, index))
 
     if len(G_entity) == 0:
         if verbose > 0: print("Entity {} not found. Ignoring".format(entity))
         return None, None
 
+    if isinstance(G, MapperGraph) and arrays is None:
+        arrays = mfc.GraphArrays(G)
+
+    length = _constant_length(G, G_entity, weight, arrays) if unweighted is None else (1 if unweighted else None)
+
+    if isinstance(G, MapperGraph):
+        if length is None or verbose > 0:
+            # on the networkx subgraph of nodes of entity and their neighbors
+            neighborhood = G_entity.union(*(G[x] for x in G_entity))
+            return compute_flareness(G.subgraph(neighborhood).to_networkx(), entity, weight, query_data,
+                                     verbose, unweighted=unweighted)
+
+    if length is not None and arrays is not None and verbose == 0:
+        k, components = flareness_from_arrays(arrays.indptr, arrays.indices, arrays.positions(G_entity))
+        return ([x * length if np.isfinite(x) else x for x in k],
+                [set(arrays.nodes[i] for i in L) for L in components])
+
+    core, shell = mfc.compute_core_shell(G, G_entity)
+
     if verbose > 0:
         print("G_entity: ", G_entity)
         print("core: ", core)
@@ -49,10 +100,17 @@ def compute_flareness(G, entity,
     G_entity_subgraph = G.subgraph(G_entity)
     distances = {}
     if len(shell) > 0:
-        distances = nx.multi_source_dijkstra_path_length(G_entity_subgraph,shell,
-                                                         weight=weight)
+        if length is not None:
+            distances = _multi_source_bfs_length(G, G_entity, shell, length)
+        else:
+            distances = nx.multi_source_dijkstra_path_length(G_entity_subgraph,shell,
+                                                             weight=weight)
     k = []
     components = list(nx.connected_components(G.subgraph(core)))
+    if len(components) > 1:
+        # order of flareness_from_arrays, independent of set iteration order
+        position = arrays.position if arrays is not None else {node: i for i, node in enumerate(G)}
+        components.sort(key=lambda L: min(position[x] for x in L))
     for L in components:
         k_L = max(distances.get(x,np.inf) for x in L)
         k.append(k_L)
@@ -60,11 +118,194 @@ def compute_flareness(G, entity,
     return (k, components)
 
 
+def _constant_length(G, G_entity, weight, arrays=None):
+    """
+    Common length of edges within G_entity, if constant, otherwise None.
+
+    On a MapperGraph, lengths are read from its edge data column,
+    using positions of nodes in arrays (its GraphArrays).
+    """
+    if weight is unit_weight or weight is None:
+        return 1
+    if not isinstance(weight, str):
+        return None
+
+    if isinstance(G, MapperGraph):
+        if weight not in G.edge_data:
+            return 1
+        column = G.edge_data[weight]
+        if isinstance(column, tuple):
+            return None
+        in_entity = np.zeros(len(G.node_ids), dtype=bool)
+        in_entity[arrays.positions(G_entity)] = True
+        rows = in_entity[G.edges_[:,0]] & in_entity[G.edges_[:,1]]
+        values = column[rows]
+        if values.dtype != object:
+            values = np.unique(values)
+        # missing lengths default to 1, as in G.edges.data(weight, default=1)
+        lengths = set(1 if length is None else length for length in values.tolist())
+    else:
+        lengths = set(length for _, _, length in G.subgraph(G_entity).edges.data(weight, default=1))
+    if len(lengths) > 1:
+        return None
+    return lengths.pop() if len(lengths) == 1 else 1
+
+
+def _multi_source_bfs_length(G, G_entity, sources, length=1):
+    distances = dict.fromkeys(sources, 0)
+    frontier = list(sources)
+    step = 0
+    while len(frontier) > 0:
+        step += 1
+        reached = []
+        for x in frontier:
+            for y in G[x]:
+                if y in G_entity and y not in distances:
+                    distances[y] = step * length
+                    reached.append(y)
+        frontier = reached
+    return distances
+
+
+
+
+def flareness_from_arrays(indptr, indices, H, marker=None, stamp=0):
+    """
+    Compute flare signature of a set of nodes H, with unit edge weights, on CSR adjacency arrays.
+
+    Same as compute_flareness, using breadth-first search in place of Dijkstra's algorithm.
+
+    Parameters
+    ----------
+    indptr, indices : arrays
+        CSR adjacency of the Mapper graph. See mappertools.features.core.GraphArrays.
+
+    H : array of int
+        Sorted positions of nodes containing the entity. Must be nonempty.
+
+    marker : array of int, optional
+        Work array of length the number of nodes, reused between calls to avoid allocations.
+        Entries equal to stamp mark nodes of H.
+
+    stamp : int
+        Value different from all entries of marker before the call.
+
+    Returns
+    -------
+    (k, components) : tuple of lists
+        Flare signature, and components of the core (as arrays of positions),
+        ordered by their first node.
+    """
+    if marker is None:
+        marker = np.full(len(indptr) - 1, -1)
+        stamp = 0
+    marker[H] = stamp
+
+    # core-shell decomposition
+    owners, neighbors = mfc.gather_neighbors(indptr, indices, H)
+    inside = (marker[neighbors] == stamp)
+    is_shell = np.bincount(owners, weights=~inside, minlength=len(H)) > 0
+
+    # multi-source breadth first search from shell, within H
+    distances = np.full(len(H), np.inf)
+    distances[is_shell] = 0
+    frontier = H[is_shell]
+    step = 0
+    while len(frontier) > 0:
+        step += 1
+        _, reached = mfc.gather_neighbors(indptr, indices, frontier)
+        reached = np.searchsorted(H, reached[marker[reached] == stamp])
+        reached = np.unique(reached[np.isinf(distances[reached])])
+        distances[reached] = step
+        frontier = H[reached]
+
+    # connected components of core
+    is_core = ~is_shell
+    core_position = np.cumsum(is_core) - 1
+    local_neighbors = np.searchsorted(H, neighbors[inside])
+    local_owners = owners[inside]
+    keep = is_core[local_owners] & is_core[local_neighbors]
+    n_components, labels = _component_labels(int(np.sum(is_core)),
+                                             core_position[local_owners[keep]],
+                                             core_position[local_neighbors[keep]])
+
+    k_max = np.full(n_components, -np.inf)
+    np.maximum.at(k_max, labels, distances[is_core])
+
+    k = [int(x) if np.isfinite(x) else np.inf for x in k_max]
+    core = H[is_core]
+    components = [core[labels == c] for c in range(n_components)]
+    return k, components
+
+
+def _component_labels(n, u, v):
+    """
+    Connected components of graph on n vertices with symmetric edge lists u, v.
+
+    Labels are numbered in order of the smallest vertex of each component.
+    """
+    # propagate smallest vertex label along edges, with pointer jumping
+    labels = np.arange(n)
+    while True:
+        updated = labels.copy()
+        np.minimum.at(updated, u, labels[v])
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+
+    _, labels = np.unique(labels, return_inverse=True)
+    return (labels.max() + 1 if n > 0 else 0), labels
+
+
+# worker state, set once per process by _init_worker
+_worker = {}
+
+def _init_worker(indptr, indices):
+    _worker['indptr'] = indptr
+    _worker['indices'] = indices
+    _worker['marker'] = np.full(len(indptr) - 1, -1)
+
+
+def _signatures(indptr, indices, marker, tasks):
+    ans = []
+    for stamp, H in tasks:
+        if len(H) == 0:
+            ans.append(None)
+        else:
+            ans.append(flareness_from_arrays(indptr, indices, H, marker, stamp)[0])
+    return ans
+
+
+def _signatures_chunk(chunk):
+    return _signatures(_worker['indptr'], _worker['indices'], _worker['marker'], chunk)
+
+
+def _batch_signatures(arrays, node_sets, n_jobs, chunksize):
+    tasks = list(enumerate(node_sets))
+
+    if n_jobs == 1:
+        marker = np.full(len(arrays.indptr) - 1, -1)
+        return _signatures(arrays.indptr, arrays.indices, marker, tasks)
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    if chunksize is None:
+        chunksize = max(1, math.ceil(len(tasks) / (4 * n_jobs)))
+    chunks = [tasks[i:i+chunksize] for i in range(0, len(tasks), chunksize)]
+
+    ans = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_jobs,
+                                                initializer=_init_worker,
+                                                initargs=(arrays.indptr, arrays.indices)) as pool:
+        for chunk_signatures in pool.map(_signatures_chunk, chunks):
+            ans.extend(chunk_signatures)
+    return ans
 
 
-def compute_all_summary(G, entities, weight=(lambda v,u,e: 1),
+def compute_all_summary(G, entities, weight=unit_weight,
                         query_data='unique_members', verbose=0,
-                        keep_missing=False):
+                        keep_missing=False, n_jobs=1, chunksize=None):
     """
     Compute "flareness" of all entities in Mapper graph G
     using the proposed definition in
@@ -72,6 +313,11 @@ def compute_all_summary(G, entities, weight=(lambda v,u,e: 1),
 
     See mappertools.features.core.get_nodes_containing_entity for a discussion on entities.
 
+    With the default unit weights and verbose=0, the adjacency of G is converted once
+    to CSR arrays, and flare signatures are computed by breadth-first search
+    (see flareness_from_arrays), optionally spread over a pool of processes.
+    The output is the same as computing each entity with compute_flareness.
+
     Parameters
     ----------
     G : networkx graph
@@ -92,6 +338,12 @@ def compute_all_summary(G, entities, weight=(lambda v,u,e: 1),
     keep_missing : bool
         whether or not to include entities not found in G
 
+    n_jobs : int
+        Number of processes, for unit weights. -1 means use all processors.
+
+    chunksize : int, optional
+        Number of entities per task sent to a process.
+
     Returns
     -------
     ans : pandas.DataFrame
@@ -100,18 +352,34 @@ def compute_all_summary(G, entities, weight=(lambda v,u,e: 1),
         See the paper for definitions.
     """
 
-    ans = pandas.DataFrame(columns=['flare_type','flare_index','flare_sig'])
-    for entity in entities:
-        k, _ = compute_flareness(G, entity, weight, query_data, verbose)
+    index = mfc.EntityNodeIndex(G, query_data)
+    entities = list(dict.fromkeys(entities))
+
+    if weight is unit_weight and verbose == 0:
+        arrays = mfc.GraphArrays(G)
+        signatures = _batch_signatures(arrays, [arrays.positions(index[entity]) for entity in entities],
+                                       n_jobs, chunksize)
+    else:
+        arrays = mfc.GraphArrays(G)
+        signatures = [compute_flareness(G, entity, weight, query_data, verbose, index, arrays=arrays)[0]
+                      for entity in entities]
+
+    # object columns, with NaN for missing entities, as when built row by row with .loc
+    rows, row_index = [], []
+    for entity, k in zip(entities, signatures):
         if k is None:
             if keep_missing:
-                ans.loc[entity] = pandas.Series({'flare_type':-1, 'flare_index':None, 'flare_sig':None})
-            continue
+                rows.append((-1.0, np.nan, np.nan))
+                row_index.append(entity)
         else:
             k_type, k_index = flare_type_index(k)
-            ans.loc[entity] = pandas.Series({'flare_type':k_type, 'flare_index':k_index, 'flare_sig':k})
+            rows.append((k_type, k_index, k))
+            row_index.append(entity)
 
-    return ans
+    columns = ['flare_type','flare_index','flare_sig']
+    if len(rows) == 0:
+        return pandas.DataFrame(columns=columns)
+    return pandas.DataFrame(rows, index=row_index, columns=columns, dtype=object)
 
 
 def has_island(k):
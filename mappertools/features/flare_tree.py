@@ -5,10 +5,18 @@ import operator
 import itertools
 
 
-def flare_detect(G, centrality, prune_threshold=0, verbose=False):
+def flare_detect(G, centrality, prune_threshold=0, verbose=False, return_pairs=False):
     """
     Compute "flares" in G using the 0-persistent homology of centrality filtration.
 
+    Nodes are added in increasing order of centrality, and components are tracked
+    in a disjoint-set forest. When components merge, the one born first survives
+    (elder rule) and the others die.
+
+    Among components born at equal centrality, the elder is the one whose birth node
+    comes first in centrality (a dict keeps insertion order), so results are deterministic.
+    Earlier versions picked one of them in arbitrary order.
+
     Parameters
     ----------
     G : networkx graph
@@ -21,43 +29,104 @@ def flare_detect(G, centrality, prune_threshold=0, verbose=False):
         are combined with parent trees.
 
     verbose : bool
+
+    return_pairs : bool
+        If True, also return the persistence pairs of flares.
+
+    Returns
+    -------
+    flares : list of Flare
+        Sorted by decreasing lifespan (ties in order of birth).
+
+    pairs : array [n_flares, 2]
+        (birth, death) centralities of flares, in the same order. Only if return_pairs.
     """
 
-    if isinstance(centrality, str): centrality = G.nodes.data(centrality)
+    if isinstance(centrality, str): centrality = dict(G.nodes.data(centrality))
+
+    order = sorted(centrality.items(), key=operator.itemgetter(1))
+    position = {node: i for i, (node, _) in enumerate(order)}
+
+    # disjoint-set forest over positions, with union by size,
+    # and the flare of each component (at its root)
+    parent = list(range(len(order)))
+    size = [1] * len(order)
+    component_flare = [None] * len(order)
 
-    flare_trees = set([])
-    for node, cur_cen in sorted(centrality.items(), key=operator.itemgetter(1)):
-        neighbors = [nbr for nbr in G[node] if centrality[nbr] <= cur_cen]
+    def find(i):
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        while parent[i] != root:
+            parent[i], i = root, parent[i]
+        return root
+
+    flares = []
+    birth_positions = []
+    children = []
+    alive = []
+
+    for i, (node, cur_cen) in enumerate(order):
+        neighbors = [position[nbr] for nbr in G[node] if position[nbr] < i]
 
         if verbose:
             print("node: {}, centrality: {}, neighbors: {}".format(node,
                                                                    cur_cen,
-                                                                   neighbors))
-
-        death_candidates = [tree for tree in flare_trees if tree.intersects(neighbors)]
-        if len(death_candidates) == 0:
-            # print("birth")
-            new_tree = FlareTree(flare=Flare(node, cur_cen))
-            flare_trees.add(new_tree)
-        else:
-            elder_tree = min(death_candidates, key=(lambda tree: tree.flare.birth[0]))
-            for tree in death_candidates:
-                if tree != elder_tree:
-                    flare_trees.remove(tree)
-                    tree.flare.death = (cur_cen, node)
-                    elder_tree.add_subtree(tree)
-                    if tree.flare.lifespan() < prune_threshold:
-                        elder_tree.collapse_subtree(tree)
-
-            elder_tree.flare.nodes.add(node)
-
-        # for tree in flare_trees:
-        #     tree.print_all()
-        # print()
-    ans = sort_flares(unpack_flares(flare_trees))
+                                                                   [order[j][0] for j in neighbors]))
+
+        roots = sorted(set(find(j) for j in neighbors))
+        if len(roots) == 0:
+            component_flare[i] = len(flares)
+            flares.append(Flare(node, cur_cen))
+            birth_positions.append(i)
+            children.append([])
+            alive.append(True)
+            continue
+
+        candidates = [component_flare[root] for root in roots]
+        elder = min(candidates, key=(lambda f: (flares[f].birth[0], birth_positions[f])))
+        for f in candidates:
+            if f != elder:
+                flares[f].death = (cur_cen, node)
+                if flares[f].lifespan() < prune_threshold:
+                    _collapse(flares, children, alive, elder, f)
+                else:
+                    children[elder].append(f)
+
+        flares[elder].nodes.add(node)
+        largest = max(roots, key=(lambda root: size[root]))
+        for root in roots:
+            if root != largest:
+                parent[root] = largest
+                size[largest] += size[root]
+        parent[i] = largest
+        size[largest] += 1
+        component_flare[largest] = elder
+
+    kept = [f for f in range(len(flares)) if alive[f]]
+    kept.sort(key=(lambda f: (-flares[f].lifespan(), birth_positions[f])))
+    ans = [flares[f] for f in kept]
+
+    if return_pairs:
+        pairs = np.array([(flare.birth[0], flare.death[0]) for flare in ans], dtype=float).reshape(-1, 2)
+        return ans, pairs
     return ans
 
 
+def _collapse(flares, children, alive, elder, f):
+    # merge nodes of f and all its descendants into elder, and drop them
+    stack = [f]
+    while stack:
+        g = stack.pop()
+        alive[g] = False
+        stack.extend(children[g])
+        children[g] = []
+
+        nodes = flares[g].nodes
+        if len(nodes) > len(flares[elder].nodes):
+            nodes, flares[elder].nodes = flares[elder].nodes, nodes
+        flares[elder].nodes.update(nodes)
+
 
 class Flare(object):
     def __init__(self, node, birth):
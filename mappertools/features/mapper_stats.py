@@ -1,6 +1,11 @@
+import collections
+import hashlib
+
+import numpy as np
 import pandas
 
 import mappertools.features.core as mfc
+from mappertools.mapper.mapper_graph import MapperGraph
 
 
 
@@ -8,48 +13,222 @@ import mappertools.features.core as mfc
 # ****************************************************************************************************
 # statistics of entities in mapper graph:
 
-def compute_centrality_measures(nxgraph, unique_entities, centrality_functions, aggregation_functions,
-                                query_data='unique_members'):
+class FeatureCache(object):
+    """
+    Cache of node features (such as centralities) of graphs.
+
+    Features are stored as arrays over the nodes of a graph, keyed by a fingerprint
+    of the graph (nodes, edges and their data) and by the function computing them.
+    Features must not depend on anything but the graph.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximum number of features kept. The least recently used are dropped first.
+    """
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self._features = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._features)
+
+    def clear(self):
+        self._features.clear()
+
+    def get(self, G, function, fingerprint=None):
+        """
+        Feature of nodes of G, computed by function(G) on a cache miss.
+
+        Parameters
+        ----------
+        G : networkx graph
+
+        function : callable
+            Returns dict {node : value}, such as networkx.harmonic_centrality.
+
+        fingerprint : str, optional
+            Precomputed graph_fingerprint(G).
+
+        Returns
+        -------
+        (nodes, values) : tuple of list and array
+            values[i] is the feature of nodes[i].
+        """
+        if fingerprint is None:
+            fingerprint = graph_fingerprint(G)
+        key = (fingerprint, function)
+
+        if key in self._features:
+            self._features.move_to_end(key)
+            return self._features[key]
+
+        ans = _feature_values(G, function)
+        if self.maxsize > 0:
+            self._features[key] = ans
+            while len(self._features) > self.maxsize:
+                self._features.popitem(last=False)
+        return ans
+
+
+def _feature_values(G, function):
+    feature = function(G)
+    nodes = list(feature.keys())
+    # keep the type of values (such as int degrees), as in the output lists
+    return nodes, np.asarray(list(feature.values()))
+
+
+def graph_fingerprint(G):
+    """
+    Hash of the nodes and edges of G, with their data.
+
+    Array-like attribute values are hashed through their raw bytes, dtype and shape,
+    other values through their repr.
+    """
+    h = hashlib.sha1()
+    h.update(type(G).__name__.encode())
+    h.update(b"nodes")
+    for node, data in G.nodes(data=True):
+        _hash_item(h, node, data)
+    h.update(b"edges")
+    for u, v, data in G.edges(data=True):
+        _hash_item(h, (u, v), data)
+    return h.hexdigest()
+
+
+def _hash_item(h, key, data):
+    h.update(repr(key).encode())
+    for name, value in data.items():
+        h.update(repr(name).encode())
+        _hash_value(h, value)
+
+
+def _hash_value(h, value):
+    h.update(type(value).__name__.encode())
+    if isinstance(value, (list, tuple)) and len(value) > 0:
+        # only homogeneous lists of numbers convert to arrays without losing information
+        first = type(value[0])
+        if issubclass(first, (int, float, np.number)) and all(type(x) is first for x in value):
+            value = np.asarray(value)
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        h.update("{}{}".format(value.dtype.str, value.shape).encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, np.ndarray):
+        h.update(repr(value.tolist()).encode())
+    else:
+        h.update(repr(value).encode())
+
+
+# aggregations computed natively by pandas groupby
+_GROUPBY_AGGREGATIONS = {np.mean: 'mean', np.median: 'median', np.sum: 'sum',
+                         np.min: 'min', np.max: 'max',
+                         min: 'min', max: 'max', sum: 'sum', len: 'size'}
+
+
+def _entity_node_table(unique_entities, index):
+    """
+    Exploded table of (entity position, node), in the order of unique_entities and of nodes in index.
+    """
+    entity_nodes = [index[entity] for entity in unique_entities]
+    counts = np.fromiter((len(nodes) for nodes in entity_nodes), dtype=np.int64, count=len(entity_nodes))
+    return pandas.DataFrame({"entity": np.repeat(np.arange(len(entity_nodes)), counts),
+                             "node": [node for nodes in entity_nodes for node in nodes]})
 
-    centrality_names = [ cen_fun.__name__ for cen_fun in centrality_functions ]
-    centrality_dicts = [ cen_fun(nxgraph) for cen_fun in centrality_functions ]
 
-    columns = []
-    for cen_name in centrality_names:
-        columns.append(cen_name)
+def compute_centrality_measures(nxgraph, unique_entities, centrality_functions, aggregation_functions,
+                                query_data='unique_members', index=None, cache=None):
+    """
+    Centralities of nodes containing each entity, as-is and aggregated.
+
+    Parameters
+    ----------
+    nxgraph : networkx graph, or mappertools.mapper.mapper_graph.MapperGraph
+        A MapperGraph is converted with to_networkx, as networkx centrality functions
+        need a networkx graph.
+
+    unique_entities : list
+
+    centrality_functions : list of functions
+        Functions returning dict {node : centrality}, such as networkx.harmonic_centrality.
+
+    aggregation_functions : list of functions
+        Functions of a list of centralities, such as numpy.mean.
+        numpy.mean, numpy.median, numpy.sum, numpy.min, numpy.max, min, max, sum and len
+        are computed for all entities at once.
+
+    query_data : str
+        node attribute key containing 'unique members' (names of entities) of each node
+
+    index : EntityNodeIndex, optional
+        Precomputed index of nxgraph.
+
+    cache : FeatureCache, optional
+        Cache of centralities, so that they are computed once per graph and function
+        across calls. By default, centralities are computed afresh.
+
+    Returns
+    -------
+    ans : pandas.DataFrame
+        Indexed by entities. For each centrality function name,
+        a column of lists of centralities, and a column name_agg for each aggregation function agg.
+        Aggregates of entities contained in no node are NaN.
+    """
+    if isinstance(nxgraph, MapperGraph):
+        nxgraph = nxgraph.to_networkx()
+    if index is None:
+        index = mfc.EntityNodeIndex(nxgraph, query_data)
+    fingerprint = graph_fingerprint(nxgraph) if cache is not None else None
+
+    table = _entity_node_table(unique_entities, index)
+    counts = np.bincount(table["entity"].to_numpy(), minlength=len(unique_entities))
+    splits = np.cumsum(counts)[:-1]
+
+    ans = {}
+    for cen_fun in centrality_functions:
+        cen_name = cen_fun.__name__
+        if cache is None:
+            nodes, values = _feature_values(nxgraph, cen_fun)
+        else:
+            nodes, values = cache.get(nxgraph, cen_fun, fingerprint)
+        position = {node: i for i, node in enumerate(nodes)}
+        positions = np.fromiter((position[node] for node in table["node"]), dtype=np.int64, count=len(table))
+
+        entity_centralities = values[positions]
+        ans[cen_name] = [x.tolist() for x in np.split(entity_centralities, splits)]
+
+        grouped = pandas.Series(entity_centralities).groupby(table["entity"].to_numpy(), sort=True)
         for agg_fun in aggregation_functions:
-            columns.append(cen_name + "_" + agg_fun.__name__)
-
-    ans = pandas.DataFrame(index=unique_entities, columns=columns)
-
-    for entity in unique_entities:
-        entity_nodes = list(mfc.get_nodes_containing_entity(nxgraph, entity, query_data))
-
-        for cen_name, cen_dict in zip(centrality_names, centrality_dicts):
-            entity_centralities = [cen_dict[node] for node in entity_nodes]
+            key = cen_name + "_" + agg_fun.__name__
+            if agg_fun in _GROUPBY_AGGREGATIONS:
+                aggregated = grouped.agg(_GROUPBY_AGGREGATIONS[agg_fun])
+            else:
+                aggregated = grouped.agg(lambda x: agg_fun(x.tolist()))
+            # object columns, with NaN for entities in no node, as when built entity by entity
+            column = np.full(len(unique_entities), np.nan, dtype=object)
+            column[aggregated.index.to_numpy()] = aggregated.tolist()
+            ans[key] = column
 
-            # as-is output
-            ans.loc[entity, cen_name] = entity_centralities
-
-            if len(entity_centralities) == 0:
-                continue
-
-            for agg_fun in aggregation_functions:
-                key = cen_name + "_" + agg_fun.__name__
-                ans.loc[entity, key] = agg_fun(entity_centralities)
-
-    return ans
+    columns = []
+    for cen_fun in centrality_functions:
+        columns.append(cen_fun.__name__)
+        for agg_fun in aggregation_functions:
+            columns.append(cen_fun.__name__ + "_" + agg_fun.__name__)
 
+    return pandas.DataFrame(ans, columns=columns, index=unique_entities)
 
-def compute_entity_membership(nxgraph, unique_entities, query_data='unique_members'):
-    ans = pandas.DataFrame(index=unique_entities, columns=["containing_nodes", "num_containing_nodes"])
 
-    for entity in unique_entities:
-        entity_nodes = list(mfc.get_nodes_containing_entity(nxgraph, entity, query_data))
+def compute_entity_membership(nxgraph, unique_entities, query_data='unique_members', index=None):
+    if index is None:
+        index = mfc.EntityNodeIndex(nxgraph, query_data)
 
-        ans.loc[entity, "containing_nodes"] = entity_nodes
-        ans.loc[entity, "num_containing_nodes"] = len(entity_nodes)
+    entity_nodes = [list(mfc.get_nodes_containing_entity(nxgraph, entity, query_data, index))
+                    for entity in unique_entities]
 
+    ans = pandas.DataFrame({"containing_nodes": entity_nodes,
+                            "num_containing_nodes": [len(nodes) for nodes in entity_nodes]},
+                           columns=["containing_nodes", "num_containing_nodes"], index=unique_entities,
+                           dtype=object)
     return ans
 
 
@@ -63,6 +242,6 @@ def compute_mapper_graph_summary(nxgraph):
     return
 
 
-def containing_node_distribution(nxgraph, unique_entities, query_data='unique_members'):
-    entity_membership = compute_entity_membership(nxgraph, unique_entities, query_data)
+def containing_node_distribution(nxgraph, unique_entities, query_data='unique_members', index=None):
+    entity_membership = compute_entity_membership(nxgraph, unique_entities, query_data, index)
     return entity_membership["num_containing_nodes"].value_counts(sort=False)
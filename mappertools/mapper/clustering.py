@@ -89,10 +89,15 @@ class _kType(sklearn.base.BaseEstimator, sklearn.base.ClusterMixin):
     Base class for wrappers around pyclustering.cluster
 
     Emulates classes in sklearn.cluster, for compatibility with kmapper.
+
+    If distance_cache (a mappertools.mapper.distances.DistanceCache) is given,
+    fit expects the indices (in the whole dataset) of the observations to cluster,
+    and distances are sliced from the cache instead of being computed.
     """
-    def __init__(self, metric, heuristic, k_max=None, prefix="", verbose=1):
+    def __init__(self, metric, heuristic, k_max=None, prefix="", verbose=1, distance_cache=None):
         self.metric = metric
         self.pcc_metric = _process_metric(metric)
+        self.distance_cache = distance_cache
 
         self.heuristic = heuristic
         self.verbose = verbose
@@ -109,6 +114,9 @@ class _kType(sklearn.base.BaseEstimator, sklearn.base.ClusterMixin):
             X = X.to_numpy()
         return X
 
+    def _distance_matrix(self, X):
+        return self.distance_cache.submatrix(self.distance_cache.validate_indices(X))
+
     def _fit_k(self, X, k):
         raise NotImplementedError
 
@@ -124,14 +132,16 @@ class kMedoids(_kType):
     Just a wrapper around pyclustering.cluster.kmedoids
     emulating sklearn.cluster classes, for compatibility with kmapper.
     """
-    def __init__(self, metric, heuristic, k_max=None, prefix="kMedoids", verbose=1):
-        super().__init__(metric, heuristic, k_max, prefix, verbose)
+    def __init__(self, metric, heuristic, k_max=None, prefix="kMedoids", verbose=1, distance_cache=None):
+        super().__init__(metric, heuristic, k_max, prefix, verbose, distance_cache)
 
     def _fit_k(self, X, k):
         X = self._validate_data(X)
+        if self.distance_cache is not None:
+            X = self._distance_matrix(X)
         initial_medoids = pci.random_center_initializer(X, k).initialize(return_index=True)
 
-        if self.metric == "precomputed":
+        if self.metric == "precomputed" or self.distance_cache is not None:
             ans = kmedoids.kmedoids(X, initial_medoids, data_type = "distance_matrix")
         else:
             ans = kmedoids.kmedoids(X, initial_medoids, metric=self.pcc_metric)
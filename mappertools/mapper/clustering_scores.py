@@ -1,3 +1,5 @@
+import numpy as np
+import scipy.spatial.distance
 import sklearn.metrics
 
 # def DaviesBouldinIndex(X, labels, metric):
@@ -30,3 +32,100 @@ def negative_silhouette(X, labels, metric):
     """
 
     return -sklearn.metrics.silhouette_score(X, labels, metric=metric)
+
+
+def silhouette_sweep(D, Z, k_max=np.inf):
+    """
+    Silhouette scores of all flat clusterings of a hierarchical clustering, in one pass.
+
+    Walks the linkage matrix Z merge by merge, keeping for every point the
+    sum of distances to each current cluster up to date. Merging two clusters
+    only adds two columns, so the silhouette of each flat clustering is read
+    off without recomputing pairwise distances or calling fcluster.
+
+    Only clusterings obtainable by thresholding at a merge distance
+    are reported, that is, those agreeing with
+    ``scipy.cluster.hierarchy.fcluster(Z, t, criterion='distance')``
+    for t in the merge distances. Assumes that Z is monotonic.
+
+    Parameters
+    ----------
+    D : ndarray
+        Either a condensed or redundant distance matrix.
+        (see scipy.spatial.distance)
+
+    Z : array
+        hierarchical clustering encoded as a linkage matrix,
+        computed from the same distances as D.
+
+    k_max : int, optional
+        Maximum number of clusters to report.
+
+    Yields
+    ------
+    (k, threshold, score) : tuple
+        Number of clusters, merge distance at which the clustering is obtained,
+        and its silhouette score, for 2 <= k <= min(k_max, n_samples-1),
+        in decreasing order of k.
+    """
+    n = Z.shape[0] + 1
+    merge_distances = Z[:,2]
+    points = np.arange(n)
+
+    # column c of sums holds, for each point, the sum of its distances to cluster c.
+    # a merged cluster reuses the column of one of its parts.
+    if len(D.shape) == 1:
+        sums = scipy.spatial.distance.squareform(D).astype(float, copy=False)
+    else:
+        sums = np.array(D, dtype=float)
+    sizes = np.ones(n)
+    active = np.ones(n, dtype=bool)
+    assignment = np.arange(n)
+    column_of = np.empty(2*n - 1, dtype=int)
+    column_of[:n] = points
+
+    # nearest other cluster (by mean distance) of each point, tracked once k <= k_max
+    nearest, inter = None, None
+
+    for j in range(n-1):
+        a, b = column_of[int(Z[j,0])], column_of[int(Z[j,1])]
+        sums[:,a] += sums[:,b]
+        sizes[a] += sizes[b]
+        active[b] = False
+        assignment[assignment == b] = a
+        column_of[n+j] = a
+
+        k = n - 1 - j
+        if k > k_max or k < 2:
+            continue
+
+        # merging can only change the nearest other cluster of points
+        # whose nearest other cluster was one of the merged ones.
+        if nearest is None:
+            stale = points
+            nearest, inter = np.empty(n, dtype=int), np.empty(n)
+        else:
+            stale = np.flatnonzero((nearest == a) | (nearest == b))
+        if len(stale) > 0:
+            nearest[stale], inter[stale] = _nearest_other_cluster(stale, sums, sizes, active, assignment)
+
+        if j+1 < n-1 and merge_distances[j+1] == merge_distances[j]:
+            # not a threshold cut: the next merge happens at the same distance
+            continue
+
+        own_size = sizes[assignment]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            intra = sums[points, assignment] / (own_size - 1)
+            samples = (inter - intra) / np.maximum(intra, inter)
+        samples[own_size == 1] = 0
+
+        yield k, merge_distances[j], np.mean(np.nan_to_num(samples))
+
+
+def _nearest_other_cluster(rows, sums, sizes, active, assignment):
+    columns = np.flatnonzero(active)
+    means = sums[np.ix_(rows, columns)] / sizes[columns]
+    means[np.arange(len(rows)), np.searchsorted(columns, assignment[rows])] = np.inf
+
+    best = np.argmin(means, axis=1)
+    return columns[best], means[np.arange(len(rows)), best]
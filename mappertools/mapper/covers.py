@@ -1,6 +1,8 @@
 import numpy as np
 import itertools
 
+from mappertools.mapper.quantile_sketch import QuantileSketch
+
 
 def uniform_cover_fences(x_min, x_max, n, p):
     length = (x_max - x_min) / (n - p * (n-1))
@@ -15,17 +17,141 @@ def uniform_cover_fences(x_min, x_max, n, p):
     return (lb,ub)
 
 
+def _ranks_within_groups(counts):
+    # for consecutive groups of given sizes, position of each entry within its group
+    starts = np.cumsum(counts) - counts
+    return np.arange(np.sum(counts)) - np.repeat(starts, counts)
+
+
+def interval_memberships(x, lb, ub):
+    """
+    Find the intervals [lb[r], ub[r]] containing each value in x.
+
+    If lb and ub are both non-decreasing, the intervals containing a value are consecutive,
+    and they are found by binary search. Otherwise, all intervals are checked.
+
+    Parameters
+    ----------
+    x : array [n]
+
+    lb, ub : array [resolution]
+        lower and upper bounds of the intervals.
+
+    Returns
+    -------
+    (points, intervals, counts) : tuple of arrays
+        points[i] is contained in the interval intervals[i], sorted by points.
+        counts[j] is the number of intervals containing x[j].
+    """
+    if np.all(np.diff(lb) >= 0) and np.all(np.diff(ub) >= 0):
+        first = np.searchsorted(ub, x, side='left')
+        last = np.searchsorted(lb, x, side='right') - 1
+        counts = np.maximum(last - first + 1, 0)
+
+        points = np.repeat(np.arange(len(x)), counts)
+        intervals = np.repeat(first, counts) + _ranks_within_groups(counts)
+    else:
+        member = np.logical_and(lb <= x[:,np.newaxis], x[:,np.newaxis] <= ub)
+        counts = np.sum(member, axis=1)
+        points, intervals = np.nonzero(member)
+
+    return points, intervals, counts
+
+
+def _numbers_fit(resolution, data_dim):
+    # Python ints, as numpy integers would wrap around before the comparison
+    return int(resolution) ** int(data_dim) - 1 <= np.iinfo(np.int64).max
+
+
+def cube_memberships(values, lower_bounds, upper_bounds):
+    """
+    Find the hypercubes containing each point.
+
+    Hypercubes are products of intervals, one from each dimension,
+    and are numbered in the order of itertools.product(range(resolution), repeat=d).
+    If resolution^d numbers do not fit in int64, hypercubes are given as
+    their tuples of interval indices instead.
+    Only pairs (point, hypercube) with point in hypercube are generated, so
+    the work done is proportional to the number of such pairs,
+    and not to the number of hypercubes.
+
+    Parameters
+    ----------
+    values : array [n, d]
+
+    lower_bounds, upper_bounds : array [resolution, d]
+        lower and upper bounds of the intervals in each dimension.
+
+    Returns
+    -------
+    (points, cubes) : tuple of arrays
+        points[i] is contained in the hypercube cubes[i], sorted by points.
+        cubes is an array [n_pairs], or [n_pairs, d] of interval indices if numbers would overflow.
+    """
+    n, data_dim = values.shape
+    resolution = lower_bounds.shape[0]
+    as_tuples = not _numbers_fit(resolution, data_dim)
+
+    points = np.arange(n)
+    cubes = np.zeros((n, 0) if as_tuples else n, dtype=np.int64)
+    for dim in range(data_dim):
+        _, dim_intervals, dim_counts = interval_memberships(values[:,dim],
+                                                           lower_bounds[:,dim],
+                                                           upper_bounds[:,dim])
+        dim_starts = np.cumsum(dim_counts) - dim_counts
+
+        repeats = dim_counts[points]
+        offsets = _ranks_within_groups(repeats)
+        intervals = dim_intervals[np.repeat(dim_starts[points], repeats) + offsets]
+
+        points = np.repeat(points, repeats)
+        if as_tuples:
+            cubes = np.column_stack((np.repeat(cubes, repeats, axis=0), intervals))
+        else:
+            cubes = np.repeat(cubes, repeats) * resolution + intervals
+
+    return points, cubes
+
+
+def _iter_chunks(chunks, chunk_size):
+    if isinstance(chunks, np.ndarray):
+        for start in range(0, chunks.shape[0], chunk_size):
+            yield np.asarray(chunks[start:start+chunk_size])
+    else:
+        for chunk in chunks:
+            yield np.asarray(chunk)
+
+
 class EPCover(object):
     """
     Equalized Projection Cover
 
     Intended for use with kmapper, and so the API follows that of kmapper.cover.Cover
+
+    Parameters
+    ----------
+    resolution : int
+        Number of intervals in each dimension.
+
+    gain : float in [0,1)
+        Proportion of overlap between consecutive intervals.
+
+    verbose : int
+
+    lazy : bool
+        If True, only rectangles containing data are enumerated:
+        fit returns a generator of their centers, and transform returns
+        the list of their patches, in the same order.
+        Use for high-dimensional lenses, where most of the resolution^d rectangles are empty.
+        When resolution^d exceeds the int64 range, rectangles are identified
+        by their tuples of interval indices instead of numbers.
     """
 
-    def __init__(self, resolution, gain, verbose=0):
+    def __init__(self, resolution, gain, verbose=0, lazy=False):
         self.resolution = resolution
         self.gain = gain
         self.verbose = verbose
+        self.lazy = lazy
 
         # FOR MAPPER COMPATIBILITY
         self.n_cubes = resolution
@@ -46,19 +172,22 @@ class EPCover(object):
 
         Returns
         -------
-        centers: list
+        centers: list, or generator if lazy
             List of centers of the rectangles
         """
 
         lb, ub = uniform_cover_fences(0,100,self.resolution,self.gain)
 
-        self.lower_bounds = np.vstack(tuple(np.percentile(data[:,1:], perc, axis=0, keepdims=True,method='nearest') for perc in lb))
-
-        self.upper_bounds = np.vstack(tuple(np.percentile(data[:,1:], perc, axis=0, keepdims=True,method='nearest') for perc in ub))
+        # all fences in one call, so that each lens column is partitioned only once
+        fences = np.percentile(data[:,1:], np.concatenate((lb, ub)), axis=0, method='nearest')
+        self.lower_bounds, self.upper_bounds = fences[:self.resolution], fences[self.resolution:]
 
         return self._compute_centers(data)
 
     def _compute_centers(self,data):
+        if self.lazy:
+            return (self.center(cube) for cube in self.occupied_cubes(data))
+
         data_dim = data.shape[1] - 1
         ans = []
         for rect in itertools.product(range(self.resolution), repeat=data_dim):
@@ -68,6 +197,96 @@ class EPCover(object):
         return ans
 
 
+    def center(self, cube):
+        """ Center of a rectangle.
+
+        Parameters
+        ----------
+        cube: int or tuple
+            Rectangle, either as its number in the order of transform
+            or as its tuple of interval indices.
+        """
+        data_dim = self.lower_bounds.shape[1]
+        cube = self._cube_tuple(cube)
+
+        rect = tuple(cube)
+        rect_lb = self.lower_bounds[rect, range(data_dim)]
+        rect_ub = self.upper_bounds[rect, range(data_dim)]
+        return 0.5 * (rect_lb + rect_ub)
+
+    def _cube_tuple(self, cube):
+        # tuple of interval indices of a rectangle, given by number or tuple
+        data_dim = self.lower_bounds.shape[1]
+        if np.isscalar(cube):
+            return tuple(int(i) for i in np.unravel_index(cube, (self.resolution,) * data_dim))
+        return tuple(int(i) for i in cube)
+
+    def occupied_cubes(self, data):
+        """ Numbers of the rectangles containing data, in increasing order
+        (or their tuples of interval indices, in lexicographic order, if numbers would overflow).
+        """
+        _, cubes = cube_memberships(data[:,1:], self.lower_bounds, self.upper_bounds)
+        if cubes.ndim == 2:
+            return [tuple(cube) for cube in np.unique(cubes, axis=0).tolist()]
+        return np.unique(cubes)
+
+    def iter_transform(self, data):
+        """ Generate the memberships of the rectangles containing data.
+
+        Parameters
+        ----------
+        data: numpy array-like
+            Assumed to be of size m x (d+1), where m is the number of observations,
+            and d is the dimension of each observation.
+
+            Warning: column 0 must be an index column.
+
+        Yields
+        ------
+        (cube, members) : tuple
+            Number of a nonempty rectangle (or its tuple of interval indices, see cube_memberships),
+            and the row positions in data of its members, in increasing order of cube.
+        """
+
+        points, cubes = cube_memberships(data[:,1:], self.lower_bounds, self.upper_bounds)
+
+        if cubes.ndim == 2:
+            # lexicographic order of tuples, first column as primary key
+            order = np.lexsort(cubes.T[::-1]) if cubes.shape[1] > 0 else np.arange(len(cubes))
+            changes = np.any(np.diff(cubes[order], axis=0) != 0, axis=1)
+        else:
+            order = np.argsort(cubes, kind='stable')
+            changes = np.diff(cubes[order]) != 0
+        points, cubes = points[order], cubes[order]
+        boundaries = np.flatnonzero(changes) + 1
+        starts = np.concatenate(([0], boundaries))
+        stops = np.concatenate((boundaries, [len(cubes)]))
+
+        for start, stop in zip(starts, stops):
+            if start < stop:
+                cube = tuple(cubes[start].tolist()) if cubes.ndim == 2 else int(cubes[start])
+                yield cube, points[start:stop]
+
+    def transform_indices(self, data):
+        """ Assign the data to the rectangles of the fitted cover.
+
+        Parameters
+        ----------
+        data: numpy array-like
+            Assumed to be of size m x (d+1), where m is the number of observations,
+            and d is the dimension of each observation.
+
+            Warning: column 0 must be an index column.
+
+        Returns
+        -------
+        memberships: dict {cube : array}
+            For each nonempty rectangle, the row positions in data of its members.
+            Rectangles are numbered as in the list returned by transform.
+        """
+
+        return dict(self.iter_transform(data))
+
     def transform(self, data):
         """ Fit the equalized projection cover on the data.
 
@@ -83,19 +302,24 @@ class EPCover(object):
         -------
         patches: list
             List of data contained in the rectangles.
+            If lazy, only nonempty rectangles are included.
         """
 
+        if self.lazy:
+            patches = []
+            for cube, members in self.iter_transform(data):
+                patches.append(data[members,:])
+                if self.verbose:
+                    print("{} members in cube {}".format(len(members), str(self._cube_tuple(cube))))
+            return patches
 
         data_dim = data.shape[1] - 1
-        patches = []
-        for rect in itertools.product(range(self.resolution), repeat=data_dim):
-            rect_lb = self.lower_bounds[rect, range(data_dim)]
-            rect_ub = self.upper_bounds[rect, range(data_dim)]
+        memberships = self.transform_indices(data)
+        no_members = np.array([], dtype=int)
 
-            logical = np.logical_and(rect_lb <= data[:,1:], data[:,1:] <= rect_ub)
-            member_bool = np.all(logical, axis=1, keepdims=False)
-
-            members = data[member_bool,:]
+        patches = []
+        for cube, rect in enumerate(itertools.product(range(self.resolution), repeat=data_dim)):
+            members = data[memberships.get(cube, no_members),:]
             patches.append(members)
 
             if self.verbose:
@@ -109,11 +333,77 @@ class EPCover(object):
         return self.transform(data)
 
 
+    def fit_streaming(self, chunks, sketch_size=256, chunk_size=100000):
+        """ Fit the equalized projection cover on data given in chunks.
+
+        For data that does not fit in memory. Fences are percentiles estimated by
+        one QuantileSketch per dimension, instead of exact ones as in fit.
+        Their ranks are off by at most rank_error_ (as a fraction of the number of observations),
+        which is at most (1 + log2(m/sketch_size)) / sketch_size for m observations.
+
+        Parameters
+        ----------
+        chunks: iterable of numpy arrays, or numpy array-like
+            Each chunk assumed to be of size m_i x (d+1), where m_i is the number of observations in the chunk,
+            and d is the dimension of each observation. A single array (for example a numpy.memmap)
+            is read in chunks of chunk_size rows.
+
+            Warning: column 0 must be an index column.
+
+        sketch_size: int
+            Capacity of each level of the quantile sketches.
+
+        chunk_size: int
+            Number of rows per chunk, if chunks is a single array.
+
+        Returns
+        -------
+        self
+        """
+
+        sketches = None
+        for chunk in _iter_chunks(chunks, chunk_size):
+            if sketches is None:
+                sketches = [QuantileSketch(sketch_size) for _ in range(chunk.shape[1] - 1)]
+            for dim, sketch in enumerate(sketches):
+                sketch.update(chunk[:,dim+1])
+
+        if sketches is None or all(sketch.n == 0 for sketch in sketches):
+            raise ValueError("fit_streaming needs at least one observation")
+
+        lb, ub = uniform_cover_fences(0,100,self.resolution,self.gain)
+        fences = np.column_stack([sketch.percentile(np.concatenate((lb, ub))) for sketch in sketches])
+        self.lower_bounds, self.upper_bounds = fences[:self.resolution], fences[self.resolution:]
+
+        self.rank_error_ = max(sketch.rank_error() / max(sketch.n, 1) for sketch in sketches)
+        return self
+
+    def transform_chunks(self, chunks, chunk_size=100000):
+        """ Assign data given in chunks to the rectangles of the fitted cover.
+
+        Parameters
+        ----------
+        chunks: iterable of numpy arrays, or numpy array-like
+            As in fit_streaming.
+
+        chunk_size: int
+            Number of rows per chunk, if chunks is a single array.
+
+        Yields
+        ------
+        memberships: dict {cube : array}
+            For each chunk, and each rectangle containing data from the chunk,
+            the indices (from column 0) of its members in the chunk.
+        """
+        for chunk in _iter_chunks(chunks, chunk_size):
+            ids = chunk[:,0].astype(int)
+            yield {cube: ids[members] for cube, members in self.iter_transform(chunk)}
+
     def fit_sakmapper(self, data):
         data_mins = np.min(data[:,1:], axis=0, keepdims=True)
         data_maxs = np.max(data[:,1:], axis=0, keepdims=True)
 
-        inner_fences = np.vstack(tuple(np.percentile(data[:,1:], i * 100.0/self.resolution, axis=0, keepdims=True) for i in range(1,self.resolution)))
+        inner_fences = np.percentile(data[:,1:], [i * 100.0/self.resolution for i in range(1,self.resolution)], axis=0)
         self.lower_bounds = np.concatenate((data_mins, inner_fences), axis=0)
         self.upper_bounds = np.concatenate((inner_fences, data_maxs), axis=0)
 
@@ -0,0 +1,131 @@
+import os
+import copy
+import math
+import concurrent.futures
+import multiprocessing.shared_memory
+import multiprocessing.util
+
+import numpy as np
+
+
+def _normalize_cubes(cubes):
+    """
+    Convert cover output to a list of (cube, member indices).
+
+    Parameters
+    ----------
+    cubes : dict {cube : array} or list of arrays
+        Either a dict of member indices, as returned by EPCover.transform_indices,
+        or a list of patches, as returned by EPCover.transform, with an index column 0.
+    """
+    if isinstance(cubes, dict):
+        return [(cube, np.asarray(members, dtype=int)) for cube, members in cubes.items()]
+    return [(cube, np.asarray(patch[:,0], dtype=int)) for cube, patch in enumerate(cubes)]
+
+
+def _fit_one(clusterer, X, members):
+    fitted = copy.copy(clusterer)
+    fitted.fit(X[members])
+    return np.asarray(fitted.labels_)
+
+
+# worker state, set once per process by _init_worker
+_worker = {}
+
+def _init_worker(shm_name, shape, dtype, clusterer):
+    shm = multiprocessing.shared_memory.SharedMemory(name=shm_name)
+    _worker['shm'] = shm
+    _worker['X'] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _worker['clusterer'] = clusterer
+    # pool workers leave through os._exit, which skips atexit; Finalize hooks still run
+    multiprocessing.util.Finalize(None, _close_worker, exitpriority=10)
+
+
+def _close_worker():
+    # drop the view on the buffer first, or close() raises BufferError
+    _worker.pop('X', None)
+    _worker.pop('clusterer', None)
+    shm = _worker.pop('shm', None)
+    if shm is not None:
+        shm.close()
+
+
+def _fit_chunk(chunk):
+    X, clusterer = _worker['X'], _worker['clusterer']
+    return [(cube, _fit_one(clusterer, X, members)) for cube, members in chunk]
+
+
+def fit_cubes(X, cubes, clusterer, n_jobs=1, chunksize=None, min_samples=None):
+    """
+    Cluster the data in each cube of a cover, in parallel.
+
+    Cubes are distributed in chunks over a pool of processes, which read X from shared memory.
+    Each cube is fitted by a shallow copy of clusterer, so results are the same as
+    fitting the cubes one at a time, whenever clusterer itself is deterministic.
+
+    Parameters
+    ----------
+    X : array [n_samples, n_features]
+        Data to cluster. With a clusterer using a distance_cache, indices of samples.
+
+    cubes : dict {cube : array} or list of arrays
+        Either a dict of member indices, as returned by EPCover.transform_indices,
+        or a list of patches, as returned by EPCover.transform, with an index column 0.
+
+    clusterer :
+        Prototype clusterer with a fit method setting labels_, for example
+        mappertools.mapper.hierarchical_clustering.HeuristicHierarchical.
+
+    n_jobs : int
+        Number of processes. -1 means use all processors. 1 means no pool is created.
+
+    chunksize : int, optional
+        Number of cubes per task sent to a process.
+        Defaults to splitting cubes in about 4 tasks per process.
+
+    min_samples : int, optional
+        Cubes with at most this many members are fitted inline in the calling process.
+        Defaults to the min_samples parameter of clusterer, if any, otherwise 1.
+
+    Returns
+    -------
+    labels : dict {cube : array}
+        Cluster labels of members of each nonempty cube, in the order of cubes.
+    """
+    if hasattr(X, "to_numpy") and callable(X.to_numpy):
+        X = X.to_numpy()
+    X = np.ascontiguousarray(X)
+
+    cubes = [(cube, members) for cube, members in _normalize_cubes(cubes) if len(members) > 0]
+
+    if min_samples is None:
+        min_samples = getattr(clusterer, 'min_samples', 1)
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+
+    results = {}
+    large = []
+    for cube, members in cubes:
+        if n_jobs == 1 or len(members) <= min_samples:
+            results[cube] = _fit_one(clusterer, X, members)
+        else:
+            large.append((cube, members))
+
+    if len(large) > 0:
+        if chunksize is None:
+            chunksize = max(1, math.ceil(len(large) / (4 * n_jobs)))
+        chunks = [large[i:i+chunksize] for i in range(0, len(large), chunksize)]
+
+        shm = multiprocessing.shared_memory.SharedMemory(create=True, size=max(X.nbytes, 1))
+        try:
+            np.ndarray(X.shape, dtype=X.dtype, buffer=shm.buf)[...] = X
+            with concurrent.futures.ProcessPoolExecutor(max_workers=n_jobs,
+                                                        initializer=_init_worker,
+                                                        initargs=(shm.name, X.shape, X.dtype, clusterer)) as pool:
+                for chunk_results in pool.map(_fit_chunk, chunks):
+                    results.update(chunk_results)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    return {cube: results[cube] for cube, _ in cubes}
@@ -1,6 +1,7 @@
 import pandas
 import numpy as np
 import sklearn.preprocessing
+import scipy.spatial.distance
 
 
 def bloom_mahalanobis_closeness(X):
@@ -82,3 +83,152 @@ def flipped_bloom_mahalanobis_dissimilarity(X):
         ans = pandas.DataFrame(ans, index = X.index, columns = X.index)
 
     return ans
+
+
+class DistanceCache(object):
+    """
+    Pairwise distances over a whole dataset, computed once.
+
+    In a Mapper run with overlapping cubes, each observation falls in several cubes.
+    Instead of recomputing distances for every cube, clusterers given a
+    DistanceCache receive the indices of cube members and slice the
+    corresponding distances from the cache.
+
+    Distances are stored as a condensed distance vector (see scipy.spatial.distance),
+    optionally in a memory-mapped .npy file.
+
+    Parameters
+    ----------
+    X : array [n_samples, n_features]
+        data as a feature array.
+
+    metric : str or function, optional
+        The distance metric to use.
+        (See scipy.spatial.distance.pdist)
+
+    filename : str or pathlib.Path, optional
+        If given, distances are written to this .npy file block by block,
+        and accessed through a memory map.
+
+    block_size : int, optional
+        Number of rows of distances computed at a time when writing to filename.
+    """
+
+    def __init__(self, X, metric='euclidean', filename=None, block_size=1024):
+        if hasattr(X, "to_numpy") and callable(X.to_numpy):
+            X = X.to_numpy()
+
+        self.metric = metric
+        self.n_samples = X.shape[0]
+
+        if filename is None:
+            self.dists = scipy.spatial.distance.pdist(X, metric=metric)
+            return
+
+        n = self.n_samples
+        self.dists = np.lib.format.open_memmap(filename, mode='w+', dtype=float,
+                                               shape=(n * (n-1) // 2,))
+        for start in range(0, n, block_size):
+            stop = min(start + block_size, n)
+            block = scipy.spatial.distance.cdist(X[start:stop], X[start:], metric=metric)
+            # rows start..stop-1 of the condensed vector are contiguous,
+            # and are the strict upper triangle of the block in row-major order
+            rows, cols = np.triu_indices(stop - start, k=1, m=n - start)
+            self.dists[self._offset(start):self._offset(stop)] = block[rows, cols]
+        self.dists.flush()
+
+    @classmethod
+    def load(cls, filename, mmap_mode='r'):
+        """
+        Open distances previously written to filename by DistanceCache.
+
+        Parameters
+        ----------
+        filename : str or pathlib.Path
+
+        mmap_mode : {None, 'r+', 'r', 'w+', 'c'}
+            See numpy.load.
+        """
+        ans = cls.__new__(cls)
+        ans.metric = None
+        ans.dists = np.load(filename, mmap_mode=mmap_mode)
+
+        # solve m = n(n-1)/2 for n
+        m = ans.dists.shape[0]
+        ans.n_samples = int(round((1 + np.sqrt(1 + 8*m)) / 2))
+        return ans
+
+    @staticmethod
+    def validate_indices(X):
+        """
+        Indices of observations given to a clusterer using a DistanceCache.
+
+        Parameters
+        ----------
+        X : array [n_samples] or [n_samples, 1], or pandas object
+
+        Returns
+        -------
+        indices : array [n_samples] of int
+        """
+        if hasattr(X, "to_numpy") and callable(X.to_numpy):
+            X = X.to_numpy()
+        X = np.asarray(X)
+        if len(X.shape) == 2 and X.shape[1] == 1:
+            X = X[:,0]
+        if len(X.shape) != 1:
+            raise ValueError("Expected a vector of indices when using distance_cache, got array of shape {}".format(X.shape))
+        return X.astype(int)
+
+    def _offset(self, i):
+        # position in the condensed vector of the first distance d(i, j), j > i
+        n = self.n_samples
+        return n*i - i*(i+1)//2
+
+    def condensed(self, indices):
+        """
+        Condensed distance vector between given observations.
+
+        Parameters
+        ----------
+        indices : array of int
+            Indices of observations, in the original dataset.
+
+        Returns
+        -------
+        dists : array
+            Condensed distance vector, ordered as indices.
+        """
+        indices = np.asarray(indices, dtype=int)
+        k = len(indices)
+        ans = np.empty(k*(k-1)//2, dtype=float)
+
+        # one row of the condensed matrix at a time, so temporaries stay of length k
+        start = 0
+        for r in range(k - 1):
+            i = np.minimum(indices[r], indices[r+1:])
+            j = np.maximum(indices[r], indices[r+1:])
+            same = (i == j)
+            positions = self._offset(i) + (j - i - 1)
+            positions[same] = 0
+
+            row = ans[start:start + len(positions)]
+            row[...] = self.dists[positions]
+            row[same] = 0
+            start += len(positions)
+        return ans
+
+    def submatrix(self, indices):
+        """
+        Square matrix of distances between given observations.
+
+        Parameters
+        ----------
+        indices : array of int
+            Indices of observations, in the original dataset.
+
+        Returns
+        -------
+        dists : array [len(indices), len(indices)]
+        """
+        return scipy.spatial.distance.squareform(self.condensed(indices))
@@ -3,19 +3,48 @@ import numpy as np
 
 import sklearn.base
 import sklearn.decomposition
+import sklearn.metrics
 # import sklearn.cluster
 
 import scipy.cluster.hierarchy
 import scipy.spatial.distance
 
-from mappertools.mapper.clustering_scores import negative_silhouette
+from mappertools.mapper.clustering_scores import negative_silhouette, silhouette_sweep
+from mappertools.mapper.linkage_cut import cut_linkage, number_of_clusters
+from mappertools.mapper.mst_linkage import MST_METRICS, mst_single_linkage
 
-def cluster_number_to_threshold(k, merge_distances):
-    # check merge distances is non decreasing:
-    assert np.all(np.diff(merge_distances) >= 0)
+def cluster_number_to_threshold(k, merge_distances, check=True):
+    """
+    Threshold of merge distances giving k clusters.
+
+    Parameters
+    ----------
+    k : int or array of int
+
+    merge_distances : array
+        Non decreasing merge distances, Z[:,2] of a monotonic linkage matrix Z.
+
+    check : bool
+        Whether to check that merge_distances is non decreasing.
+        Callers that already know it can skip the check.
+
+    Returns
+    -------
+    threshold : float, or array of floats if k is an array
+    """
+    merge_distances = np.asarray(merge_distances)
+    if check:
+        assert np.all(merge_distances[1:] >= merge_distances[:-1])
 
     # threshold is kth entry counting from the last.
-    return (merge_distances[-k] if k <= len(merge_distances) else -np.inf)
+    if np.ndim(k) == 0:
+        return (merge_distances[-k] if k <= len(merge_distances) else -np.inf)
+
+    # -np.inf for k > len(merge_distances), in position 0
+    padded = np.concatenate(([-np.inf], merge_distances))
+    k = np.asarray(k)
+    positions = np.where(k == 0, 1, len(merge_distances) - k + 1)
+    return padded[np.clip(positions, 0, len(merge_distances))]
 
 
 def find_histogram_gap(merge_distances, percentile, bins='doane'):
@@ -70,7 +99,7 @@ def mapper_gap_heuristic(Z, percentile, k_max=None, bins="doane"):
 
 
 def statistic_heuristic_hierarchical(X, metric, Z,
-                                     k_max, statistic=negative_silhouette):
+                                     k_max, statistic=negative_silhouette, monotonic=None):
     """
     Hierarchical clustering thresholding by statistic
 
@@ -84,6 +113,7 @@ def statistic_heuristic_hierarchical(X, metric, Z,
     X : array [n_samples, n_samples] if metric == "precomputed", or, \
              [n_samples, n_features] otherwise
         Array of pairwise distances between samples, or a feature array.
+        If metric == "precomputed", a condensed distance vector is also accepted.
 
     metric : str or function, optional
         See the ``scipy.spatial.distance.pdist`` function for a list of valid distance metrics.
@@ -101,6 +131,15 @@ def statistic_heuristic_hierarchical(X, metric, Z,
     statistic : function with signature (X,labels,metric -> statistic_value)
         Statistic function that evaluates the 'goodness' of clustering given by labels.
         Smaller values are interpreted as better.
+
+    monotonic : bool, optional
+        Whether Z is known to be monotonic, as for all linkage methods
+        except "centroid" and "median". Checked with scipy.cluster.hierarchy.is_monotonic if None.
+
+    Notes
+    -----
+    For statistic=negative_silhouette and monotonic Z, all thresholds are
+    evaluated in a single pass over Z using silhouette_sweep.
     """
     # N data points imply length N-1 merge_distances
     # statistic-based heuristic searches over 2 <= k <= N-1
@@ -108,24 +147,115 @@ def statistic_heuristic_hierarchical(X, metric, Z,
     merge_distances = Z[:,2]
     N = len(merge_distances) + 1
 
+    if monotonic is None:
+        monotonic = scipy.cluster.hierarchy.is_monotonic(Z)
+
+    if statistic is negative_silhouette and monotonic:
+        return silhouette_heuristic_hierarchical(X, metric, Z, k_max)
+
+    if metric == 'precomputed' and len(X.shape) == 1:
+        X = scipy.spatial.distance.squareform(X)
+
     optimal_stat = np.inf
     optimal_labels, optimal_k =  np.array([1]*N), 1
 
-    for threshold in reversed(np.sort(np.unique(merge_distances))):
-        labels = scipy.cluster.hierarchy.fcluster(Z, t=threshold, criterion='distance')
-        cur_k = len(np.unique(labels))
-        if cur_k < 2:
-            continue
-        if cur_k > k_max or cur_k > N-1:
-            break
-        cur_stat = statistic(X, labels, metric)
-        if cur_stat <  optimal_stat:
-            optimal_stat = cur_stat
-            optimal_labels, optimal_k = labels, cur_k
+    # all cuts with 2 <= k <= min(k_max, N-1) clusters, in order of decreasing threshold
+    if monotonic:
+        # the cut into k clusters is at the kth merge distance from the last,
+        # and gives fewer clusters if the next merge is at the same distance.
+        thresholds = cluster_number_to_threshold(np.arange(2, int(min(k_max, N-1)) + 1), merge_distances, check=False)
+        thresholds = np.unique(thresholds[np.isfinite(thresholds)])[::-1]
+        ks = N - np.searchsorted(merge_distances, thresholds, side='right')
+    else:
+        thresholds = np.unique(merge_distances)[::-1]
+        ks = number_of_clusters(Z, thresholds)
+    keep = (ks >= 2) & (ks <= k_max) & (ks <= N-1)
+    thresholds, ks = thresholds[keep], ks[keep]
+
+    # labels of cuts are computed in batches, sharing one pass over Z
+    batch_size = 64
+    for start in range(0, len(thresholds), batch_size):
+        batch_labels = cut_linkage(Z, threshold=thresholds[start:start+batch_size])
+        for labels, cur_k in zip(batch_labels.T, ks[start:start+batch_size]):
+            cur_stat = statistic(X, labels, metric)
+            if cur_stat <  optimal_stat:
+                optimal_stat = cur_stat
+                optimal_labels, optimal_k = labels, cur_k
+
+    return optimal_labels, optimal_k
+
+
+def silhouette_heuristic_hierarchical(X, metric, Z, k_max):
+    """
+    Hierarchical clustering thresholding by silhouette score
+
+    Same as statistic_heuristic_hierarchical with statistic=negative_silhouette,
+    but computes the silhouette scores of all thresholds incrementally
+    in one pass over Z. Assumes that Z is monotonic.
+
+    Parameters
+    ----------
+    See statistic_heuristic_hierarchical.
+    """
+    N = Z.shape[0] + 1
+
+    if metric == 'precomputed':
+        D = np.asarray(X)
+    else:
+        D = scipy.spatial.distance.pdist(X, metric=metric)
+
+    optimal_stat, optimal_threshold = np.inf, None
+    optimal_labels, optimal_k =  np.array([1]*N), 1
+
+    # sweep runs over decreasing k; ties are resolved towards fewer clusters.
+    for cur_k, threshold, score in silhouette_sweep(D, Z, k_max):
+        if -score <= optimal_stat:
+            optimal_stat = -score
+            optimal_threshold, optimal_k = threshold, cur_k
+
+    if optimal_threshold is not None:
+        optimal_labels = scipy.cluster.hierarchy.fcluster(Z, t=optimal_threshold, criterion='distance')
 
     return optimal_labels, optimal_k
 
 
+def _stratified_sample(X, sample_size, random_state=None):
+    """
+    Indices of a sample of rows of X, one drawn uniformly from each of sample_size
+    strata of (nearly) equal size along the first principal axis.
+    """
+    rng = np.random.default_rng(random_state)
+    n = X.shape[0]
+
+    centered = X - X.mean(axis=0)
+    _, eigenvectors = np.linalg.eigh(centered.T @ centered)
+    order = np.argsort(centered @ eigenvectors[:,-1], kind='stable')
+
+    bounds = np.linspace(0, n, sample_size + 1).astype(int)
+    offsets = np.floor(rng.random(sample_size) * np.diff(bounds)).astype(int)
+    return np.sort(order[bounds[:-1] + offsets])
+
+
+def _assign_to_nearest(X, sample, sample_labels, metric, chunk_elements=2**22):
+    """
+    Labels of rows of X, from those of their nearest row in X[sample].
+
+    Distances are computed with cdist, so any pdist metric works, in chunks of rows
+    holding at most about chunk_elements distances.
+    """
+    sample_labels = np.asarray(sample_labels)
+    labels = np.empty(X.shape[0], dtype=sample_labels.dtype)
+    labels[sample] = sample_labels
+
+    rest = np.flatnonzero(~np.isin(np.arange(X.shape[0]), sample))
+    chunk = max(1, chunk_elements // len(sample))
+    for start in range(0, len(rest), chunk):
+        rows = rest[start:start + chunk]
+        D = scipy.spatial.distance.cdist(X[rows], X[sample], metric=metric)
+        labels[rows] = sample_labels[np.argmin(D, axis=1)]
+    return labels
+
+
 class PreTransformPCA(object):
     """
     Projection onto chosen PCA axes.
@@ -192,12 +322,49 @@ class HeuristicHierarchical(sklearn.base.BaseEstimator,
           kmapper (as of 2.1.0) removes clusters that have strictly less than this number of samples.
           This number should probably be kept fixed as "1" if no data loss is desired.
 
+    distance_cache : mappertools.mapper.distances.DistanceCache, optional
+        Precomputed distances over the whole dataset.
+        If given, fit expects the indices (in the whole dataset) of the observations to cluster,
+        and distances are sliced from the cache instead of being computed; metric is ignored.
+        For use with kmapper, pass the indices as data, for example numpy.arange(n)[:,None].
+        Not compatible with pre_transform!
+
+    mst : bool
+        Build the single linkage hierarchy from a minimum spanning tree over feature vectors
+        (see mappertools.mapper.mst_linkage), without computing all pairwise distances.
+        Memory use is linear in the number of samples, instead of quadratic.
+        Only valid with method "single", a metric in mappertools.mapper.mst_linkage.MST_METRICS,
+        and without distance_cache.
+        The "silhouette" heuristic still computes all pairwise distances.
+
+    n_neighbors : int, optional
+        Number of nearest neighbors cached per sample when mst is True.
+
+    sample_size : int, optional
+        If given, inputs with more samples are clustered approximately:
+        the hierarchy is built on a stratified subsample of this size
+        (strata along the first principal axis), the heuristic picks clusters on it,
+        and the remaining samples join the cluster of their nearest subsample point.
+        Runtime then depends on sample_size rather than the number of samples.
+        Requires feature vectors, so not valid with a precomputed metric or distance_cache.
+        With verbose >= 2, the exact clustering is also computed and compared (adjusted Rand index).
+
+    random_state : int or numpy.random.Generator, optional
+        Seed for drawing the subsample when sample_size is given.
+
 
     Attributes
     ----------
     labels_ : array [n_samples]
         cluster labels for each point
 
+    sample_indices_ : array or None
+        Indices of the subsample the hierarchy was built on, if sample_size was used.
+
+    agreement_ : float or None
+        Adjusted Rand index between sampled and exact labels,
+        if sample_size was used and verbose >= 2.
+
     Notes
     -----
     This is essentially a wrapper around scipy.cluster.hierarchy.linkage.
@@ -212,7 +379,9 @@ class HeuristicHierarchical(sklearn.base.BaseEstimator,
     """
 
     def __init__(self, method='single', metric='euclidean', heuristic='firstgap',
-                 bins='doane', pre_transform = None, k_max=None, verbose=1, min_samples=1):
+                 bins='doane', pre_transform = None, k_max=None, verbose=1, min_samples=1,
+                 distance_cache=None, mst=False, n_neighbors=16,
+                 sample_size=None, random_state=None):
         self.method = method
         self.metric = metric
         self.heuristic = heuristic
@@ -221,6 +390,11 @@ class HeuristicHierarchical(sklearn.base.BaseEstimator,
         self.pre_transform = pre_transform
 
         self.min_samples = min_samples
+        self.distance_cache = distance_cache
+        self.mst = mst
+        self.n_neighbors = n_neighbors
+        self.sample_size = sample_size
+        self.random_state = random_state
 
         print("Clustering using: Hierarchical clustering with " + method + " linkage and " + heuristic + " heuristic.")
 
@@ -231,6 +405,18 @@ class HeuristicHierarchical(sklearn.base.BaseEstimator,
         if self.metric == 'precomputed' and self.pre_transform != None:
             raise RuntimeError("Using pre_transform not valid with precomputed metric!")
 
+        if self.distance_cache is not None and self.pre_transform != None:
+            raise RuntimeError("Using pre_transform not valid with distance_cache!")
+
+        if self.mst:
+            if self.method != 'single':
+                raise RuntimeError("Using mst only valid with single linkage!")
+            if self.distance_cache is not None or self.metric not in MST_METRICS:
+                raise RuntimeError("Using mst requires feature vectors and one of the metrics {}!".format(sorted(MST_METRICS)))
+
+        if self.sample_size is not None and (self.metric == 'precomputed' or self.distance_cache is not None):
+            raise RuntimeError("Using sample_size requires feature vectors!")
+
 
     def fit(self, X, y=None):
         """Fit the HeuristicHierarchical clustering on data
@@ -238,8 +424,9 @@ class HeuristicHierarchical(sklearn.base.BaseEstimator,
         Parameters
         ----------
         X : array [n_samples, n_samples] if metric == "precomputed", or, \
+             [n_samples] or [n_samples, 1] if distance_cache is given, or, \
              [n_samples, n_features] otherwise
-            Array of pairwise distances between samples, or a feature array.
+            Array of pairwise distances between samples, indices of samples, or a feature array.
 
         y : ignored
 
@@ -251,26 +438,79 @@ class HeuristicHierarchical(sklearn.base.BaseEstimator,
         if self.pre_transform != None:
             X = self.pre_transform.transform(X)
 
-        if len(X.shape) == 2 and X.shape[0] > 0 and X.shape[0] <= self.min_samples:
+        self.sample_indices_, self.agreement_ = None, None
+
+        if self.distance_cache is not None:
+            X = self.distance_cache.validate_indices(X)
+            is_data = True
+        else:
+            is_data = (len(X.shape) == 2)
+
+        if is_data and X.shape[0] > 0 and X.shape[0] <= self.min_samples:
             if self.verbose > 0:
                 print("1 clusters detected in {} points".format(X.shape[0]))
             self.labels_ = np.array([1])
-            return
+            return self
+
+        if self.sample_size is not None and X.shape[0] > self.sample_size:
+            sample = _stratified_sample(X, self.sample_size, self.random_state)
+            sample_labels, k, _ = self._cluster(X[sample])
+            self.labels_ = _assign_to_nearest(X, sample, sample_labels, self.metric)
+            self.sample_indices_ = sample
+            dists = None
+
+            if self.verbose >= 2:
+                exact_labels, _, _ = self._cluster(X, report=False)
+                self.agreement_ = sklearn.metrics.adjusted_rand_score(exact_labels, self.labels_)
+                print("agreement with exact clustering (adjusted Rand index): {}".format(self.agreement_))
+        else:
+            self.labels_, k, dists = self._cluster(X)
+
+        # FINAL REPORTING
+        if self.verbose > 0:
+            print("{} clusters detected in {} points".format(k,X.shape[0]))
+
+        if self.verbose >= 2:
+            if k <= 1:
+                print("silhouette score: invalid, too few final clusters")
+            elif dists is None:
+                print("silhouette score: {}".format(-negative_silhouette(X, self.labels_, metric=self.metric)))
+            else:
+                D = scipy.spatial.distance.squareform(dists)
+                print("silhouette score: {}".format(-negative_silhouette(D, self.labels_, metric='precomputed')))
+        return self
+
 
-        if self.metric != 'precomputed':
-            Z = scipy.cluster.hierarchy.linkage(X, method=self.method, metric=self.metric)
+    def _cluster(self, X, report=True):
+        """
+        Linkage of X and flat clusters chosen by the heuristic.
+
+        Returns
+        -------
+        (labels, k, dists) : labels, number of clusters,
+            and condensed distances if they were computed, otherwise None.
+        """
+        # condensed distances are computed once, and shared by
+        # linkage, cophenetic report, and silhouette computations.
+        # With mst, they are never computed for the linkage.
+        if self.mst:
+            dists = None
+            Z = mst_single_linkage(X, metric=self.metric, n_neighbors=self.n_neighbors)
+        elif self.distance_cache is not None:
+            dists = self.distance_cache.condensed(X)
+        elif self.metric != 'precomputed':
+            dists = scipy.spatial.distance.pdist(X, metric=self.metric)
         else:
             #flatten
-            compdists = scipy.spatial.distance.squareform(X, force='tovector')
-            Z = scipy.cluster.hierarchy.linkage(compdists, method=self.method, metric=self.metric)
+            dists = scipy.spatial.distance.squareform(X, force='tovector')
+        if dists is not None:
+            Z = scipy.cluster.hierarchy.linkage(dists, method=self.method)
 
-        if self.verbose >= 2:
+        if report and self.verbose >= 2:
             print("*** Heuristic Hierarchical Clustering Report ***")
-            if X.shape[0] > 2:
-                if self.metric != 'precomputed':
-                    dists = scipy.spatial.distance.pdist(X, metric=self.metric)
-                else:
-                    dists = compdists
+            if dists is None:
+                print("cophentic correlation distance: not computed with mst")
+            elif X.shape[0] > 2:
                 c, _ = scipy.cluster.hierarchy.cophenet(Z, dists)
                 print("cophentic correlation distance: {}".format(c))
             else:
@@ -280,23 +520,17 @@ class HeuristicHierarchical(sklearn.base.BaseEstimator,
         gap_heuristic_percentiles = {'firstgap': 0, 'midgap': 50, 'lastgap':100}
         if self.heuristic in gap_heuristic_percentiles:
             percentile = gap_heuristic_percentiles[self.heuristic]
-            self.labels_, k = mapper_gap_heuristic(Z, percentile, self.k_max, self.bins)
+            labels, k = mapper_gap_heuristic(Z, percentile, self.k_max, self.bins)
 
         elif self.heuristic == 'sil' or self.heuristic == 'silhouette':
-            self.labels_, k = statistic_heuristic_hierarchical(X, self.metric, Z, self.k_max, statistic=negative_silhouette)
+            if dists is None:
+                dists = scipy.spatial.distance.pdist(X, metric=self.metric)
+            labels, k = statistic_heuristic_hierarchical(dists, 'precomputed', Z, self.k_max, statistic=negative_silhouette,
+                                                         monotonic=self.method not in ('centroid', 'median'))
         else:
             pass
 
-        # FINAL REPORTING
-        if self.verbose > 0:
-            print("{} clusters detected in {} points".format(k,X.shape[0]))
-
-        if self.verbose >= 2:
-            if k <= 1:
-                print("silhouette score: invalid, too few final clusters")
-            else:
-                print("silhouette score: {}".format(-negative_silhouette(X, self.labels_, metric=self.metric)))
-        return self
+        return labels, k, dists
 
 
 class LinkageMapper(HeuristicHierarchical):
@@ -0,0 +1,129 @@
+"""
+Flat clusterings read off a linkage matrix Z directly, for one or many cuts at once.
+
+Cuts are computed with a disjoint-set forest over the merges of Z, applied in order of height,
+in place of a call to scipy.cluster.hierarchy.fcluster per cut.
+"""
+
+import numpy as np
+
+import scipy.cluster.hierarchy
+
+
+def cut_linkage(Z, k=None, threshold=None):
+    """
+    Flat cluster labels of cuts of a hierarchical clustering.
+
+    Labels are those of scipy.cluster.hierarchy.fcluster:
+    cutting at threshold t gives fcluster(Z, t, criterion='distance'),
+    and cutting into k clusters gives fcluster(Z, t, criterion='distance')
+    for the t merging exactly the first n-k merges (in order of height).
+
+    Parameters
+    ----------
+    Z : array
+        hierarchical clustering encoded as a linkage matrix.
+
+    k : int or array of int, optional
+        Number(s) of clusters.
+
+    threshold : float or array of float, optional
+        Distance threshold(s). Exactly one of k and threshold must be given.
+
+    Returns
+    -------
+    labels : array [n_samples], or [n_samples, n_cuts] for an array of cuts
+        Labels 1,...,k, numbered as in fcluster.
+    """
+    if (k is None) == (threshold is None):
+        raise ValueError("Exactly one of k and threshold must be given")
+
+    Z = np.asarray(Z, dtype=float)
+    n = Z.shape[0] + 1
+
+    # height of the cluster formed by each merge, as in fcluster with criterion 'distance'
+    heights = scipy.cluster.hierarchy.maxdists(Z)
+    order = np.argsort(heights, kind='stable')
+
+    cuts = k if k is not None else threshold
+    scalar = np.ndim(cuts) == 0
+    if k is not None:
+        n_merges = n - np.clip(np.atleast_1d(k), 1, n)
+    else:
+        n_merges = np.searchsorted(heights[order], np.atleast_1d(threshold), side='right')
+
+    labels = _labels_after_merges(Z, order, n_merges)
+    return labels[:,0] if scalar else labels
+
+
+def _labels_after_merges(Z, order, n_merges):
+    """
+    Labels of leaves after applying merges order[:m] of Z, for each m in n_merges.
+    """
+    n = Z.shape[0] + 1
+    children = Z[:,:2].astype(np.int64)
+    visit_order = _fcluster_visit_order(children, n)
+
+    # parent[i] is an ancestor of cluster i among applied merges (or i itself)
+    parent = np.arange(2*n - 1)
+    ans = np.empty((n, len(n_merges)), dtype=np.int32)
+
+    applied = 0
+    for column in np.argsort(n_merges, kind='stable'):
+        rows = order[applied:n_merges[column]]
+        parent[children[rows,0]] = n + rows
+        parent[children[rows,1]] = n + rows
+        applied = max(applied, n_merges[column])
+
+        # path compression, by pointer jumping
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+        roots = parent[:n]
+
+        # number clusters in the order fcluster finds them
+        unique_roots, inverse = np.unique(roots, return_inverse=True)
+        numbers = np.empty(len(unique_roots), dtype=np.int32)
+        numbers[np.argsort(visit_order[unique_roots])] = np.arange(1, len(unique_roots) + 1)
+        ans[:,column] = numbers[inverse.ravel()]
+
+    return ans
+
+
+def _fcluster_visit_order(children, n):
+    """
+    Order in which fcluster numbers clusters rooted at each node of the dendrogram:
+    depth first from the root, left subtree first, where merged nodes are visited
+    before their subtrees, and leaves after the subtrees of their sibling.
+    """
+    visit_order = [0] * (2*n - 1)
+    children = children.tolist()
+    counter = 0
+    stack = [(2*n - 2, False)] if n > 1 else []
+    while stack:
+        node, done = stack.pop()
+        left, right = children[node - n]
+        if not done:
+            visit_order[node] = counter
+            counter += 1
+            stack.append((node, True))
+            if right >= n:
+                stack.append((right, False))
+            if left >= n:
+                stack.append((left, False))
+        else:
+            for child in (left, right):
+                if child < n:
+                    visit_order[child] = counter
+                    counter += 1
+    return np.array(visit_order, dtype=np.int64)
+
+
+def number_of_clusters(Z, threshold):
+    """
+    Number of flat clusters of cuts of Z at threshold(s), as for fcluster with criterion 'distance'.
+    """
+    heights = np.sort(scipy.cluster.hierarchy.maxdists(np.asarray(Z, dtype=float)))
+    return Z.shape[0] + 1 - np.searchsorted(heights, threshold, side='right')
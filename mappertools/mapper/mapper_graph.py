@@ -0,0 +1,410 @@
+import collections
+import types
+
+import numpy as np
+import scipy.sparse
+import networkx as nx
+
+import mappertools.utils.membership as mbr
+
+
+def _is_ragged(values):
+    return len(values) > 0 and all(isinstance(value, (list, tuple, np.ndarray)) for value in values)
+
+
+def _typed_array(values):
+    """
+    numpy array of values, with object dtype unless a native dtype represents them faithfully.
+    """
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    if any(value is None for value in values):
+        return column
+    try:
+        typed = np.array(values)
+    except ValueError:
+        return column
+    if typed.ndim != 1 or typed.dtype == object:
+        return column
+    if typed.dtype.kind in 'US' and not all(isinstance(value, str) for value in values):
+        return column
+    return typed
+
+
+def _to_column(values):
+    """
+    Store a list of attribute values compactly:
+    lists as a ragged (indptr, values) pair, scalars as a numpy array.
+    """
+    if _is_ragged(values):
+        indptr = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in values], out=indptr[1:])
+        return indptr, _typed_array([item for value in values for item in value])
+    return _typed_array(values)
+
+
+def _column_value(column, i):
+    if isinstance(column, tuple):
+        indptr, values = column
+        return values[indptr[i]:indptr[i+1]].tolist()
+    return column[i:i+1].tolist()[0]
+
+
+def _take(column, rows):
+    if isinstance(column, tuple):
+        indptr, values = column
+        parts = [values[indptr[i]:indptr[i+1]] for i in rows]
+        new_indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(part) for part in parts], out=new_indptr[1:])
+        return new_indptr, (np.concatenate(parts) if len(parts) > 0 else values[:0])
+    return column[rows]
+
+
+def _column_values(columns, missing, i):
+    ans = {}
+    for key, column in columns.items():
+        if key not in missing or not missing[key][i]:
+            ans[key] = _column_value(column, i)
+    return ans
+
+
+def _missing_mask(has_key):
+    # mask of entries lacking an attribute, or None if all have it
+    has_key = np.fromiter(has_key, dtype=bool)
+    return None if np.all(has_key) else ~has_key
+
+
+class _NodeView(object):
+    """
+    Read-only view of nodes of a MapperGraph, in the manner of networkx G.nodes.
+    Attribute dicts are built on access; G.nodes[node] is a read-only mapping.
+    """
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __iter__(self):
+        return iter(self._graph.node_ids)
+
+    def __len__(self):
+        return len(self._graph.node_ids)
+
+    def __contains__(self, node):
+        return node in self._graph.position
+
+    def __getitem__(self, node):
+        return types.MappingProxyType(self._graph.node_attributes(self._graph.position[node]))
+
+    def __call__(self, data=False, default=None):
+        if data is False:
+            return self
+        return self.data(None if data is True else data, default)
+
+    def data(self, data=True, default=None):
+        graph = self._graph
+        if data is True or data is None:
+            return ((node, graph.node_attributes(i)) for i, node in enumerate(graph.node_ids))
+        if data == 'membership':
+            return zip(graph.node_ids, (members.tolist() for members in graph.memberships()))
+        if data not in graph.node_data:
+            return ((node, default) for node in graph.node_ids)
+        column, missing = graph.node_data[data], graph.node_missing.get(data)
+        return ((node, default if missing is not None and missing[i] else _column_value(column, i))
+                for i, node in enumerate(graph.node_ids))
+
+
+class _EdgeView(object):
+    """
+    Read-only view of edges of a MapperGraph, in the manner of networkx G.edges.
+    G.edges[u, v] is a read-only mapping.
+    """
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __iter__(self):
+        node_ids = self._graph.node_ids
+        return ((node_ids[i], node_ids[j]) for i, j in self._graph.edges_.tolist())
+
+    def __len__(self):
+        return len(self._graph.edges_)
+
+    def __getitem__(self, edge):
+        return types.MappingProxyType(self._graph.edge_attributes(self._graph.edge_position(*edge)))
+
+    def __call__(self, data=False, default=None):
+        if data is False:
+            return self
+        return self.data(None if data is True else data, default)
+
+    def data(self, data=True, default=None):
+        graph = self._graph
+        edges = list(self)
+        if data is True or data is None:
+            return ((u, v, graph.edge_attributes(e)) for e, (u, v) in enumerate(edges))
+        if data not in graph.edge_data:
+            return ((u, v, default) for u, v in edges)
+        column, missing = graph.edge_data[data], graph.edge_missing.get(data)
+        return ((u, v, default if missing is not None and missing[e] else _column_value(column, e))
+                for e, (u, v) in enumerate(edges))
+
+
+class MapperGraph(object):
+    """
+    Compact, array-backed Mapper graph.
+
+    Node memberships and adjacency are kept as CSR arrays over positions of nodes,
+    and node and edge attributes as columns: numpy arrays for scalars,
+    (indptr, values) pairs for lists (such as 'unique_members').
+    Python objects are only created on access, or on export by to_networkx and to_kmapper.
+
+    Supports the parts of the networkx graph interface used by mappertools.features
+    (iteration, G[node], G.nodes, G.edges, subgraph), so features can be computed
+    on it directly.
+
+    Parameters
+    ----------
+    node_ids : list
+        Names of nodes.
+
+    node_indptr, node_indices : arrays
+        Node memberships in CSR layout: members of node i are
+        node_indices[node_indptr[i]:node_indptr[i+1]].
+
+    edges : array [n_edges, 2]
+        Pairs of positions of connected nodes.
+
+    node_data : dict {key : column}, optional
+        Node attributes, each a numpy array [n_nodes] or a ragged (indptr, values) pair.
+
+    edge_data : dict {key : column}, optional
+        Edge attributes, each a numpy array [n_edges] or a ragged (indptr, values) pair.
+
+    meta_data : dict, optional
+        Graph-level data, such as the 'meta_data' of a kmapper graph.
+
+    node_missing, edge_missing : dict {key : boolean array}, optional
+        For attributes that some nodes (edges) lack, mask of those lacking it.
+        Their entries in the column are None, and are left out of attribute dicts.
+    """
+
+    def __init__(self, node_ids, node_indptr, node_indices, edges,
+                 node_data=None, edge_data=None, meta_data=None,
+                 node_missing=None, edge_missing=None):
+        self.node_ids = list(node_ids)
+        self.node_indptr = np.asarray(node_indptr, dtype=np.int64)
+        self.node_indices = np.asarray(node_indices)
+        self.edges_ = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        self.node_data = {} if node_data is None else dict(node_data)
+        self.edge_data = {} if edge_data is None else dict(edge_data)
+        self.meta_data = {} if meta_data is None else dict(meta_data)
+        self.node_missing = {} if node_missing is None else dict(node_missing)
+        self.edge_missing = {} if edge_missing is None else dict(edge_missing)
+
+        self.position = {node: i for i, node in enumerate(self.node_ids)}
+        self._adjacency = None
+        self._edge_members = None
+        self._edge_positions = None
+
+    # ******************** conversions ********************
+
+    @classmethod
+    def from_networkx(cls, G):
+        """
+        Convert a networkx Mapper graph, whose nodes have 'membership' data.
+        Other node and edge data become attribute columns.
+        """
+        node_ids = list(G.nodes)
+        position = {node: i for i, node in enumerate(node_ids)}
+        node_indptr, node_indices = mbr.memberships_to_csr(G.nodes[node].get('membership', []) for node in node_ids)
+
+        edge_list = list(G.edges)
+        edges = np.array([(position[u], position[v]) for u, v in edge_list], dtype=np.int64).reshape(-1, 2)
+
+        node_keys = dict.fromkeys(key for node in node_ids for key in G.nodes[node] if key != 'membership')
+        node_data = {key: _to_column([G.nodes[node].get(key) for node in node_ids]) for key in node_keys}
+        node_missing = {key: _missing_mask(key in G.nodes[node] for node in node_ids) for key in node_keys}
+
+        edge_keys = dict.fromkeys(key for edge in edge_list for key in G.edges[edge])
+        edge_data = {key: _to_column([G.edges[edge].get(key) for edge in edge_list]) for key in edge_keys}
+        edge_missing = {key: _missing_mask(key in G.edges[edge] for edge in edge_list) for key in edge_keys}
+
+        return cls(node_ids, node_indptr, node_indices, edges, node_data, edge_data, dict(G.graph),
+                   {key: mask for key, mask in node_missing.items() if mask is not None},
+                   {key: mask for key, mask in edge_missing.items() if mask is not None})
+
+    @classmethod
+    def from_kmapper(cls, graph):
+        """
+        Convert a kmapper graph dict.
+        """
+        node_ids = list(graph['nodes'].keys())
+        position = {node: i for i, node in enumerate(node_ids)}
+        node_indptr, node_indices = mbr.memberships_to_csr(graph['nodes'].values())
+
+        edges = [(position[u], position[v]) for u, vs in graph['links'].items() for v in vs]
+        edges = np.array(edges, dtype=np.int64).reshape(-1, 2)
+
+        meta_data = {'meta_data': graph.get('meta_data', {}), 'meta_nodes': graph.get('meta_nodes', {})}
+        return cls(node_ids, node_indptr, node_indices, edges, meta_data=meta_data)
+
+    def to_networkx(self):
+        """
+        Export as a networkx graph, with all node and edge data.
+        """
+        g = nx.Graph()
+        g.graph.update(self.meta_data)
+        g.add_nodes_from((node, self.node_attributes(i)) for i, node in enumerate(self.node_ids))
+        g.add_edges_from((u, v, self.edge_attributes(e)) for e, (u, v) in enumerate(self.edges))
+        return g
+
+    def to_kmapper(self):
+        """
+        Export as a kmapper graph dict.
+        """
+        nodes = {name: members.tolist() for name, members in zip(self.node_ids, self.memberships())}
+
+        links = collections.defaultdict(list)
+        for u, v in self.edges:
+            links[u].append(v)
+
+        graph = {}
+        graph["nodes"] = nodes
+        graph["links"] = links
+        graph["simplices"] = [[n] for n in nodes] + [[u, v] for u, v in self.edges]
+        graph["meta_data"] = self.meta_data.get("meta_data", {})
+        graph["meta_nodes"] = self.meta_data.get("meta_nodes", {})
+        return graph
+
+    # ******************** arrays ********************
+
+    def adjacency(self):
+        """
+        Symmetric adjacency in CSR layout (indptr, indices) over positions of nodes,
+        with neighbors sorted.
+        """
+        if self._adjacency is None:
+            n = len(self.node_ids)
+            rows = np.concatenate((self.edges_[:,0], self.edges_[:,1]))
+            cols = np.concatenate((self.edges_[:,1], self.edges_[:,0]))
+            A = scipy.sparse.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n, n))
+            A.sum_duplicates()
+            self._adjacency = (A.indptr, A.indices)
+        return self._adjacency
+
+    def memberships(self):
+        """
+        List of member arrays of nodes, in the order of node_ids.
+        """
+        return mbr.csr_to_memberships(self.node_indptr, self.node_indices)
+
+    def incidence_matrix(self, n_points=None):
+        """
+        Sparse binary node x point incidence matrix.
+        See mappertools.utils.membership.incidence_matrix.
+        """
+        return mbr.incidence_matrix(self.node_indptr, self.node_indices, n_points)
+
+    def node_sizes(self):
+        return np.diff(self.node_indptr)
+
+    def edge_memberships(self):
+        """
+        Shared members of endpoints of each edge, in CSR layout (indptr, indices), sorted.
+        """
+        if self._edge_members is None:
+            M = self.incidence_matrix()
+            shared = M[self.edges_[:,0]].multiply(M[self.edges_[:,1]]).tocsr()
+            shared.sort_indices()
+            self._edge_members = (shared.indptr, shared.indices)
+        return self._edge_members
+
+    def edge_counts(self):
+        return np.diff(self.edge_memberships()[0])
+
+    # ******************** networkx-like interface ********************
+
+    @property
+    def nodes(self):
+        return _NodeView(self)
+
+    @property
+    def edges(self):
+        return _EdgeView(self)
+
+    def __iter__(self):
+        return iter(self.node_ids)
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def __contains__(self, node):
+        return node in self.position
+
+    def __getitem__(self, node):
+        return list(self.neighbors(node))
+
+    def neighbors(self, node):
+        indptr, indices = self.adjacency()
+        i = self.position[node]
+        return (self.node_ids[j] for j in indices[indptr[i]:indptr[i+1]])
+
+    def number_of_nodes(self):
+        return len(self.node_ids)
+
+    def number_of_edges(self):
+        return len(self.edges_)
+
+    def is_directed(self):
+        return False
+
+    def is_multigraph(self):
+        return False
+
+    def node_attributes(self, i):
+        """
+        Dict of data of the node at position i, including 'membership'.
+        """
+        ans = {'membership': self.node_indices[self.node_indptr[i]:self.node_indptr[i+1]].tolist()}
+        ans.update(_column_values(self.node_data, self.node_missing, i))
+        return ans
+
+    def edge_attributes(self, e):
+        """
+        Dict of data of the e-th edge.
+        """
+        return _column_values(self.edge_data, self.edge_missing, e)
+
+    def edge_position(self, u, v):
+        """
+        Position in edges_ of the edge between nodes u and v.
+        """
+        if self._edge_positions is None:
+            self._edge_positions = {}
+            for e, (i, j) in enumerate(self.edges_.tolist()):
+                self._edge_positions.setdefault((min(i, j), max(i, j)), e)
+        i, j = self.position[u], self.position[v]
+        try:
+            return self._edge_positions[min(i, j), max(i, j)]
+        except KeyError:
+            raise KeyError("Edge ({}, {}) not in graph".format(u, v)) from None
+
+    def subgraph(self, nodes):
+        """
+        Induced subgraph on given nodes, as a new MapperGraph.
+        """
+        rows = np.sort(np.fromiter((self.position[node] for node in nodes if node in self.position), dtype=np.int64))
+        new_position = np.full(len(self.node_ids), -1)
+        new_position[rows] = np.arange(len(rows))
+
+        keep = (new_position[self.edges_[:,0]] >= 0) & (new_position[self.edges_[:,1]] >= 0)
+        edge_rows = np.flatnonzero(keep)
+
+        node_indptr, node_indices = _take((self.node_indptr, self.node_indices), rows)
+        return MapperGraph([self.node_ids[i] for i in rows], node_indptr, node_indices,
+                           new_position[self.edges_[edge_rows]],
+                           {key: _take(column, rows) for key, column in self.node_data.items()},
+                           {key: _take(column, edge_rows) for key, column in self.edge_data.items()},
+                           self.meta_data,
+                           {key: mask[rows] for key, mask in self.node_missing.items()},
+                           {key: mask[edge_rows] for key, mask in self.edge_missing.items()})
@@ -0,0 +1,208 @@
+"""
+Single linkage clustering of feature vectors from a minimum spanning tree,
+without computing all pairwise distances.
+
+The tree is built by Boruvka's algorithm, where the shortest edge leaving each component
+is found from a cache of k nearest neighbors (queried from a KD-tree),
+falling back to wider queries only for components that need them.
+Memory use is O(n * n_neighbors), in place of O(n^2) for the condensed distance vector.
+"""
+
+import numpy as np
+
+import scipy.sparse
+import scipy.sparse.csgraph
+import scipy.spatial
+
+
+# Minkowski p for metrics supported by scipy.spatial.cKDTree, named as in scipy.spatial.distance.pdist
+MST_METRICS = {'euclidean': 2, 'minkowski': 2, 'cityblock': 1, 'chebyshev': np.inf}
+
+
+def mst_single_linkage(X, metric='euclidean', n_neighbors=16):
+    """
+    Single linkage hierarchical clustering, as scipy.cluster.hierarchy.linkage(X, 'single', metric).
+
+    Merge distances are the same as those of scipy. Among merges at equal distances,
+    the order (and hence the linkage matrix) may differ, but flat clusters
+    obtained by cutting at a threshold are the same.
+
+    Parameters
+    ----------
+    X : array [n_samples, n_features]
+
+    metric : str
+        One of MST_METRICS.
+
+    n_neighbors : int
+        Number of nearest neighbors cached for each point.
+
+    Returns
+    -------
+    Z : array [n_samples - 1, 4]
+        Linkage matrix.
+    """
+    u, v, w = minimum_spanning_tree(X, metric, n_neighbors)
+    return mst_to_linkage(u, v, w, len(X))
+
+
+def minimum_spanning_tree(X, metric='euclidean', n_neighbors=16):
+    """
+    Minimum spanning tree of the complete graph on rows of X, weighted by distances.
+
+    Ties between edges of equal length are broken by endpoints, so the tree is unique.
+
+    Returns
+    -------
+    (u, v, w) : tuple of arrays [n_samples - 1]
+        Edges (u[i], v[i]) of length w[i].
+    """
+    if metric not in MST_METRICS:
+        raise ValueError("Metric {} not supported, use one of {}".format(metric, sorted(MST_METRICS)))
+    p = MST_METRICS[metric]
+
+    X = np.asarray(X, dtype=float)
+    n = X.shape[0]
+    if n <= 1:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+
+    tree = scipy.spatial.cKDTree(X)
+    k = min(n_neighbors + 1, n)
+    cached_distances, cached_neighbors = tree.query(X, k=k, p=p)
+
+    points = np.arange(n)
+    component = np.arange(n)
+    edges_u, edges_v, edges_w = [], [], []
+
+    while len(edges_u) < n - 1:
+        # nearest neighbor of each point outside its component, within the cache
+        outside = component[cached_neighbors] != component[:,None]
+        found = np.any(outside, axis=1)
+        first = np.argmax(outside, axis=1)
+        candidate_neighbors = np.where(found, cached_neighbors[points, first], -1)
+        candidate_distances = np.where(found, cached_distances[points, first], np.inf)
+
+        best_u, best_v, best_w = _shortest_per_component(component, points[found],
+                                                         candidate_neighbors[found], candidate_distances[found])
+
+        # points without a neighbor outside the cache may still give shorter edges
+        component_best = np.full(n, np.inf)
+        component_best[component[best_u]] = best_w
+        pending = np.flatnonzero(~found & (cached_distances[:,-1] <= component_best[component]))
+        if len(pending) > 0:
+            more = _resolve_pending(tree, X, p, component, pending, cached_distances[pending,-1], k)
+            best_u, best_v, best_w = _shortest_per_component(
+                component,
+                np.concatenate((best_u, more[0])),
+                np.concatenate((best_v, more[1])),
+                np.concatenate((best_w, more[2])))
+
+        # shortest edges leaving components belong to the minimum spanning tree;
+        # with ties, edges closing a cycle between components are skipped
+        a, b = np.minimum(best_u, best_v), np.maximum(best_u, best_v)
+        merged = {}
+        def find(c):
+            while c in merged:
+                c = merged[c]
+            return c
+        order = np.lexsort((b, a, best_w))
+        for x, y, i, j, length in zip(component[a[order]].tolist(), component[b[order]].tolist(),
+                                      a[order].tolist(), b[order].tolist(), best_w[order].tolist()):
+            x, y = find(x), find(y)
+            if x != y:
+                merged[max(x, y)] = min(x, y)
+                edges_u.append(i)
+                edges_v.append(j)
+                edges_w.append(length)
+
+        component = _component_labels(n, np.array(edges_u), np.array(edges_v))
+
+    return np.array(edges_u), np.array(edges_v), np.array(edges_w)
+
+
+def _shortest_per_component(component, u, v, w):
+    """
+    Shortest edge (u, v, w) leaving each component, ties broken by endpoints.
+    """
+    if len(u) == 0:
+        return u, v, w
+    order = np.lexsort((np.maximum(u, v), np.minimum(u, v), w, component[u]))
+    u, v, w = u[order], v[order], w[order]
+    first = np.r_[True, component[u][1:] != component[u][:-1]]
+    return u[first], v[first], w[first]
+
+
+def _resolve_pending(tree, X, p, component, pending, lower_bounds, k):
+    """
+    Nearest neighbor outside their component of pending points, by wider queries.
+
+    Components with many pending points are resolved with a tree of the points outside them.
+    """
+    n = len(X)
+    u, v, w = [], [], []
+
+    pending_components = component[pending]
+    order = np.argsort(pending_components, kind='stable')
+    pending, pending_components = pending[order], pending_components[order]
+    splits = np.flatnonzero(np.diff(pending_components)) + 1
+
+    for points in np.split(pending, splits):
+        c = component[points[0]]
+        if len(points) * k > n:
+            others = np.flatnonzero(component != c)
+            distances, neighbors = scipy.spatial.cKDTree(X[others]).query(X[points], k=1, p=p)
+            u.append(points)
+            v.append(others[neighbors])
+            w.append(distances)
+            continue
+
+        kk = k
+        while len(points) > 0:
+            kk = min(2 * kk, n)
+            distances, neighbors = tree.query(X[points], k=kk, p=p)
+            outside = component[neighbors] != c
+            found = np.any(outside, axis=1)
+            first = np.argmax(outside, axis=1)
+            rows = np.flatnonzero(found)
+            u.append(points[rows])
+            v.append(neighbors[rows, first[rows]])
+            w.append(distances[rows, first[rows]])
+            points = points[~found]
+
+    return np.concatenate(u), np.concatenate(v), np.concatenate(w)
+
+
+def _component_labels(n, u, v):
+    # connected components of the forest of edges (u, v)
+    graph = scipy.sparse.csr_matrix((np.ones(len(u), dtype=np.int8), (u, v)), shape=(n, n))
+    return scipy.sparse.csgraph.connected_components(graph, directed=False)[1]
+
+
+def mst_to_linkage(u, v, w, n):
+    """
+    Linkage matrix of single linkage clustering, from a minimum spanning tree on n points.
+
+    Edges are merged in order of length, as in scipy.cluster.hierarchy.linkage.
+    """
+    order = np.argsort(w, kind='stable')
+    u, v, w = np.asarray(u)[order].tolist(), np.asarray(v)[order].tolist(), np.asarray(w)[order]
+
+    # disjoint-set forest, with cluster ids as in the linkage matrix
+    parent = list(range(2*n - 1))
+    size = [1] * (2*n - 1)
+
+    def find(i):
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        while parent[i] != root:
+            parent[i], i = root, parent[i]
+        return root
+
+    Z = np.empty((n - 1, 4))
+    for i, (a, b) in enumerate(zip(u, v)):
+        x, y = find(a), find(b)
+        parent[x] = parent[y] = n + i
+        size[n + i] = size[x] + size[y]
+        Z[i] = (min(x, y), max(x, y), w[i], size[n + i])
+    return Z
@@ -0,0 +1,192 @@
+import collections
+
+import numpy as np
+import scipy.sparse
+import networkx as nx
+
+from mappertools.mapper.cube_clustering import fit_cubes
+import mappertools.utils.membership as mbr
+from mappertools.mapper.mapper_graph import MapperGraph
+
+
+def _min_cluster_samples(clusterer):
+    # as in kmapper.KeplerMapper.map
+    params = clusterer.get_params() if hasattr(clusterer, "get_params") else {}
+    for parameter in ["n_clusters", "min_cluster_size", "min_samples"]:
+        value = params.get(parameter)
+        if value and isinstance(value, int):
+            return value
+    return 2
+
+
+def _cube_name(cube):
+    # rectangles of high dimensional lazy covers are keyed by tuples of interval indices
+    if isinstance(cube, tuple):
+        return "_".join(str(int(i)) for i in cube)
+    return cube
+
+
+def _cluster_name(label):
+    try:
+        return int(label)
+    except (TypeError, ValueError):
+        return label
+
+
+class MapperPipeline(object):
+    """
+    Mapper graph construction: lens -> cover -> clustering -> nerve.
+
+    Works on integer index arrays throughout: node memberships are kept in CSR layout,
+    and edges are read off the sparse product M M^T of the node x point incidence matrix M.
+    Output compatible with kmapper is only built on export, by to_kmapper or to_networkx.
+
+    Node names and memberships are those of kmapper.KeplerMapper.map
+    with the same cover and clusterer (and remove_duplicate_nodes=False).
+
+    Parameters
+    ----------
+    cover :
+        A cover, such as mappertools.mapper.covers.EPCover, or a kmapper.Cover.
+
+    clusterer :
+        Clusterer with a fit method setting labels_, such as
+        mappertools.mapper.hierarchical_clustering.HeuristicHierarchical.
+
+    min_intersection : int
+        Minimum number of shared members for two nodes to be connected by an edge.
+
+    n_jobs : int
+        Number of processes for clustering. See mappertools.mapper.cube_clustering.fit_cubes.
+
+    Attributes
+    ----------
+    node_ids_ : list of str
+        Names of nodes, "cube{i}_cluster{j}" as in kmapper.
+        Rectangles keyed by tuples (i1, ..., id) are named "cube{i1}_..._{id}".
+
+    node_indptr_, node_indices_ : arrays
+        Node memberships in CSR layout: members of node i are
+        node_indices_[node_indptr_[i]:node_indptr_[i+1]].
+
+    edges_ : array [n_edges, 2]
+        Pairs (i,j), i < j, of positions of connected nodes, sorted lexicographically.
+
+    edge_counts_ : array [n_edges]
+        Number of shared members of each edge.
+    """
+
+    def __init__(self, cover, clusterer, min_intersection=1, n_jobs=1):
+        self.cover = cover
+        self.clusterer = clusterer
+        self.min_intersection = min_intersection
+        self.n_jobs = n_jobs
+
+    def fit(self, X, lens):
+        """
+        Compute the Mapper graph.
+
+        Parameters
+        ----------
+        X : array [n_samples, n_features]
+            Data to cluster.
+
+        lens : array [n_samples, n_lens_dimensions]
+            Projection of the data.
+
+        Returns
+        -------
+        self
+        """
+        if hasattr(X, "to_numpy") and callable(X.to_numpy):
+            X = X.to_numpy()
+        lens = np.asarray(lens)
+        if len(lens.shape) == 1:
+            lens = lens[:,np.newaxis]
+
+        self.n_samples_ = lens.shape[0]
+        lens = np.c_[np.arange(self.n_samples_), lens]
+
+        self.cover.fit(lens)
+        if hasattr(self.cover, "transform_indices"):
+            cubes = self.cover.transform_indices(lens)
+        else:
+            cubes = {cube: patch[:,0].astype(int) for cube, patch in enumerate(self.cover.transform(lens))}
+
+        min_samples = _min_cluster_samples(self.clusterer)
+        cubes = {cube: members for cube, members in cubes.items() if len(members) >= min_samples}
+        labels = fit_cubes(X, cubes, self.clusterer, n_jobs=self.n_jobs)
+
+        node_ids = []
+        memberships = []
+        for cube, members in cubes.items():
+            cube_labels = labels[cube]
+            for pred in np.unique(cube_labels):
+                if isinstance(pred, (int, float, np.number)) and (pred == -1 or np.isnan(pred)):
+                    continue
+                node_ids.append("cube{}_cluster{}".format(_cube_name(cube), _cluster_name(pred)))
+                memberships.append(members[cube_labels == pred])
+
+        self.node_ids_ = node_ids
+        self.node_indptr_, self.node_indices_ = mbr.memberships_to_csr(memberships)
+        self._compute_edges()
+        return self
+
+    def _compute_edges(self):
+        M = mbr.incidence_matrix(self.node_indptr_, self.node_indices_, self.n_samples_)
+        intersections = scipy.sparse.triu(M @ M.T, k=1).tocoo()
+
+        keep = intersections.data >= self.min_intersection
+        rows, cols, counts = intersections.row[keep], intersections.col[keep], intersections.data[keep]
+        order = np.lexsort((cols, rows))
+
+        self.edges_ = np.column_stack((rows[order], cols[order]))
+        self.edge_counts_ = counts[order]
+
+    def memberships(self):
+        """
+        List of member arrays of nodes, in the order of node_ids_.
+        """
+        return mbr.csr_to_memberships(self.node_indptr_, self.node_indices_)
+
+    def to_kmapper(self):
+        """
+        Export as a kmapper graph dict.
+        """
+        nodes = {name: members.tolist() for name, members in zip(self.node_ids_, self.memberships())}
+
+        links = collections.defaultdict(list)
+        for i, j in self.edges_:
+            links[self.node_ids_[i]].append(self.node_ids_[j])
+
+        edges = [[self.node_ids_[i], self.node_ids_[j]] for i, j in self.edges_]
+
+        graph = {}
+        graph["nodes"] = nodes
+        graph["links"] = links
+        graph["simplices"] = [[n] for n in nodes] + edges
+        graph["meta_data"] = {"projection": "custom",
+                              "n_cubes": getattr(self.cover, "n_cubes", None),
+                              "perc_overlap": getattr(self.cover, "perc_overlap", None),
+                              "clusterer": str(self.clusterer),
+                              "scaler": str(None),
+                              "nerve_min_intersection": self.min_intersection}
+        graph["meta_nodes"] = {}
+        return graph
+
+    def to_mapper_graph(self):
+        """
+        Export as a MapperGraph, sharing the membership arrays.
+        """
+        return MapperGraph(self.node_ids_, self.node_indptr_, self.node_indices_, self.edges_,
+                           edge_data={"count": self.edge_counts_})
+
+    def to_networkx(self):
+        """
+        Export as a networkx graph, as kmapper.adapter.to_nx would.
+        """
+        g = nx.Graph()
+        g.add_nodes_from((name, {"membership": members.tolist()})
+                         for name, members in zip(self.node_ids_, self.memberships()))
+        g.add_edges_from((self.node_ids_[i], self.node_ids_[j]) for i, j in self.edges_)
+        return g
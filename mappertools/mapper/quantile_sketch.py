@@ -0,0 +1,120 @@
+import numpy as np
+
+
+class QuantileSketch(object):
+    """
+    Mergeable quantile sketch for streams of real numbers.
+
+    Keeps a hierarchy of buffers ("compactors"), where items in level h stand for 2^h observations.
+    Whenever a level holds more than k items, it is sorted and every other item
+    is promoted to the next level.
+
+    Each compaction at level h shifts the estimated rank of any value by at most 2^h.
+    The sum of these shifts is tracked, so that rank_error() is a guaranteed bound.
+    It is at most n * (1 + log2(n/k)) / k for n observations.
+
+    Parameters
+    ----------
+    k : int
+        Capacity of each level. Memory use is O(k log(n/k)).
+    """
+
+    def __init__(self, k=256):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._error = 0
+        self._parity = [0]
+
+    def update(self, values):
+        """
+        Add observations.
+
+        Parameters
+        ----------
+        values : array-like
+            Observations. NaN values are ignored.
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+
+        self.n += len(values)
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """
+        Add all observations summarized by another QuantileSketch.
+        """
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+            self._parity.append(0)
+
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate((self.levels[h], items))
+
+        self.n += other.n
+        self._error += other._error
+        self._compress()
+        return self
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            if len(self.levels[h]) > self.k:
+                self._compact(h)
+            h += 1
+
+    def _compact(self, h):
+        items = np.sort(self.levels[h])
+
+        # an odd item out stays in level h
+        if len(items) % 2 == 1:
+            items, kept = items[:-1], items[-1:]
+        else:
+            kept = np.empty(0)
+
+        # alternate the promoted half, so that errors tend to cancel out
+        promoted = items[self._parity[h]::2]
+        self._parity[h] = 1 - self._parity[h]
+        self._error += 2**h
+
+        if h + 1 == len(self.levels):
+            self.levels.append(np.empty(0))
+            self._parity.append(0)
+        self.levels[h] = kept
+        self.levels[h+1] = np.concatenate((self.levels[h+1], promoted))
+
+    def rank_error(self):
+        """
+        Bound on the absolute error in rank of values returned by percentile.
+        """
+        return self._error
+
+    def percentile(self, q):
+        """
+        Approximate percentiles of the observations.
+
+        Analogue of numpy.percentile(x, q, method='nearest'):
+        the returned values have rank within rank_error() of the exact ones.
+
+        Parameters
+        ----------
+        q : float or array of floats in [0,100]
+
+        Returns
+        -------
+        values : float or array
+        """
+        if self.n == 0:
+            raise ValueError("Cannot compute percentiles of empty sketch")
+
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2**h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, cumulative = items[order], np.cumsum(weights[order])
+
+        ranks = np.rint(np.asarray(q, dtype=float) / 100 * (self.n - 1))
+        positions = np.searchsorted(cumulative, ranks + 1, side='left')
+        return items[np.minimum(positions, len(items) - 1)]
@@ -0,0 +1,168 @@
+"""
+Binary on-disk format for Mapper graphs: a directory of .npy files
+(memberships, edges, and attribute columns), with a metadata.json describing them.
+
+Arrays can be opened with mmap_mode='r', so that nothing is read until accessed.
+Columns of Python objects that numpy cannot store natively are kept in metadata.json
+and must be JSON serializable.
+Node ids may be strings, numbers, None, or tuples of these.
+"""
+
+import os
+import json
+import numbers
+
+import numpy as np
+
+from mappertools.mapper.mapper_graph import MapperGraph
+
+
+FORMAT_VERSION = 2
+
+# versions that load_graph reads. Version 1 has no masks of missing attributes,
+# and node ids are stored as plain JSON.
+_READABLE_VERSIONS = (1, 2)
+
+
+def _encode_id(node):
+    # JSON value of a node id, with tuples tagged so they load as tuples
+    if isinstance(node, tuple):
+        return {"tuple": [_encode_id(item) for item in node]}
+    if node is None or isinstance(node, (str, bool, float)):
+        return node
+    if isinstance(node, numbers.Integral):
+        return int(node)
+    raise ValueError("Node id {!r} of type {} cannot be saved".format(node, type(node).__name__))
+
+
+def _decode_id(value):
+    if isinstance(value, dict):
+        return tuple(_decode_id(item) for item in value["tuple"])
+    return value
+
+
+def _save_array(path, name, array, metadata_column):
+    array = np.asarray(array)
+    if array.dtype == object:
+        metadata_column["json"] = array.tolist()
+    else:
+        np.save(os.path.join(path, name + ".npy"), array)
+        metadata_column["file"] = name + ".npy"
+
+
+def _load_array(path, metadata_column, mmap_mode):
+    if "json" in metadata_column:
+        ans = np.empty(len(metadata_column["json"]), dtype=object)
+        ans[:] = metadata_column["json"]
+        return ans
+    return np.load(os.path.join(path, metadata_column["file"]), mmap_mode=mmap_mode)
+
+
+def _save_columns(path, prefix, columns, missing):
+    ans = []
+    for i, (key, column) in enumerate(columns.items()):
+        name = "{}_{}".format(prefix, i)
+        entry = {"key": key}
+        if key in missing:
+            entry["missing"] = {}
+            _save_array(path, name + ".missing", missing[key], entry["missing"])
+        if isinstance(column, tuple):
+            entry["indptr"], entry["values"] = {}, {}
+            _save_array(path, name + ".indptr", column[0], entry["indptr"])
+            _save_array(path, name + ".values", column[1], entry["values"])
+        else:
+            entry["column"] = {}
+            _save_array(path, name, column, entry["column"])
+        ans.append(entry)
+    return ans
+
+
+def _load_columns(path, entries, mmap_mode):
+    ans, missing = {}, {}
+    for entry in entries:
+        if "column" in entry:
+            ans[entry["key"]] = _load_array(path, entry["column"], mmap_mode)
+        else:
+            ans[entry["key"]] = (_load_array(path, entry["indptr"], mmap_mode),
+                                 _load_array(path, entry["values"], mmap_mode))
+        if "missing" in entry:
+            missing[entry["key"]] = _load_array(path, entry["missing"], mmap_mode)
+    return ans, missing
+
+
+def save_graph(graph, path):
+    """
+    Save a Mapper graph to a directory of .npy files.
+
+    Parameters
+    ----------
+    graph : networkx graph, or mappertools.mapper.mapper_graph.MapperGraph
+        For example, output of mappertools.outputs.text_dump.kmapper_to_nxmapper.
+        Nodes must have 'membership' data.
+
+    path : str
+        Directory to write to. Created if it does not exist.
+    """
+    if not isinstance(graph, MapperGraph):
+        graph = MapperGraph.from_networkx(graph)
+    os.makedirs(path, exist_ok=True)
+
+    metadata = {"format_version": FORMAT_VERSION,
+                "node_ids": {}, "node_indptr": {}, "node_indices": {}, "edges": {}}
+    if len(graph.node_ids) > 0 and all(isinstance(node, str) for node in graph.node_ids):
+        _save_array(path, "node_ids", np.array(graph.node_ids, dtype=str), metadata["node_ids"])
+    else:
+        metadata["node_ids"]["json"] = [_encode_id(node) for node in graph.node_ids]
+    _save_array(path, "node_indptr", graph.node_indptr, metadata["node_indptr"])
+    _save_array(path, "node_indices", graph.node_indices, metadata["node_indices"])
+    _save_array(path, "edges", graph.edges_, metadata["edges"])
+    metadata["node_data"] = _save_columns(path, "node_data", graph.node_data, graph.node_missing)
+    metadata["edge_data"] = _save_columns(path, "edge_data", graph.edge_data, graph.edge_missing)
+    metadata["meta_data"] = graph.meta_data
+
+    with open(os.path.join(path, "metadata.json"), 'w', encoding='utf8') as outfile:
+        json.dump(metadata, outfile, ensure_ascii=False)
+
+
+def load_graph(path, mmap_mode=None):
+    """
+    Load a Mapper graph saved by save_graph.
+
+    Parameters
+    ----------
+    path : str
+        Directory written by save_graph.
+
+    mmap_mode : {None, 'r', 'r+', 'c'}
+        As in numpy.load. With 'r', arrays are memory-mapped read-only
+        and only read from disk when accessed.
+
+    Returns
+    -------
+    graph : mappertools.mapper.mapper_graph.MapperGraph
+        Convert with graph.to_networkx() where a networkx graph is needed.
+    """
+    with open(os.path.join(path, "metadata.json"), encoding='utf8') as infile:
+        metadata = json.load(infile)
+    if metadata.get("format_version") not in _READABLE_VERSIONS:
+        raise ValueError("Unsupported format version {}".format(metadata.get("format_version")))
+
+    if "json" in metadata["node_ids"] and metadata["format_version"] >= 2:
+        node_ids = [_decode_id(value) for value in metadata["node_ids"]["json"]]
+    else:
+        node_ids = _load_array(path, metadata["node_ids"], None).tolist()
+    node_data, node_missing = _load_columns(path, metadata["node_data"], mmap_mode)
+    edge_data, edge_missing = _load_columns(path, metadata["edge_data"], mmap_mode)
+    return MapperGraph(node_ids,
+                       _load_array(path, metadata["node_indptr"], mmap_mode),
+                       _load_array(path, metadata["node_indices"], mmap_mode),
+                       _load_array(path, metadata["edges"], mmap_mode),
+                       node_data, edge_data, metadata["meta_data"],
+                       node_missing, edge_missing)
+
+
+def load_nxmapper(path):
+    """
+    Load a Mapper graph saved by save_graph, as a networkx graph.
+    """
+    return load_graph(path).to_networkx()
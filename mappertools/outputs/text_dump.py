@@ -1,3 +1,8 @@
+import os
+import gzip
+import contextlib
+import itertools
+
 import numpy
 import pandas
 import copy
@@ -7,11 +12,48 @@ import json
 import kmapper as km
 
 import mappertools.features.flare_tree as flare_tree
+import mappertools.features.centrality as mcen
+import mappertools.utils.membership as mbr
+from mappertools.mapper.mapper_graph import MapperGraph
 
 
 
 ### ******************** networkx-based outputs ********************
 
+def _compute_member_data(memberships, extra_data, transforms):
+    """
+    For each key of extra_data, compute list of (transformed) data over each membership.
+    """
+    indptr, indices = None, None
+
+    for key, data_map in extra_data.items():
+        if transforms == None or key not in transforms:
+            fun = None
+        else:
+            fun = transforms[key]
+
+        if not isinstance(data_map, (numpy.ndarray, pandas.Series)):
+            if isinstance(fun, str):
+                raise ValueError("Transform '{}' of key {} needs columnar data (numpy array or pandas.Series), "
+                                 "got {}".format(fun, key, type(data_map).__name__))
+            if fun is None:
+                fun = (lambda x:x)
+            yield key, [fun([data_map[k] for k in membership]) for membership in memberships]
+            continue
+
+        # columnar data: gather all members at once
+        if indptr is None:
+            indptr, indices = mbr.memberships_to_csr(memberships)
+        values = mbr.gather(data_map, indices)
+
+        if isinstance(fun, str):
+            yield key, mbr.segment_reduce(values, indptr, fun).tolist()
+        else:
+            if fun is None:
+                fun = (lambda x:x)
+            yield key, [fun(members.tolist()) for members in mbr.csr_to_memberships(indptr, values)]
+
+
 def nxmapper_append_node_member_data(nxgraph, extra_data, transforms=None):
     """
     Assumptions
@@ -20,32 +62,65 @@ def nxmapper_append_node_member_data(nxgraph, extra_data, transforms=None):
 
     Parameters
     ----------
-    extra_data : dict of dicts {key : {index : data}}
+    extra_data : dict of dicts {key : {index : data}}, or pandas.DataFrame
         For each node, for each *key*, append list of *data* corresponding to its list of member *index*es
 
-    transforms: dict {key : function}
-        For each *key*, apply *function* to the extra_data appended to nodes
+        Columnar data, given as a pandas.DataFrame, or as numpy arrays or pandas.Series
+        in place of the inner dicts, is gathered for all nodes at once.
+        Arrays are indexed by position, pandas objects by index label.
+
+    transforms: dict {key : function or str}
+        For each *key*, apply *function* to the extra_data appended to nodes.
+        For columnar data, *function* may also be the name of one of
+        'count', 'sum', 'mean', 'min', 'max', 'mode',
+        which are computed for all nodes at once (see mappertools.utils.membership.segment_reduce).
     """
-    for key, data_map in extra_data.items():
-        if transforms == None or key not in transforms:
-            fun = (lambda x:x)
-        else:
-            fun = transforms[key]
-        for node, membership in nxgraph.nodes.data('membership'):
-            nxgraph.nodes[node][key] = fun([data_map[k] for k in membership])
+    nodes = list(nxgraph.nodes)
+    memberships = [nxgraph.nodes[node]['membership'] for node in nodes]
+
+    for key, values in _compute_member_data(memberships, extra_data, transforms):
+        for node, value in zip(nodes, values):
+            nxgraph.nodes[node][key] = value
 
     return nxgraph
 
 
-def nxmapper_append_centrality_flare_numbers(nxgraph):
+def nxmapper_append_centrality_flare_numbers(nxgraph, k=None, seed=None, n_jobs=1):
+    """
+    Append harmonic ('H'), closeness ('C') and betweenness ('B') centralities of nodes,
+    and indices of the flares they belong to, as node data
+    'Hcentrality', 'Hflare', 'Ccentrality', 'Cflare', 'Bcentrality', 'Bflare'.
+
+    The three centralities are computed together,
+    see mappertools.features.centrality.compute_centralities.
+
+    A MapperGraph, whose node data is read-only, is first converted with to_networkx;
+    use the returned graph.
 
-    choices = ((nx.centrality.harmonic_centrality, "H"),
-               (nx.centrality.closeness_centrality, "C"),
-               (nx.centrality.betweenness_centrality, "B")
+    Parameters
+    ----------
+    nxgraph : networkx graph, or mappertools.mapper.mapper_graph.MapperGraph
+
+    k : int, optional
+        Number of pivots for approximate centralities. Exact if None.
+
+    seed : int, optional
+        Seed of the choice of pivots.
+
+    n_jobs : int
+        Number of processes, over connected components.
+    """
+    if isinstance(nxgraph, MapperGraph):
+        nxgraph = nxgraph.to_networkx()
+    centralities = mcen.compute_centralities(nxgraph, k=k, seed=seed, n_jobs=n_jobs)
+
+    choices = (("harmonic", "H"),
+               ("closeness", "C"),
+               ("betweenness", "B")
                )
 
-    for fun, code in choices:
-        centrality = fun(nxgraph)
+    for name, code in choices:
+        centrality = centralities[name]
         flares = flare_tree.flare_detect(nxgraph, centrality, prune_threshold=0.01)
 
         label = code + 'flare'
@@ -69,24 +144,27 @@ def nxmapper_append_edge_member_data(nxgraph, extra_data, transforms=None):
 
     Parameters
     ----------
-    extra_data : dict of dicts {key : {index : data}}
+    extra_data : dict of dicts {key : {index : data}}, or pandas.DataFrame
         For each edge, for each *key*, append list of *data* corresponding to its list of member *index*es
 
-    transforms: dict {key : function}
-        For each *key*, apply *function* to the extra_data appended to edges
+        Columnar data is handled as in nxmapper_append_node_member_data.
+
+    transforms: dict {key : function or str}
+        For each *key*, apply *function* to the extra_data appended to edges.
+        See nxmapper_append_node_member_data for reductions given by name.
     """
-    for key, data_map in extra_data.items():
-        if transforms == None or key not in transforms:
-            fun = (lambda x:x)
-        else:
-            fun = transforms[key]
-        for u, v, membership in nxgraph.edges.data('membership'):
-            nxgraph.edges[(u,v)][key] = fun([data_map[k] for k in membership])
+    edges = list(nxgraph.edges)
+    memberships = [nxgraph.edges[edge]['membership'] for edge in edges]
+
+    for key, values in _compute_member_data(memberships, extra_data, transforms):
+        for edge, value in zip(edges, values):
+            nxgraph.edges[edge][key] = value
 
     return nxgraph
 
 
-def nxmapper_append_basic_data(nxgraph, counts=True, weights=True, cen_flares=False):
+def nxmapper_append_basic_data(nxgraph, counts=True, weights=True, cen_flares=False,
+                               edge_members=True):
     """
     Convenience function for appending networkx format mapper graph with counts and weights
 
@@ -105,24 +183,50 @@ def nxmapper_append_basic_data(nxgraph, counts=True, weights=True, cen_flares=Fa
     cen_flares : bool
         whether or not to append 'flare index' data to nodes,
         as computed by persistence-based algorithm on centrality filtration
+
+    edge_members : bool
+        whether or not to append 'membership' data (list of shared members) to edges
+
+    Notes
+    -----
+    Shared members are computed at once for all edges from
+    the sparse node x observation incidence matrix M:
+    edge counts are entries of M M^T, and edge memberships are rows of
+    the elementwise product of the rows of M of the endpoints.
     """
 
+    nodes = list(nxgraph.nodes)
+    position = {node: i for i, node in enumerate(nodes)}
+    indptr, indices = mbr.memberships_to_csr(nxgraph.nodes[node]['membership'] for node in nodes)
+    M = mbr.incidence_matrix(indptr, indices)
+
+    edges = list(nxgraph.edges)
+    us = numpy.array([position[u] for u, _ in edges], dtype=numpy.int64)
+    vs = numpy.array([position[v] for _, v in edges], dtype=numpy.int64)
 
     # Append edge membership
-    for u,v in nxgraph.edges:
-        u_mem = set(nxgraph.nodes[u]['membership'])
-        v_mem = set(nxgraph.nodes[v]['membership'])
-        nxgraph.edges[(u,v)]['membership'] =  list(u_mem.intersection(v_mem))
+    if edge_members:
+        shared = M[us].multiply(M[vs]).tocsr()
+        shared.sort_indices()
+        edge_counts = numpy.diff(shared.indptr)
+        for edge, members in zip(edges, mbr.csr_to_memberships(shared.indptr, shared.indices)):
+            nxgraph.edges[edge]['membership'] = members.tolist()
+    else:
+        edge_counts = numpy.asarray((M @ M.T)[us, vs]).ravel()
 
-        if counts:
-            nxgraph.edges[(u,v)]['count'] =  len(nxgraph.edges[(u,v)]['membership'])
-        if weights:
-            nxgraph.edges[(u,v)]['weight'] =  nxgraph.edges[(u,v)]['count'] / len(list(u_mem.union(v_mem)))
+    if counts:
+        for edge, count in zip(edges, edge_counts.tolist()):
+            nxgraph.edges[edge]['count'] = count
+    if weights:
+        node_sizes = numpy.diff(M.indptr)
+        edge_weights = edge_counts / (node_sizes[us] + node_sizes[vs] - edge_counts)
+        for edge, weight in zip(edges, edge_weights.tolist()):
+            nxgraph.edges[edge]['weight'] = weight
 
     # Append node membership counts
     if counts:
-        for node, membership in nxgraph.nodes.data('membership'):
-            nxgraph.nodes[node]["count"] = len(membership)
+        for node, count in zip(nodes, numpy.diff(indptr).tolist()):
+            nxgraph.nodes[node]["count"] = count
 
     if cen_flares:
         nxGraph = nxmapper_append_centrality_flare_numbers(nxgraph)
@@ -180,15 +284,117 @@ def kmapper_to_nxmapper(graph,
 
 ### ******************** cytoscape json outputs ********************
 
-def cytoscapejson_dump(nxgraph, file, positions_scaling = 1.0, positions=None):
-    result_json = nx.readwrite.json_graph.cytoscape_data(nxgraph)
-    if positions is not None:
-        N = len(result_json["elements"]["nodes"])
-        for i in range(N):
-            result_json["elements"]["nodes"][i]["position"] = {"x": positions_scaling * positions[i, 0], "y": positions_scaling * positions[i, 1]}
+def _open_text(file, compress=None, buffer_size=1 << 20):
+    """
+    Open file for writing text, with gzip compression if compress,
+    or if compress is None and the file name ends with '.gz'.
+    File objects are returned as they are, and not closed on exit.
+    """
+    if not isinstance(file, (str, os.PathLike)):
+        return contextlib.nullcontext(file)
+    if compress is None:
+        compress = str(file).endswith('.gz')
+    if compress:
+        return gzip.open(file, 'wt', encoding='utf8')
+    return open(file, 'w', encoding='utf8', buffering=buffer_size)
 
-    with open(file, 'w', encoding='utf8') as outfile:
-       json.dump(result_json, outfile, ensure_ascii=False)
+
+def _write_chunks(outfile, pieces, separator="", chunk_size=1024):
+    """
+    Write strings from a generator, joined in chunks.
+    """
+    first = True
+    for chunk in _chunks(pieces, chunk_size):
+        if not first:
+            outfile.write(separator)
+        outfile.write(separator.join(chunk))
+        first = False
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _cytoscape_nodes(nxgraph, positions=None, positions_scaling=1.0, chunk_size=4096):
+    """
+    JSON strings of node elements, as in networkx.cytoscape_data, with optional positions.
+    """
+    nodes = nxgraph.nodes.data()
+    if positions is not None and len(positions) < len(nxgraph.nodes):
+        raise IndexError("positions has {} rows, for {} nodes".format(len(positions), len(nxgraph.nodes)))
+    if positions is None:
+        rows = itertools.repeat(None)
+    else:
+        rows = (row for start in range(0, len(positions), chunk_size)
+                for row in (positions_scaling * numpy.asarray(positions[start:start+chunk_size, :2], dtype=float)).tolist())
+
+    for (node, node_data), row in zip(nodes, rows):
+        element = {"data": dict(node_data)}
+        element["data"]["id"] = node_data.get("id") or str(node)
+        element["data"]["value"] = node
+        element["data"]["name"] = node_data.get("name") or str(node)
+        if row is not None:
+            element["position"] = {"x": row[0], "y": row[1]}
+        yield json.dumps(element, ensure_ascii=False)
+
+
+def _cytoscape_edges(nxgraph):
+    """
+    JSON strings of edge elements, as in networkx.cytoscape_data.
+    """
+    if nxgraph.is_multigraph():
+        for u, v, key, edge_data in nxgraph.edges(keys=True, data=True):
+            element = {"data": dict(edge_data)}
+            element["data"].update(source=u, target=v, key=key)
+            yield json.dumps(element, ensure_ascii=False)
+    else:
+        for u, v, edge_data in nxgraph.edges.data():
+            element = {"data": dict(edge_data)}
+            element["data"].update(source=u, target=v)
+            yield json.dumps(element, ensure_ascii=False)
+
+
+def cytoscapejson_dump(nxgraph, file, positions_scaling = 1.0, positions=None, compress=None):
+    """
+    Write Mapper graph in cytoscape JSON format, as networkx.cytoscape_data.
+
+    Node and edge elements are generated and written one chunk at a time,
+    so the JSON document is never held in memory as a whole.
+
+    Parameters
+    ----------
+    nxgraph : networkx graph, or mappertools.mapper.mapper_graph.MapperGraph
+
+    file : str, path or file object
+        Output file. File objects must be opened for writing text.
+
+    positions_scaling : float
+
+    positions : array [n_nodes, 2], optional
+        Positions of nodes, in the order of nxgraph.nodes.
+
+    compress : bool, optional
+        Whether to write gzip-compressed output. Defaults to whether the file name ends with '.gz'.
+    """
+    graph_data = nxgraph.graph if hasattr(nxgraph, "graph") else nxgraph.meta_data
+
+    with _open_text(file, compress) as outfile:
+        outfile.write('{"data": ')
+        outfile.write(json.dumps(list(graph_data.items()), ensure_ascii=False))
+        outfile.write(', "directed": {}, "multigraph": {}'.format(json.dumps(nxgraph.is_directed()),
+                                                                  json.dumps(nxgraph.is_multigraph())))
+        outfile.write(', "elements": {"nodes": [')
+        _write_chunks(outfile, _cytoscape_nodes(nxgraph, positions, positions_scaling), ", ")
+        outfile.write('], "edges": [')
+        _write_chunks(outfile, _cytoscape_edges(nxgraph), ", ")
+        outfile.write(']}}')
 
     return nxgraph
 
@@ -196,65 +402,149 @@ def cytoscapejson_dump(nxgraph, file, positions_scaling = 1.0, positions=None):
 
 ### ******************** text file outputs ********************
 
-def kmapper_text_dump(graph, outfile, labels=None):
-    print("Nodes", file=outfile)
+def _kmapper_text_lines(graph, labels=None):
+    yield "Nodes"
     for node, members in graph['nodes'].items():
-        print("#" + node, file=outfile)
-        print(len(members), file=outfile)
+        yield "#" + node
+        yield str(len(members))
 
-        if not labels == None:
+        if labels is not None:
             for mem in members:
-                print(labels[mem], file=outfile)
+                yield str(labels[mem])
         else:
-            print(members, file=outfile)
-
+            yield str(members)
 
-    print("Links", file=outfile)
+    yield "Links"
     for cluster, links in graph['links'].items():
-        print(cluster, file=outfile)
-        print(links, file=outfile)
+        yield str(cluster)
+        yield str(links)
 
-    if not labels == None:
-        print("Labels", file=outfile)
+    if labels is not None:
+        yield "Labels"
         for idx, val in enumerate(labels):
-            print(str(idx) + " " + str(val), file=outfile)
+            yield str(idx) + " " + str(val)
+
 
+def kmapper_text_dump(graph, outfile, labels=None, compress=None):
+    """
+    Write kmapper graph as text: members (or their labels) of each node, then links, then labels.
+
+    Lines are generated and written one chunk at a time.
+
+    Parameters
+    ----------
+    graph : kmapper graph
+
+    outfile : file object, or str or path
+        Output file. File objects must be opened for writing text.
+
+    labels : list or array, optional
+        Labels of members, written in place of member indices.
+
+    compress : bool, optional
+        Whether to write gzip-compressed output, when outfile is a file name.
+        Defaults to whether the file name ends with '.gz'.
+    """
+    with _open_text(outfile, compress) as out:
+        for chunk in _chunks(_kmapper_text_lines(graph, labels), 4096):
+            out.write("\n".join(chunk))
+            out.write("\n")
+
+
+def _compute_averages(data, graph, averager='mean', q=None):
+    """
+    Compute averages of data over members of each node of a kmapper graph.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        Data of observations, in the order of indices used in graph.
+
+    graph : kmapper graph
+
+    averager : str or function
+        Either the name of a reduction in mappertools.utils.membership.SEGMENT_REDUCTIONS
+        (for example 'mean', 'median', 'quantile', 'var'), computed for all nodes at once,
+        or a function applied to the array of data of members of each node.
+
+    q : float in [0,1], optional
+        Quantile to compute, if averager == 'quantile'.
+
+    Returns
+    -------
+    averages : pandas.DataFrame
+        With data columns as index, and nodes as columns.
+    """
+    if isinstance(averager, str) and not isinstance(data, pandas.DataFrame):
+        raise ValueError("Averager '{}' needs data as a pandas.DataFrame, got {}".format(averager, type(data).__name__))
 
-def _compute_averages(data, graph, averager=(lambda x: numpy.mean(x, axis=0))):
     index = list(graph['nodes'].keys())
     columns = list(data.columns)
-    temp = numpy.zeros( (len(index), len(columns)) )
-    for i in range(len(index)):
-        node = index[i]
-        members = graph['nodes'][node]
-        temp[i,:] = averager(data.values[members,:])
+    values = data.values
+
+    if isinstance(averager, str):
+        indptr, indices = mbr.memberships_to_csr(graph['nodes'].values())
+        temp = mbr.segment_reduce(values[indices,:], indptr, averager, q=q)
+    else:
+        temp = numpy.zeros( (len(index), len(columns)) )
+        for i in range(len(index)):
+            node = index[i]
+            members = graph['nodes'][node]
+            temp[i,:] = averager(values[members,:])
     ans = pandas.DataFrame(temp, index=index)
     ans.columns=columns
 
     return ans.T
 
 
-def kmapper_dump_cluster_averages(data, graph, outfile,
-                                  averager=(lambda x: numpy.mean(x, axis=0))):
-    aves = _compute_averages(data, graph, averager)
+def kmapper_dump_cluster_averages(data, graph, outfile, averager='mean', q=None):
+    aves = _compute_averages(data, graph, averager, q)
     aves.to_csv(outfile, index=True, sep='\t')
 
 
 ### ******************** utilities ********************
 
-def kmapper_clean_graph(graph, min_num_members=2):
-    ans = copy.deepcopy(graph)
-    deleted_clusters = set()
+def kmapper_clean_graph(graph, min_num_members=2, inplace=False):
+    """
+    Remove nodes with fewer than min_num_members members from a kmapper graph, and links to them.
+
+    Parameters
+    ----------
+    graph : kmapper graph
 
-    for node in graph['nodes'].keys():
-        if not(len(graph['nodes'][node]) >= min_num_members):
-            del (ans['nodes'])[node]
-            deleted_clusters.add(node)
+    min_num_members : int
 
-    for node in graph['links'].keys():
-        if node in deleted_clusters:
-            del (ans['links'])[node]
-        else:
-            ans['links'][node] = list(set(ans['links'][node]).difference(deleted_clusters))
+    inplace : bool
+        Whether to modify graph itself, instead of returning a new graph.
 
+    Returns
+    -------
+    ans : kmapper graph
+        Unless inplace, a new graph dict. Member lists and other entries
+        (such as 'simplices' and 'meta_data') are shared with graph, not copied.
+    """
+    names = list(graph['nodes'].keys())
+    sizes = numpy.fromiter(map(len, graph['nodes'].values()), dtype=numpy.int64, count=len(names))
+    keep = sizes >= min_num_members
+    kept = set(itertools.compress(names, keep))
+
+    links = graph['links']
+    kept_links = [(node, [target for target in targets if target in kept])
+                  for node, targets in links.items() if node in kept]
+
+    if inplace:
+        ans = graph
+        for node in itertools.compress(names, ~keep):
+            del ans['nodes'][node]
+        for node in [node for node in links if node not in kept]:
+            del links[node]
+        for node, targets in kept_links:
+            links[node][:] = targets
+        return ans
+
+    ans = dict(graph)
+    ans['nodes'] = {node: members for node, members, k in zip(names, graph['nodes'].values(), keep) if k}
+    ans['links'] = copy.copy(links)
+    ans['links'].clear()
+    ans['links'].update(kept_links)
     return ans
@@ -0,0 +1,61 @@
+import pytest
+import numpy as np
+import networkx as nx
+import kmapper as km
+
+import mappertools.outputs.text_dump as td
+import mappertools.outputs.binary as bn
+import mappertools.mapper.covers as cv
+import mappertools.mapper.hierarchical_clustering as hc
+
+
+@pytest.fixture
+def nxgraph():
+    X = np.random.default_rng(0).normal(size=(300,2))
+    graph = km.KeplerMapper(verbose=0).map(X[:,:1], X, clusterer=hc.HeuristicHierarchical(verbose=0),
+                                           cover=cv.EPCover(6,0.4))
+    labels = {i: "entity{}".format(i % 17) for i in range(300)}
+    return td.kmapper_to_nxmapper(graph,
+                                  node_extra_data={'unique_members': labels, 'x': dict(enumerate(X[:,0]))},
+                                  node_transforms={'unique_members': (lambda x: sorted(set(x))), 'x': np.mean})
+
+
+@pytest.mark.parametrize("mmap_mode", [None, 'r'])
+def test_round_trip(nxgraph, tmp_path, mmap_mode):
+    nxgraph.nodes[next(iter(nxgraph))]['note'] = {'a': 1}
+    bn.save_graph(nxgraph, str(tmp_path))
+
+    graph = bn.load_graph(str(tmp_path), mmap_mode=mmap_mode)
+    assert nx.utils.graphs_equal(graph.to_networkx(), nxgraph)
+    assert nx.utils.graphs_equal(bn.load_nxmapper(str(tmp_path)), nxgraph)
+
+    if mmap_mode is not None:
+        assert isinstance(graph.node_indices.base, np.memmap)
+        assert isinstance(graph.node_data['unique_members'][1], np.memmap)
+
+
+def test_plain_graph(tmp_path):
+    G = nx.path_graph(4)
+    for node in G:
+        G.nodes[node]['membership'] = [node, node + 1]
+
+    bn.save_graph(G, str(tmp_path))
+    assert nx.utils.graphs_equal(bn.load_nxmapper(str(tmp_path)), G)
+
+
+def test_tuple_ids_and_none_values(tmp_path):
+    G = nx.Graph()
+    G.add_node((0, 'a'), membership=[0, 1], label=None)
+    G.add_node((1, ('b', 2)), membership=[1, 2], label='x')
+    G.add_node('c', membership=[2])
+    G.add_edge((0, 'a'), (1, ('b', 2)), weight=None)
+    G.add_edge((1, ('b', 2)), 'c', weight=1.5)
+
+    bn.save_graph(G, str(tmp_path))
+    H = bn.load_nxmapper(str(tmp_path))
+    assert nx.utils.graphs_equal(H, G)
+    assert 'label' in H.nodes[(0, 'a')] and 'label' not in H.nodes['c']
+
+    G.add_node(frozenset([1]), membership=[3])
+    with pytest.raises(ValueError):
+        bn.save_graph(G, str(tmp_path / "other"))
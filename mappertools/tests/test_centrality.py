@@ -0,0 +1,48 @@
+import pytest
+import numpy as np
+import networkx as nx
+
+import mappertools.features.centrality as mcen
+
+
+def random_graph():
+    G = nx.disjoint_union(nx.gnm_random_graph(40, 60, seed=0), nx.path_graph(7))
+    G.add_node('isolated')
+    return G
+
+
+def test_exact_centralities():
+    G = random_graph()
+    centralities = mcen.compute_centralities(G)
+
+    expected = {'harmonic': nx.harmonic_centrality(G),
+                'closeness': nx.closeness_centrality(G),
+                'betweenness': nx.betweenness_centrality(G)}
+    for name in mcen.CENTRALITIES:
+        assert centralities[name] == pytest.approx(expected[name])
+
+
+def test_process_pool():
+    G = random_graph()
+    assert mcen.compute_centralities(G, n_jobs=2, min_component_size=1) == mcen.compute_centralities(G)
+
+
+def test_approximate_centralities():
+    G = nx.grid_2d_graph(15, 15)
+    nodes = list(G)
+
+    approximate = mcen.compute_centralities(G, k=60, seed=0)
+    assert approximate == mcen.compute_centralities(G, k=60, seed=0)
+
+    # all sources sampled: exact
+    sampled, exact = mcen.compute_centralities(G, k=len(G), seed=0), mcen.compute_centralities(G)
+    for name in mcen.CENTRALITIES:
+        assert sampled[name] == pytest.approx(exact[name])
+
+    expected = nx.betweenness_centrality(G)
+    correlation = np.corrcoef([approximate['betweenness'][v] for v in nodes],
+                              [expected[v] for v in nodes])[0,1]
+    assert correlation > 0.9
+
+    expected = nx.closeness_centrality(G)
+    assert [approximate['closeness'][v] for v in nodes] == pytest.approx([expected[v] for v in nodes], rel=0.2)
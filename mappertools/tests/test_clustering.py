@@ -22,3 +22,20 @@ def test_two_clustering_kmeans():
     for i in range(100):
         assert labels[i] == labels[0]
         assert labels[i+100] == labels[100]
+
+
+def test_kmedoids_distance_cache():
+    import mappertools.mapper.distances as dst
+
+    X = np.random.rand(40,3)
+    Y = np.random.rand(40,3) + np.array([[10,5,1]])
+    data = np.concatenate((X,Y),axis=0)
+    cache = dst.DistanceCache(data)
+
+    # every other observation, passed by index
+    indices = np.arange(0, 80, 2)[:,np.newaxis]
+    labels = mclust.kMedoids(metric="euclidean", heuristic=2, prefix=None, distance_cache=cache).fit(indices).labels_
+    for i in range(20):
+        assert labels[i] == labels[0]
+        assert labels[i+20] == labels[20]
+    assert labels[0] != labels[20]
@@ -1,6 +1,7 @@
 import pytest
 import mappertools.mapper.covers as cv
 import numpy as np
+import itertools
 
 def test_uniform_no_overlap():
     lb, ub = cv.uniform_cover_fences(0,10,2,0)
@@ -52,3 +53,141 @@ def test_epcover_2d():
 
     cov = cv.EPCover(13,0.42)
     cov.fit(data)
+
+
+def brute_force_patches(cov, data):
+    data_dim = data.shape[1] - 1
+    patches = []
+    for rect in itertools.product(range(cov.resolution), repeat=data_dim):
+        rect_lb = cov.lower_bounds[rect, range(data_dim)]
+        rect_ub = cov.upper_bounds[rect, range(data_dim)]
+        member_bool = np.all(np.logical_and(rect_lb <= data[:,1:], data[:,1:] <= rect_ub), axis=1)
+        patches.append(data[member_bool,:])
+    return patches
+
+
+@pytest.mark.parametrize("dim", [1, 2, 3])
+def test_epcover_transform_brute_force(dim):
+    N = 500
+    data = np.c_[np.arange(N), np.random.normal(size=(N,dim))]
+
+    for fit in ['fit', 'fit_sakmapper']:
+        cov = cv.EPCover(6,0.3)
+        getattr(cov, fit)(data)
+
+        patches = cov.transform(data)
+        expected = brute_force_patches(cov, data)
+        assert len(patches) == len(expected)
+        for patch, exp in zip(patches, expected):
+            assert np.array_equal(patch, exp)
+
+        memberships = cov.transform_indices(data)
+        for cube, patch in enumerate(expected):
+            if len(patch) == 0:
+                assert cube not in memberships
+            else:
+                assert np.array_equal(memberships[cube], patch[:,0].astype(int))
+
+
+def test_epcover_lazy():
+    N = 300
+    data = np.c_[np.arange(N), np.random.normal(size=(N,4))]
+
+    eager = cv.EPCover(8,0.3)
+    eager_centers = eager.fit(data)
+    eager_patches = eager.transform(data)
+
+    lazy = cv.EPCover(8,0.3, lazy=True)
+    lazy_centers = list(lazy.fit(data))
+    lazy_patches = lazy.transform(data)
+
+    occupied = [cube for cube, patch in enumerate(eager_patches) if len(patch) > 0]
+    assert np.array_equal(lazy.occupied_cubes(data), occupied)
+    assert len(lazy_centers) == len(lazy_patches) == len(occupied)
+
+    for i, cube in enumerate(occupied):
+        assert np.allclose(lazy_centers[i], eager_centers[cube])
+        assert np.array_equal(lazy_patches[i], eager_patches[cube])
+
+    for cube, members in lazy.iter_transform(data):
+        assert np.array_equal(data[members,:], eager_patches[cube])
+
+
+
+def test_epcover_lazy_high_dimension(capsys):
+    # 20^16 rectangles do not fit in int64: they are keyed by tuples of interval indices
+    N = 200
+    data = np.c_[np.arange(N), np.random.normal(size=(N,16))]
+    lazy = cv.EPCover(20,0.2, lazy=True, verbose=1)
+    centers = list(lazy.fit(data))
+    patches = lazy.transform(data)
+    cubes = lazy.occupied_cubes(data)
+    assert len(centers) == len(patches) == len(cubes)
+    assert cubes == sorted(cubes)
+
+    for cube, members in lazy.iter_transform(data):
+        rect = list(cube)
+        inside = np.all((lazy.lower_bounds[rect, range(16)] <= data[:,1:]) &
+                        (data[:,1:] <= lazy.upper_bounds[rect, range(16)]), axis=1)
+        assert np.array_equal(members, np.flatnonzero(inside))
+    points, _ = cv.cube_memberships(data[:,1:], lazy.lower_bounds, lazy.upper_bounds)
+    assert sum(len(patch) for patch in patches) == len(points)
+
+    out = capsys.readouterr().out
+    assert "members in cube {}".format(str(cubes[0])) in out
+
+
+def test_epcover_fences_percentiles():
+    N = 1000
+    data = np.c_[np.arange(N), np.random.normal(size=(N,2))]
+
+    cov = cv.EPCover(7,0.4)
+    cov.fit(data)
+
+    lb, ub = cv.uniform_cover_fences(0,100,7,0.4)
+    for i in range(7):
+        assert np.array_equal(cov.lower_bounds[i], np.percentile(data[:,1:], lb[i], axis=0, method='nearest'))
+        assert np.array_equal(cov.upper_bounds[i], np.percentile(data[:,1:], ub[i], axis=0, method='nearest'))
+
+
+def test_epcover_streaming(tmp_path):
+    N = 20000
+    data = np.lib.format.open_memmap(tmp_path / "lens.npy", mode='w+', dtype=float, shape=(N,3))
+    data[:,0] = np.arange(N)
+    data[:,1:] = np.random.normal(size=(N,2))
+
+    exact = cv.EPCover(5,0.3)
+    exact.fit(data)
+
+    streaming = cv.EPCover(5,0.3).fit_streaming(data, sketch_size=128, chunk_size=3000)
+    assert streaming.rank_error_ < 0.1
+    for dim in range(2):
+        column = np.sort(data[:,dim+1])
+        for bounds in ['lower_bounds', 'upper_bounds']:
+            exact_ranks = np.searchsorted(column, getattr(exact, bounds)[:,dim])
+            streaming_ranks = np.searchsorted(column, getattr(streaming, bounds)[:,dim])
+            assert np.all(np.abs(exact_ranks - streaming_ranks) <= streaming.rank_error_ * N)
+
+    memberships = streaming.transform_indices(data)
+    chunked = {}
+    for chunk_memberships in streaming.transform_chunks(data, chunk_size=3000):
+        for cube, ids in chunk_memberships.items():
+            chunked.setdefault(cube, []).append(ids)
+    assert set(chunked) == set(memberships)
+    for cube, members in memberships.items():
+        assert np.array_equal(np.concatenate(chunked[cube]), members)
+
+
+def test_epcover_streaming_empty():
+    cover = cv.EPCover(4,0.2)
+    for chunks in [[], [np.zeros((0,3))], np.zeros((0,3))]:
+        with pytest.raises(ValueError):
+            cover.fit_streaming(chunks)
+
+
+def test_cube_numbers_fit():
+    assert cv._numbers_fit(20, 14)
+    assert not cv._numbers_fit(20, 15)
+    assert not cv._numbers_fit(np.int64(20), np.int64(16))
+    assert not cv._numbers_fit(np.int32(2), 64)
+    assert cv._numbers_fit(np.int32(2), 63)
@@ -0,0 +1,48 @@
+import numpy as np
+
+import mappertools.mapper.covers as cv
+import mappertools.mapper.cube_clustering as cc
+import mappertools.mapper.hierarchical_clustering as hc
+
+
+def test_parallel_matches_serial():
+    N = 600
+    X = np.random.normal(size=(N,3))
+    lens = np.c_[np.arange(N), X[:,0]]
+
+    cov = cv.EPCover(8,0.4)
+    cov.fit(lens)
+    clusterer = hc.HeuristicHierarchical(heuristic='sil', verbose=0)
+
+    for cubes in [cov.transform(lens), cov.transform_indices(lens)]:
+        serial = cc.fit_cubes(X, cubes, clusterer, n_jobs=1)
+        parallel = cc.fit_cubes(X, cubes, clusterer, n_jobs=2, chunksize=3)
+
+        assert list(serial) == list(parallel)
+        for cube in serial:
+            assert np.array_equal(serial[cube], parallel[cube])
+
+
+def test_small_cubes_inline():
+    X = np.random.normal(size=(5,2))
+    cubes = {0: np.array([0]), 1: np.array([], dtype=int), 2: np.array([1,2,3,4])}
+
+    labels = cc.fit_cubes(X, cubes, hc.HeuristicHierarchical(verbose=0), n_jobs=2, min_samples=10)
+    assert list(labels) == [0, 2]
+    assert len(labels[0]) == 1
+    assert len(labels[2]) == 4
+
+
+def test_worker_closes_shared_memory():
+    import multiprocessing.shared_memory
+    X = np.arange(6.).reshape(3,2)
+    shm = multiprocessing.shared_memory.SharedMemory(create=True, size=X.nbytes)
+    try:
+        cc._init_worker(shm.name, X.shape, X.dtype, None)
+        worker_shm = cc._worker['shm']
+        cc._close_worker()
+        assert cc._worker == {}
+        assert worker_shm.buf is None
+    finally:
+        shm.close()
+        shm.unlink()
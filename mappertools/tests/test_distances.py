@@ -31,3 +31,54 @@ def test_mahalanobis_dissimilarity():
     assert dissim.shape[0] == dissim.shape[1]
     assert np.allclose(dissim, dissim.T)
     assert np.all(np.diagonal(dissim) ==  0)
+
+
+def test_distance_cache_slicing():
+    X = np.random.randn(50,4)
+    cache = dst.DistanceCache(X, metric='cityblock')
+
+    indices = np.array([3, 17, 5, 42, 0])
+    expected = scipy.spatial.distance.pdist(X[indices], metric='cityblock')
+    assert np.allclose(cache.condensed(indices), expected)
+    assert np.allclose(cache.submatrix(indices), scipy.spatial.distance.squareform(expected))
+
+
+def test_distance_cache_memmap(tmp_path):
+    X = np.random.randn(30,3)
+    filename = tmp_path / "dists.npy"
+    cache = dst.DistanceCache(X, filename=filename, block_size=7)
+    assert np.allclose(cache.dists, scipy.spatial.distance.pdist(X))
+
+    loaded = dst.DistanceCache.load(filename)
+    assert loaded.n_samples == 30
+
+    indices = np.arange(30)[::-3]
+    assert np.allclose(loaded.submatrix(indices),
+                       scipy.spatial.distance.squareform(scipy.spatial.distance.pdist(X[indices])))
+
+
+def test_distance_cache_validate_indices():
+    indices = dst.DistanceCache.validate_indices(np.array([[3.0], [1.0], [2.0]]))
+    assert indices.dtype.kind == 'i'
+    assert np.array_equal(indices, [3, 1, 2])
+
+    with pytest.raises(ValueError):
+        dst.DistanceCache.validate_indices(np.zeros((3, 2)))
+
+
+def test_distance_cache_condensed_memory():
+    import tracemalloc
+    X = np.random.randn(400,3)
+    cache = dst.DistanceCache(X)
+
+    indices = np.r_[np.random.permutation(400)[:300], 7, 7]
+    expected = scipy.spatial.distance.pdist(X[indices])
+
+    tracemalloc.start()
+    try:
+        ans = cache.condensed(indices)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert np.allclose(ans, expected)
+    assert peak < 1.5 * ans.nbytes
@@ -77,4 +77,92 @@ def test_flare_and_island():
     k, components = fb.compute_flareness(G, 'foo')
     assert len(k) == 2
 
-    assert set(k) == {4, np.inf}
+    # components are ordered by their first node in G
+    assert k == [4, np.inf]
+    assert [min(L) for L in components] == [2, 6]
+
+
+def test_entity_node_index():
+    G = nx.path_graph(6)
+    for node in G.nodes:
+        G.nodes[node]['unique_members'] = ['foo', 'baz'] if node % 2 else ['foo']
+    G.nodes[0]['unique_members'] = ['bar']
+
+    index = fc.EntityNodeIndex(G)
+    for entity in ['foo', 'bar', 'baz', 'missing']:
+        assert list(fc.get_nodes_containing_entity(G, entity, index=index)) == list(fc.get_nodes_containing_entity(G, entity))
+    assert len(index) == 3
+
+    k, components = fb.compute_flareness(G, 'foo', index=index)
+    assert k == [4]
+
+
+def random_entity_graph(seed):
+    rng = np.random.default_rng(seed)
+    G = nx.gnm_random_graph(60, 80, seed=seed)
+    G.add_node(100)
+    entities = ['e{}'.format(i) for i in range(12)]
+    for node in G.nodes:
+        G.nodes[node]['unique_members'] = list(rng.choice(entities, size=rng.integers(0,5), replace=False))
+    return G, entities + ['missing']
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_all_summary_batch(n_jobs):
+    G, entities = random_entity_graph(0)
+
+    # a weight other than the default unit_weight uses compute_flareness for each entity
+    expected = fb.compute_all_summary(G, entities, weight=(lambda v,u,e: 1), keep_missing=True)
+    ans = fb.compute_all_summary(G, entities, keep_missing=True, n_jobs=n_jobs, chunksize=5)
+
+    assert list(ans.index) == list(expected.index) == entities
+    assert ans.equals(expected)
+    assert list(ans.dtypes) == list(expected.dtypes) == [object] * 3
+    for entity in entities[:-1]:
+        assert ans.loc[entity, 'flare_sig'] == expected.loc[entity, 'flare_sig']
+    assert np.isnan(ans.loc['missing', 'flare_sig'])
+
+    # signatures are ordered by first node in G, also for string node names
+    G = nx.relabel_nodes(G, {node: "cube{}_cluster{}".format(node % 7, node) for node in G})
+    expected = fb.compute_all_summary(G, entities, weight=(lambda v,u,e: 1))
+    ans = fb.compute_all_summary(G, entities, n_jobs=n_jobs)
+    assert list(ans['flare_sig']) == list(expected['flare_sig'])
+
+
+def test_all_summary_verbose(capsys):
+    G, entities = random_entity_graph(0)
+    fb.compute_all_summary(G, entities, verbose=1)
+
+    out = capsys.readouterr().out
+    assert "core: " in out
+    assert "Entity missing not found" in out
+
+
+def test_flareness_bfs_matches_dijkstra():
+    G, entities = random_entity_graph(1)
+    arrays = fc.GraphArrays(G)
+    nx.set_edge_attributes(G, 0.5, 'weight')
+
+    for entity in entities[:-1]:
+        k_dijkstra, components = fb.compute_flareness(G, entity, weight=(lambda v,u,e: 1))
+        expected = list(zip(k_dijkstra, map(sorted, components)))
+        assert [L[0] for _, L in expected] == sorted(L[0] for _, L in expected)
+
+        for kwargs in [{}, {'unweighted': True}, {'arrays': arrays}]:
+            k, components = fb.compute_flareness(G, entity, **kwargs)
+            assert list(zip(k, map(sorted, components))) == expected
+
+        # constant edge attribute is detected
+        k, _ = fb.compute_flareness(G, entity, weight='weight')
+        assert sorted(k) == sorted(x * 0.5 for x in k_dijkstra)
+
+
+def test_flareness_real_weights():
+    G = nx.path_graph(4)
+    for node in G.nodes:
+        G.nodes[node]['unique_members'] = ['foo']
+    G.nodes[0]['unique_members'] = ['bar']
+    nx.set_edge_attributes(G, {(0,1): 1.0, (1,2): 1.0, (2,3): 3.0}, 'weight')
+
+    k, _ = fb.compute_flareness(G, 'foo', weight='weight')
+    assert k == [4.0]
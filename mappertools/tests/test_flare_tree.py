@@ -1,6 +1,7 @@
 import pytest
 import mappertools.features.flare_tree as flr
 import networkx as nx
+import numpy as np
 
 
 def test_path_flares():
@@ -24,3 +25,69 @@ def test_star_flares():
     cen = nx.centrality.harmonic_centrality(G)
     flares = flr.flare_detect(G,cen)
     assert len(flares) == 10
+
+
+def reference_flare_detect(G, centrality, prune_threshold=0):
+    # tree-based implementation, for comparison
+    flare_trees = set([])
+    for node, cur_cen in sorted(centrality.items(), key=(lambda item: item[1])):
+        neighbors = [nbr for nbr in G[node] if centrality[nbr] <= cur_cen]
+        death_candidates = [tree for tree in flare_trees if tree.intersects(neighbors)]
+        if len(death_candidates) == 0:
+            flare_trees.add(flr.FlareTree(flare=flr.Flare(node, cur_cen)))
+        else:
+            elder_tree = min(death_candidates, key=(lambda tree: tree.flare.birth[0]))
+            for tree in death_candidates:
+                if tree != elder_tree:
+                    flare_trees.remove(tree)
+                    tree.flare.death = (cur_cen, node)
+                    elder_tree.add_subtree(tree)
+                    if tree.flare.lifespan() < prune_threshold:
+                        elder_tree.collapse_subtree(tree)
+            elder_tree.flare.nodes.add(node)
+    return flr.sort_flares(flr.unpack_flares(flare_trees))
+
+
+def flare_summary(flares):
+    return sorted((flare.birth, flare.death[0], sorted(flare.nodes)) for flare in flares)
+
+
+@pytest.mark.parametrize("prune_threshold", [0, 0.2, 0.5])
+def test_matches_reference(prune_threshold):
+    rng = np.random.default_rng(0)
+    for seed in range(5):
+        G = nx.gnm_random_graph(80, 100, seed=seed)
+        cen = {n: rng.random() for n in G.nodes}
+
+        flares, pairs = flr.flare_detect(G, cen, prune_threshold=prune_threshold, return_pairs=True)
+        expected = reference_flare_detect(G, cen, prune_threshold=prune_threshold)
+
+        assert flare_summary(flares) == flare_summary(expected)
+        assert pairs.shape == (len(flares), 2)
+        lifespans = pairs[:,1] - pairs[:,0]
+        assert np.all(lifespans[:-1] >= lifespans[1:])
+
+
+def test_attribute_centrality():
+    G = nx.generators.classic.star_graph(10)
+    nx.set_node_attributes(G, nx.centrality.harmonic_centrality(G), 'harmonic')
+    assert len(flr.flare_detect(G, 'harmonic')) == 10
+
+
+def test_tied_births():
+    G = nx.generators.classic.path_graph(3)
+
+    # of the flares born at equal centrality, the one listed first in centrality survives
+    for first, second in [(0, 2), (2, 0)]:
+        flares = flr.flare_detect(G, {first: 0, second: 0, 1: 1})
+        assert [(flare.birth, flare.death, flare.nodes) for flare in flares] == \
+            [((0, first), (np.inf, None), {first, 1}), ((0, second), (1, 1), {second})]
+
+    # (birth, death) pairs do not depend on how ties are broken
+    for seed in range(5):
+        G = nx.gnm_random_graph(80, 100, seed=seed)
+        cen = {n: round(c, 1) for n, c in nx.centrality.harmonic_centrality(G).items()}
+        flares = flr.flare_detect(G, cen)
+        assert flr.flare_detect(G, cen)[0].nodes == flares[0].nodes
+        expected = reference_flare_detect(G, cen)
+        assert sorted((f.birth[0], f.death[0]) for f in flares) == sorted((f.birth[0], f.death[0]) for f in expected)
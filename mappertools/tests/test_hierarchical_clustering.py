@@ -2,8 +2,10 @@ import pytest
 import scipy.cluster.hierarchy
 import scipy.spatial.distance as spd
 import numpy as np
+import sklearn.metrics
 
 import mappertools.mapper.hierarchical_clustering as hc
+import mappertools.mapper.distances as dst
 
 # artificial data with "obvious" clustering
 X = np.array([[0,0,0],
@@ -32,6 +34,10 @@ def test_num_clusters():
         assert len(set(labels)) == i+1
         assert t == hc.cluster_number_to_threshold(len(set(labels)), merge_distances)
 
+    ks = np.arange(0, len(merge_distances) + 3)
+    expected = [hc.cluster_number_to_threshold(k, merge_distances) for k in ks]
+    assert np.array_equal(hc.cluster_number_to_threshold(ks, merge_distances, check=False), expected)
+
 
 def test_heuristics():
     fg = hc.HeuristicHierarchical(heuristic='firstgap').fit(X)
@@ -75,3 +81,140 @@ def test_local_PCA_with_clustering():
 
     sil = hc.HeuristicHierarchical(heuristic='sil', pre_transform=pt).fit(X)
     assert len(np.unique(sil.labels_)) == 3
+
+
+def test_silhouette_sweep():
+    Y = np.random.normal(size=(60,3))
+    D = spd.squareform(spd.pdist(Y))
+
+    for method in ['single', 'average', 'complete']:
+        Z = scipy.cluster.hierarchy.linkage(spd.pdist(Y), method=method)
+        for k, t, score in hc.silhouette_sweep(D, Z):
+            labels = scipy.cluster.hierarchy.fcluster(Z, t, criterion='distance')
+            assert len(np.unique(labels)) == k
+            assert np.isclose(score, sklearn.metrics.silhouette_score(D, labels, metric='precomputed'))
+
+
+def test_silhouette_heuristic_brute_force():
+    Y = np.random.normal(size=(80,2))
+    Z = scipy.cluster.hierarchy.linkage(Y, method='average')
+
+    fast_labels, fast_k = hc.statistic_heuristic_hierarchical(Y, 'euclidean', Z, k_max=10)
+    slow_labels, slow_k = hc.statistic_heuristic_hierarchical(Y, 'euclidean', Z, k_max=10,
+                                                              statistic=(lambda *args: hc.negative_silhouette(*args)))
+    assert fast_k == slow_k
+    assert np.all(fast_labels == slow_labels)
+
+
+def test_statistic_heuristic_monotonic_cuts():
+    Y = np.round(np.random.default_rng(0).normal(size=(80,2)), 1)
+    Z = scipy.cluster.hierarchy.linkage(Y, method='single')
+    statistic = lambda *args: hc.negative_silhouette(*args)
+
+    for k_max in [np.inf, 10]:
+        known = hc.statistic_heuristic_hierarchical(Y, 'euclidean', Z, k_max, statistic, monotonic=True)
+        checked = hc.statistic_heuristic_hierarchical(Y, 'euclidean', Z, k_max, statistic, monotonic=False)
+        assert known[1] == checked[1]
+        assert np.all(known[0] == checked[0])
+
+
+def test_silhouette_sweep_condensed():
+    Y = np.random.normal(size=(40,2))
+    dists = spd.pdist(Y)
+    Z = scipy.cluster.hierarchy.linkage(dists, method='average')
+
+    condensed = list(hc.silhouette_sweep(dists, Z))
+    redundant = list(hc.silhouette_sweep(spd.squareform(dists), Z))
+    assert np.allclose(condensed, redundant)
+
+
+def test_heuristics_verbose_report(capsys):
+    sil = hc.HeuristicHierarchical(heuristic='sil', verbose=2).fit(X)
+    assert len(np.unique(sil.labels_)) == 3
+
+    out = capsys.readouterr().out
+    assert "cophentic correlation distance" in out
+    assert "silhouette score" in out
+
+
+def test_heuristics_distance_cache():
+    cache = dst.DistanceCache(X)
+    indices = np.arange(len(X))[:,np.newaxis]
+
+    for heuristic in ['firstgap', 'sil']:
+        direct = hc.HeuristicHierarchical(heuristic=heuristic).fit(X)
+        cached = hc.HeuristicHierarchical(heuristic=heuristic, distance_cache=cache).fit(indices)
+        assert np.all(direct.labels_ == cached.labels_)
+
+
+def test_heuristics_mst():
+    Y = np.r_[X, np.random.default_rng(0).normal(size=(50,3))]
+    for heuristic in ['firstgap', 'midgap', 'sil']:
+        full = hc.HeuristicHierarchical(heuristic=heuristic).fit(Y)
+        mst = hc.HeuristicHierarchical(heuristic=heuristic, mst=True).fit(Y)
+        assert sklearn.metrics.adjusted_rand_score(full.labels_, mst.labels_) == 1
+
+    # metrics of mst are also valid for pdist, used by the silhouette heuristic
+    for metric in hc.MST_METRICS:
+        mst = hc.HeuristicHierarchical(heuristic='sil', metric=metric, mst=True).fit(Y)
+        full = hc.HeuristicHierarchical(heuristic='sil', metric=metric).fit(Y)
+        assert sklearn.metrics.adjusted_rand_score(full.labels_, mst.labels_) == 1
+
+    with pytest.raises(RuntimeError):
+        hc.HeuristicHierarchical(metric='manhattan', mst=True)
+    with pytest.raises(RuntimeError):
+        hc.HeuristicHierarchical(method='average', mst=True)
+    with pytest.raises(RuntimeError):
+        hc.HeuristicHierarchical(metric='precomputed', mst=True)
+
+
+def test_stratified_sample():
+    Y = np.random.default_rng(0).normal(size=(1000,2)) * [10, 1]
+    sample = hc._stratified_sample(Y, 50, random_state=0)
+    assert len(np.unique(sample)) == 50
+    assert np.array_equal(sample, hc._stratified_sample(Y, 50, random_state=0))
+
+    # one point per stratum of 20 along the long axis
+    ranks = np.argsort(np.argsort(Y[:,0]))
+    assert np.array_equal(np.sort(ranks[sample]) // 20, np.arange(50))
+
+
+def test_heuristics_sampled(capsys):
+    rng = np.random.default_rng(1)
+    Y = np.concatenate([rng.normal(size=(300,3)) + center for center in X[[0,4,8]]])
+
+    exact = hc.HeuristicHierarchical(heuristic='firstgap').fit(Y)
+    sampled = hc.HeuristicHierarchical(heuristic='firstgap', sample_size=60, random_state=0, verbose=2).fit(Y)
+    assert len(sampled.labels_) == len(Y)
+    assert len(sampled.sample_indices_) == 60
+    assert sklearn.metrics.adjusted_rand_score(exact.labels_, sampled.labels_) == 1
+    assert sampled.agreement_ == 1
+    assert "agreement with exact clustering" in capsys.readouterr().out
+
+    small = hc.HeuristicHierarchical(heuristic='sil', sample_size=100).fit(X)
+    assert small.sample_indices_ is None
+    assert len(np.unique(small.labels_)) == 3
+
+    with pytest.raises(RuntimeError):
+        hc.HeuristicHierarchical(metric='precomputed', sample_size=100)
+
+
+def test_sampled_attributes_few_points():
+    model = hc.HeuristicHierarchical(sample_size=10, min_samples=2).fit(X[:2])
+    assert model.sample_indices_ is None
+    assert model.agreement_ is None
+
+
+def test_sampled_scipy_only_metric():
+    rng = np.random.default_rng(2)
+    Y = np.concatenate([rng.dirichlet(alpha, size=150) for alpha in ([20,1,1], [1,20,1], [1,1,20])])
+    model = hc.HeuristicHierarchical(heuristic='firstgap', metric='jensenshannon',
+                                     sample_size=60, random_state=0).fit(Y)
+    assert len(model.labels_) == len(Y)
+    assert len(np.unique(model.labels_)) == 3
+
+    sample = model.sample_indices_
+    sample_labels = model.labels_[sample]
+    np.testing.assert_array_equal(
+        hc._assign_to_nearest(Y, sample, sample_labels, 'jensenshannon', chunk_elements=1),
+        model.labels_)
@@ -0,0 +1,34 @@
+import pytest
+import numpy as np
+import scipy.cluster.hierarchy
+
+import mappertools.mapper.linkage_cut as lc
+
+
+@pytest.mark.parametrize("method", ['single', 'average', 'complete', 'ward', 'centroid', 'median'])
+def test_matches_fcluster(method):
+    X = np.random.default_rng(0).normal(size=(80,2))
+    X[:5] = X[0]
+    Z = scipy.cluster.hierarchy.linkage(X, method=method)
+
+    thresholds = np.r_[np.unique(Z[:,2]), -1.0]
+    labels = lc.cut_linkage(Z, threshold=thresholds)
+    assert labels.shape == (80, len(thresholds))
+
+    for t, cut in zip(thresholds, labels.T):
+        expected = scipy.cluster.hierarchy.fcluster(Z, t, criterion='distance')
+        assert np.array_equal(cut, expected)
+        assert np.array_equal(lc.cut_linkage(Z, threshold=t), expected)
+        assert lc.number_of_clusters(Z, t) == expected.max()
+
+
+def test_number_of_clusters():
+    X = np.random.default_rng(1).normal(size=(50,3))
+    Z = scipy.cluster.hierarchy.linkage(X, method='average')
+
+    ks = [1, 2, 7, 49, 50]
+    labels = lc.cut_linkage(Z, k=ks)
+    for k, cut in zip(ks, labels.T):
+        assert cut.max() == k
+        t = Z[-k,2] if k < 50 else 0
+        assert np.array_equal(cut, scipy.cluster.hierarchy.fcluster(Z, t, criterion='distance'))
@@ -0,0 +1,138 @@
+import pytest
+import numpy as np
+import networkx as nx
+import kmapper as km
+
+import mappertools.outputs.text_dump as td
+import mappertools.features.core as fc
+import mappertools.features.flare_balls as fb
+import mappertools.features.flare_tree as flr
+import mappertools.features.centrality as mcen
+import mappertools.features.mapper_stats as ms
+import mappertools.mapper.covers as cv
+import mappertools.mapper.pipeline as mp
+import mappertools.mapper.hierarchical_clustering as hc
+from mappertools.mapper.mapper_graph import MapperGraph
+
+
+@pytest.fixture
+def kmapper_graph():
+    X = np.random.default_rng(0).normal(size=(300,2))
+    return km.KeplerMapper(verbose=0).map(X[:,:1], X, clusterer=hc.HeuristicHierarchical(verbose=0),
+                                          cover=cv.EPCover(6,0.4))
+
+
+def entity_nxgraph(kmapper_graph):
+    labels = {i: "entity{}".format(i % 17) for i in range(300)}
+    return td.kmapper_to_nxmapper(kmapper_graph,
+                                  node_extra_data={'unique_members': labels},
+                                  node_transforms={'unique_members': (lambda x: sorted(set(x)))})
+
+
+def test_kmapper_round_trip(kmapper_graph):
+    graph = MapperGraph.from_kmapper(kmapper_graph).to_kmapper()
+    assert graph['nodes'] == kmapper_graph['nodes']
+    assert {k: v for k, v in graph['links'].items() if v} == {k: v for k, v in kmapper_graph['links'].items() if v}
+
+
+def test_networkx_round_trip(kmapper_graph):
+    G = entity_nxgraph(kmapper_graph)
+    mapper_graph = MapperGraph.from_networkx(G)
+
+    assert isinstance(mapper_graph.node_data['count'], np.ndarray)
+    assert isinstance(mapper_graph.node_data['unique_members'], tuple)
+    assert nx.utils.graphs_equal(mapper_graph.to_networkx(), G)
+
+    indptr, indices = mapper_graph.edge_memberships()
+    for e, (u, v) in enumerate(mapper_graph.edges):
+        assert indices[indptr[e]:indptr[e+1]].tolist() == G.edges[u, v]['membership']
+        assert mapper_graph.edges[u, v]['weight'] == G.edges[u, v]['weight']
+        assert mapper_graph.edge_position(u, v) == mapper_graph.edge_position(v, u) == e
+
+    non_edge = next((u, v) for u in G for v in G if u != v and not G.has_edge(u, v))
+    with pytest.raises(KeyError):
+        mapper_graph.edge_position(*non_edge)
+
+    node, (u, v) = list(G)[0], list(G.edges)[0]
+    with pytest.raises(TypeError):
+        mapper_graph.nodes[node]['count'] = 0
+    with pytest.raises(TypeError):
+        mapper_graph.edges[u, v]['weight'] = 0
+
+    H = mapper_graph.subgraph(list(G)[:10])
+    assert nx.utils.graphs_equal(H.to_networkx(), G.subgraph(list(G)[:10]))
+
+
+def test_pipeline_export():
+    X = np.random.default_rng(1).normal(size=(200,2))
+    pipeline = mp.MapperPipeline(cv.EPCover(4,0.3), hc.HeuristicHierarchical(verbose=0)).fit(X, X[:,0])
+    mapper_graph = pipeline.to_mapper_graph()
+
+    G = pipeline.to_networkx()
+    assert set(mapper_graph.nodes) == set(G.nodes)
+    assert {frozenset(e) for e in mapper_graph.edges} == {frozenset(e) for e in G.edges}
+    assert np.array_equal(mapper_graph.edge_counts(), pipeline.edge_counts_)
+
+
+def test_features(kmapper_graph):
+    G = entity_nxgraph(kmapper_graph)
+    mapper_graph = MapperGraph.from_networkx(G)
+    entities = ["entity{}".format(i) for i in range(17)]
+
+    expected = fb.compute_all_summary(G, entities)
+    assert fb.compute_all_summary(mapper_graph, entities).equals(expected)
+
+    for entity in entities[:3]:
+        k, components = fb.compute_flareness(mapper_graph, entity)
+        expected_k, expected_components = fb.compute_flareness(G, entity)
+        assert sorted(zip(k, map(sorted, components))) == sorted(zip(expected_k, map(sorted, expected_components)))
+
+        k, _ = fb.compute_flareness(mapper_graph, entity, weight='weight')
+        expected_k, _ = fb.compute_flareness(G, entity, weight='weight')
+        assert sorted(k) == pytest.approx(sorted(expected_k))
+
+    nx.set_edge_attributes(G, 2.0, 'length')
+    G.edges[list(G.edges)[0]]['length'] = 3.0
+    mapper_graph = MapperGraph.from_networkx(G)
+    arrays = fc.GraphArrays(mapper_graph)
+    for entity in entities:
+        G_entity = set(fc.get_nodes_containing_entity(G, entity))
+        for weight in ['length', 'weight', 'missing']:
+            assert fb._constant_length(mapper_graph, G_entity, weight, arrays) == fb._constant_length(G, G_entity, weight)
+
+    centralities = mcen.compute_centralities(mapper_graph)
+    assert centralities == mcen.compute_centralities(G)
+
+    flares = flr.flare_detect(mapper_graph, centralities['harmonic'])
+    expected_flares = flr.flare_detect(G, centralities['harmonic'])
+    assert [(f.birth, f.death, f.nodes) for f in flares] == [(f.birth, f.death, f.nodes) for f in expected_flares]
+
+    index = fc.EntityNodeIndex(mapper_graph)
+    assert index.nodes == fc.EntityNodeIndex(G).nodes
+
+    measures = ms.compute_centrality_measures(mapper_graph, entities, [nx.harmonic_centrality], [np.mean, len])
+    assert measures.equals(ms.compute_centrality_measures(G, entities, [nx.harmonic_centrality], [np.mean, len]))
+
+
+def test_append_centrality_flare_numbers(kmapper_graph):
+    G = entity_nxgraph(kmapper_graph)
+    mapper_graph = MapperGraph.from_networkx(G)
+
+    H = td.nxmapper_append_centrality_flare_numbers(mapper_graph)
+    expected = td.nxmapper_append_centrality_flare_numbers(G.copy())
+    assert nx.utils.graphs_equal(H, expected)
+    assert 'Hcentrality' not in mapper_graph.node_data
+
+
+def test_missing_and_none_attributes():
+    G = nx.path_graph(3)
+    nx.set_node_attributes(G, {0: [0], 1: [1], 2: [2]}, 'membership')
+    G.nodes[0]['label'] = None
+    G.nodes[1]['label'] = 'x'
+
+    mapper_graph = MapperGraph.from_networkx(G)
+    assert dict(mapper_graph.nodes[0]) == {'membership': [0], 'label': None}
+    assert 'label' not in mapper_graph.nodes[2]
+    assert list(mapper_graph.nodes.data('label', default='none')) == [(0, None), (1, 'x'), (2, 'none')]
+    assert nx.utils.graphs_equal(mapper_graph.to_networkx(), G)
+    assert nx.utils.graphs_equal(mapper_graph.subgraph([0, 2]).to_networkx(), G.subgraph([0, 2]))
@@ -0,0 +1,105 @@
+import pytest
+import numpy as np
+import networkx as nx
+
+import mappertools.features.mapper_stats as ms
+
+
+@pytest.fixture
+def entity_graph():
+    G = nx.gnm_random_graph(30, 50, seed=0)
+    rng = np.random.default_rng(0)
+    for node in G.nodes:
+        G.nodes[node]['unique_members'] = sorted(set(rng.choice(list('abcdefg'), size=3).tolist()))
+    return G
+
+
+def test_centrality_measures(entity_graph):
+    G = entity_graph
+    entities = list('abcdefgz')
+    spread = (lambda x: max(x) - min(x))
+
+    ans = ms.compute_centrality_measures(G, entities, [nx.harmonic_centrality, nx.closeness_centrality],
+                                         [np.mean, max, len, spread])
+
+    assert list(ans.columns) == ['harmonic_centrality', 'harmonic_centrality_mean', 'harmonic_centrality_max',
+                                 'harmonic_centrality_len', 'harmonic_centrality_<lambda>',
+                                 'closeness_centrality', 'closeness_centrality_mean', 'closeness_centrality_max',
+                                 'closeness_centrality_len', 'closeness_centrality_<lambda>']
+
+    # object columns, as when built entity by entity
+    assert list(ans.dtypes) == [object] * len(ans.columns)
+    assert all(isinstance(x, int) for x in ans['harmonic_centrality_len'].dropna())
+
+    harmonic = nx.harmonic_centrality(G)
+    for entity in entities:
+        values = [harmonic[node] for node in G if entity in G.nodes[node]['unique_members']]
+        assert ans.loc[entity, 'harmonic_centrality'] == pytest.approx(values)
+        if len(values) == 0:
+            assert np.isnan(ans.loc[entity, 'harmonic_centrality_mean'])
+            continue
+        assert ans.loc[entity, 'harmonic_centrality_mean'] == pytest.approx(np.mean(values))
+        assert ans.loc[entity, 'harmonic_centrality_max'] == pytest.approx(max(values))
+        assert ans.loc[entity, 'harmonic_centrality_len'] == len(values)
+        assert ans.loc[entity, 'harmonic_centrality_<lambda>'] == pytest.approx(spread(values))
+
+
+def test_centrality_cache(entity_graph):
+    G = entity_graph
+    calls = []
+    def degree(G):
+        calls.append(1)
+        return dict(G.degree)
+
+    cache = ms.FeatureCache()
+    first = ms.compute_centrality_measures(G, list('abc'), [degree], [np.mean], cache=cache)
+    second = ms.compute_centrality_measures(G, list('cde'), [degree], [np.sum, np.median], cache=cache)
+    assert len(calls) == 1
+    assert first.loc['c', 'degree'] == second.loc['c', 'degree']
+    assert all(isinstance(x, int) for x in first.loc['c', 'degree'])
+
+    G.remove_edge(*list(G.edges)[0])
+    ms.compute_centrality_measures(G, list('abc'), [degree], [np.mean], cache=cache)
+    assert len(calls) == 2
+    assert len(cache) == 2
+
+    u, v = list(G.edges)[0]
+    G.edges[u, v]['weight'] = 5
+    ms.compute_centrality_measures(G, list('abc'), [degree], [np.mean], cache=cache)
+    assert len(calls) == 3
+
+    ms.compute_centrality_measures(G, list('abc'), [degree], [np.mean])
+    ms.compute_centrality_measures(G, list('abc'), [degree], [np.mean])
+    assert len(calls) == 5
+
+
+def test_graph_fingerprint_large_members():
+    def graph(members):
+        G = nx.path_graph(3)
+        for node in G:
+            G.nodes[node]['members'] = members + node
+        return G
+
+    members = np.arange(5000)
+    changed = members.copy()
+    changed[2500] = -1
+    assert repr(members) == repr(changed)
+    assert ms.graph_fingerprint(graph(members)) != ms.graph_fingerprint(graph(changed))
+    assert ms.graph_fingerprint(graph(members)) == ms.graph_fingerprint(graph(members.copy()))
+
+    G, H = graph(members), graph(members)
+    for node in H:
+        H.nodes[node]['members'] = H.nodes[node]['members'].tolist()
+    assert ms.graph_fingerprint(G) != ms.graph_fingerprint(H)
+    H.nodes[0]['members'][0] = 0.0
+    K = graph(members)
+    for node in K:
+        K.nodes[node]['members'] = K.nodes[node]['members'].tolist()
+    assert ms.graph_fingerprint(H) != ms.graph_fingerprint(K)
+
+
+def test_entity_membership(entity_graph):
+    ans = ms.compute_entity_membership(entity_graph, list('az'))
+    assert list(ans.dtypes) == [object, object]
+    assert ans.loc['z', 'num_containing_nodes'] == 0
+    assert ans.loc['a', 'num_containing_nodes'] == len(ans.loc['a', 'containing_nodes'])
@@ -0,0 +1,64 @@
+import pytest
+import numpy as np
+
+import mappertools.utils.membership as mbr
+
+
+memberships = [[0,1,3], [], [2,3,3,4], [4]]
+values = np.array([[1.,5.], [2.,2.], [4.,2.], [-1.,0.], [7.,1.]])
+
+
+def test_csr_roundtrip():
+    indptr, indices = mbr.memberships_to_csr(memberships)
+    assert np.array_equal(indptr, [0,3,3,7,8])
+    for members, expected in zip(mbr.csr_to_memberships(indptr, indices), memberships):
+        assert list(members) == expected
+
+    M = mbr.incidence_matrix(indptr, indices)
+    assert M.shape == (4,5)
+    assert np.array_equal(M.getnnz(axis=1), [3,0,3,1])
+
+
+@pytest.mark.parametrize("how,fun", [('sum', np.sum), ('mean', np.mean), ('min', np.min), ('max', np.max)])
+def test_segment_reduce(how, fun):
+    indptr, indices = mbr.memberships_to_csr(memberships)
+    reduced = mbr.segment_reduce(mbr.gather(values, indices), indptr, how)
+
+    assert reduced.shape == (4,2)
+    assert np.all(np.isnan(reduced[1]))
+    for i in [0,2,3]:
+        assert np.allclose(reduced[i], fun(values[memberships[i]], axis=0))
+
+
+def test_segment_mode_and_count():
+    indptr, indices = mbr.memberships_to_csr(memberships)
+    labels = np.array(['a', 'b', 'b', 'c', 'a'])
+
+    assert np.array_equal(mbr.segment_reduce(labels[indices], indptr, 'count'), [3,0,4,1])
+
+    modes = mbr.segment_reduce(labels[indices], indptr, 'mode')
+    assert list(modes[[0,2,3]]) == ['a', 'c', 'a']
+
+
+@pytest.mark.parametrize("how,fun", [('var', np.var), ('median', np.median),
+                                     ('quantile', (lambda x, axis: np.quantile(x, 0.3, axis=axis)))])
+def test_segment_reduce_spread(how, fun):
+    indptr, indices = mbr.memberships_to_csr(memberships)
+    reduced = mbr.segment_reduce(values[indices], indptr, how, q=0.3)
+
+    for i in [0,2,3]:
+        assert np.allclose(reduced[i], fun(values[memberships[i]], axis=0))
+
+
+def test_segment_reduce_quantile_nan():
+    indptr = np.array([0, 3, 5])
+    x = np.array([1.0, np.nan, 2.0, 3.0, 4.0])
+
+    for how in ['median', 'quantile']:
+        reduced = mbr.segment_reduce(x, indptr, how, q=0.5)
+        assert np.isnan(reduced[0])
+        assert reduced[1] == np.quantile(x[3:5], 0.5)
+
+    for q in [None, 1.5]:
+        with pytest.raises(ValueError):
+            mbr.segment_reduce(x, indptr, 'quantile', q=q)
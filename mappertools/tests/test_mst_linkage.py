@@ -0,0 +1,48 @@
+import pytest
+import numpy as np
+import scipy.cluster.hierarchy
+import sklearn.metrics
+
+import mappertools.mapper.mst_linkage as ml
+
+
+def same_partition(a, b):
+    return sklearn.metrics.adjusted_rand_score(a, b) == 1
+
+
+@pytest.mark.parametrize("metric", ['euclidean', 'cityblock', 'chebyshev'])
+def test_matches_scipy(metric):
+    rng = np.random.default_rng(0)
+    X = np.r_[rng.normal(size=(150,2)), rng.normal(size=(100,2)) + 8, rng.normal(size=(3,2)) + 30]
+    X[:4] = X[0]
+
+    Z = ml.mst_single_linkage(X, metric=metric, n_neighbors=4)
+    expected = scipy.cluster.hierarchy.linkage(X, method='single', metric=metric)
+    assert np.allclose(Z[:,2], expected[:,2])
+
+    for t in np.unique(expected[:,2]):
+        assert same_partition(scipy.cluster.hierarchy.fcluster(Z, t, criterion='distance'),
+                              scipy.cluster.hierarchy.fcluster(expected, t, criterion='distance'))
+
+
+def test_ties():
+    X = np.round(np.random.default_rng(1).normal(size=(200,2)) * 2)
+
+    Z = ml.mst_single_linkage(X, n_neighbors=2)
+    expected = scipy.cluster.hierarchy.linkage(X, method='single')
+    assert np.allclose(Z[:,2], expected[:,2])
+    for t in np.unique(expected[:,2]):
+        assert same_partition(scipy.cluster.hierarchy.fcluster(Z, t, criterion='distance'),
+                              scipy.cluster.hierarchy.fcluster(expected, t, criterion='distance'))
+
+
+def test_minimum_spanning_tree():
+    X = np.random.default_rng(2).normal(size=(60,3))
+    u, v, w = ml.minimum_spanning_tree(X)
+    assert len(u) == 59
+    assert np.allclose(w, np.linalg.norm(X[u] - X[v], axis=1))
+    assert np.isclose(w.sum(), scipy.cluster.hierarchy.linkage(X, method='single')[:,2].sum())
+
+    assert len(ml.minimum_spanning_tree(X[:1])[0]) == 0
+    with pytest.raises(ValueError):
+        ml.minimum_spanning_tree(X, metric='cosine')
@@ -6,6 +6,12 @@ import kmapper as km
 import sklearn.cluster
 
 import numpy as np
+import pandas
+
+import io
+import json
+import gzip
+import contextlib
 
 @pytest.fixture
 def small_nxgraph():
@@ -75,3 +81,169 @@ def test_kmapper_sample():
 
     for _,data in nxgraph.nodes.data():
         assert 'membership' in data
+
+
+def test_basic_data_brute_force():
+    data = np.random.normal(size=(300,2))
+    graph = km.KeplerMapper(verbose=0).map(data[:,:1], data, clusterer=sklearn.cluster.DBSCAN(eps=0.3, min_samples=1),
+                                           cover=km.Cover(n_cubes=6, perc_overlap=0.4))
+    nxgraph = td.kmapper_to_nxmapper(graph)
+    assert len(nxgraph.edges) > 0
+
+    for u, v, edge_data in nxgraph.edges.data():
+        u_mem = set(nxgraph.nodes[u]['membership'])
+        v_mem = set(nxgraph.nodes[v]['membership'])
+        assert set(edge_data['membership']) == u_mem.intersection(v_mem)
+        assert edge_data['count'] == len(u_mem.intersection(v_mem))
+        assert np.isclose(edge_data['weight'], edge_data['count'] / len(u_mem.union(v_mem)))
+
+    for node, node_data in nxgraph.nodes.data():
+        assert node_data['count'] == len(node_data['membership'])
+
+    lean = td.nxmapper_append_basic_data(km.adapter.to_nx(graph), edge_members=False)
+    for u, v, edge_data in lean.edges.data():
+        assert 'membership' not in edge_data
+        assert edge_data['count'] == nxgraph.edges[(u,v)]['count']
+
+
+def test_nxmapper_columnar_data(small_nxgraph):
+    G,extra_data,transforms = small_nxgraph
+    frame = pandas.DataFrame({'colors': extra_data['colors'],
+                              'day': [extra_data['day'][k] for k in range(4)]})
+
+    td.nxmapper_append_node_member_data(G, frame, transforms)
+    assert (G.nodes[1]['colors'] == 'redgreenblack')
+    assert (G.nodes[2]['day'] == 20)
+
+    td.nxmapper_append_node_member_data(G, frame)
+    assert (G.nodes[1]['colors'] == ['red','green','black'])
+    assert (G.nodes[2]['day'] == [20,30,40])
+
+    reductions = {'colors': 'mode', 'day': 'mean'}
+    td.nxmapper_append_node_member_data(G, frame, reductions)
+    assert (G.nodes[1]['colors'] == 'black')
+    assert np.isclose(G.nodes[1]['day'], 70/3)
+
+    td.nxmapper_append_edge_member_data(G, {'day': frame['day'].to_numpy()}, {'day': 'max'})
+    assert (G.edges[(1,2)]['day'] == 40)
+
+
+def test_nxmapper_columnar_data_by_label(small_nxgraph):
+    G,_,_ = small_nxgraph
+    day = pandas.Series([40,30,20,10], index=[3,2,1,0])
+
+    td.nxmapper_append_node_member_data(G, {'day': day}, {'day': 'sum'})
+    assert (G.nodes[1]['day'] == 70)
+    assert (G.nodes[2]['day'] == 90)
+
+
+def test_nxmapper_reduction_needs_columnar_data(small_nxgraph):
+    G,extra_data,_ = small_nxgraph
+    with pytest.raises(ValueError, match="columnar"):
+        td.nxmapper_append_node_member_data(G, extra_data, {'day': 'sum'})
+
+    graph = {'nodes': {'a': [0,1,2], 'b': [2,3]}, 'links': {}}
+    with pytest.raises(ValueError, match="DataFrame"):
+        td._compute_averages({'day': extra_data['day']}, graph, averager='mean')
+
+
+def test_cluster_averages():
+    frame = pandas.DataFrame(np.random.normal(size=(6,3)), columns=['x','y','z'])
+    graph = {'nodes': {'a': [0,1,2], 'b': [2,3,4,5], 'c': [5]}, 'links': {}}
+
+    expected = td._compute_averages(frame, graph, averager=(lambda x: np.median(x, axis=0)))
+    assert np.allclose(td._compute_averages(frame, graph, averager='median'), expected)
+
+    expected = td._compute_averages(frame, graph, averager=(lambda x: np.mean(x, axis=0)))
+    assert np.allclose(td._compute_averages(frame, graph), expected)
+    assert list(expected.columns) == ['a','b','c']
+    assert list(expected.index) == ['x','y','z']
+
+
+def test_nxmapper_centrality_flare_numbers():
+    G = nx.generators.classic.star_graph(6)
+    td.nxmapper_append_centrality_flare_numbers(G)
+
+    expected = nx.betweenness_centrality(G)
+    for node in G.nodes:
+        assert G.nodes[node]['Bcentrality'] == pytest.approx(expected[node])
+        for code in 'HCB':
+            assert code + 'flare' in G.nodes[node]
+    assert len(set(G.nodes[node]['Hflare'] for node in G.nodes)) == 6
+
+
+def test_cytoscapejson_dump(tmp_path):
+    data = np.random.default_rng(0).normal(size=(50,2))
+    graph = km.KeplerMapper(verbose=0).map(data[:,:1], data, clusterer=sklearn.cluster.DBSCAN(eps=0.5, min_samples=1),
+                                           cover=km.Cover(n_cubes=4,perc_overlap=0.3))
+    nxgraph = td.kmapper_to_nxmapper(graph)
+    positions = np.random.default_rng(1).normal(size=(len(nxgraph), 2))
+
+    expected = nx.readwrite.json_graph.cytoscape_data(nxgraph)
+    for i, node in enumerate(expected["elements"]["nodes"]):
+        node["position"] = {"x": 2.0 * positions[i,0], "y": 2.0 * positions[i,1]}
+
+    td.cytoscapejson_dump(nxgraph, str(tmp_path / "graph.json"), 2.0, positions)
+    with open(tmp_path / "graph.json", encoding='utf8') as f:
+        text = f.read()
+    assert text == json.dumps(expected, ensure_ascii=False)
+
+    td.cytoscapejson_dump(nxgraph, str(tmp_path / "graph.json.gz"), 2.0, positions)
+    with gzip.open(tmp_path / "graph.json.gz", 'rt', encoding='utf8') as f:
+        assert f.read() == text
+
+
+def test_kmapper_text_dump(tmp_path):
+    graph = {'nodes': {'a': [0, 1], 'b': [1, 2]}, 'links': {'a': ['b']}}
+    labels = ['x', 'y', 'z']
+
+    for kwargs in [{}, {'labels': labels}]:
+        expected = io.StringIO()
+        with contextlib.redirect_stdout(expected):
+            print("Nodes")
+            for node, members in graph['nodes'].items():
+                print("#" + node)
+                print(len(members))
+                if 'labels' in kwargs:
+                    for mem in members:
+                        print(labels[mem])
+                else:
+                    print(members)
+            print("Links")
+            for cluster, links in graph['links'].items():
+                print(cluster)
+                print(links)
+            if 'labels' in kwargs:
+                print("Labels")
+                for idx, val in enumerate(labels):
+                    print(str(idx) + " " + str(val))
+
+        out = io.StringIO()
+        td.kmapper_text_dump(graph, out, **kwargs)
+        assert out.getvalue() == expected.getvalue()
+
+        td.kmapper_text_dump(graph, str(tmp_path / "graph.txt.gz"), **kwargs)
+        with gzip.open(tmp_path / "graph.txt.gz", 'rt') as f:
+            assert f.read() == expected.getvalue()
+
+
+def test_kmapper_clean_graph():
+    data = np.random.default_rng(0).normal(size=(60,2))
+    graph = km.KeplerMapper(verbose=0).map(data[:,:1], data, clusterer=sklearn.cluster.DBSCAN(eps=0.4, min_samples=1),
+                                           cover=km.Cover(n_cubes=5,perc_overlap=0.4))
+    min_num_members = 3
+    small = {node for node, members in graph['nodes'].items() if len(members) < min_num_members}
+    assert len(small) > 0
+
+    expected_nodes = {node: members for node, members in graph['nodes'].items() if node not in small}
+    expected_links = {node: set(targets) - small for node, targets in graph['links'].items() if node not in small}
+    original_nodes = dict(graph['nodes'])
+
+    cleaned = td.kmapper_clean_graph(graph, min_num_members)
+    assert cleaned['nodes'] == expected_nodes
+    assert {node: set(targets) for node, targets in cleaned['links'].items()} == expected_links
+    assert graph['nodes'] == original_nodes
+
+    td.kmapper_clean_graph(graph, min_num_members, inplace=True)
+    assert graph['nodes'] == expected_nodes
+    assert {node: set(targets) for node, targets in graph['links'].items()} == expected_links
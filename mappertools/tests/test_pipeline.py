@@ -0,0 +1,57 @@
+import pytest
+import numpy as np
+import kmapper as km
+import sklearn.cluster
+
+import mappertools.mapper.covers as cv
+import mappertools.mapper.hierarchical_clustering as hc
+import mappertools.mapper.pipeline as mp
+
+
+def assert_same_graph(graph, expected):
+    assert graph["nodes"] == expected["nodes"]
+    edges = {(u,v) for u, vs in graph["links"].items() for v in vs}
+    expected_edges = {(u,v) for u, vs in expected["links"].items() for v in vs}
+    assert edges == expected_edges
+
+
+@pytest.mark.parametrize("lens_dim", [1, 2])
+def test_matches_kmapper(lens_dim):
+    X = np.random.normal(size=(400,3))
+    lens = X[:,:lens_dim]
+
+    clusterer = hc.HeuristicHierarchical(verbose=0)
+    expected = km.KeplerMapper(verbose=0).map(lens, X, clusterer=clusterer, cover=cv.EPCover(5,0.3))
+    pipeline = mp.MapperPipeline(cv.EPCover(5,0.3), clusterer).fit(X, lens)
+
+    assert_same_graph(pipeline.to_kmapper(), expected)
+
+    nxgraph = pipeline.to_networkx()
+    expected_nx = km.adapter.to_nx(expected)
+    assert set(nxgraph.nodes) == set(expected_nx.nodes)
+    assert {frozenset(e) for e in nxgraph.edges} == {frozenset(e) for e in expected_nx.edges}
+
+
+def test_kmapper_cover_and_noise():
+    X = np.random.normal(size=(300,2))
+    clusterer = sklearn.cluster.DBSCAN(eps=0.3, min_samples=3)
+    cover = km.Cover(n_cubes=4, perc_overlap=0.3)
+
+    expected = km.KeplerMapper(verbose=0).map(X[:,:1], X, clusterer=clusterer, cover=cover)
+    pipeline = mp.MapperPipeline(km.Cover(n_cubes=4, perc_overlap=0.3), clusterer).fit(X, X[:,0])
+
+    assert_same_graph(pipeline.to_kmapper(), expected)
+    assert np.all(pipeline.edge_counts_ >= 1)
+
+
+def test_lazy_high_dimensional_names():
+    # 10^20 rectangles are keyed by tuples, named by joining their interval indices
+    X = np.random.normal(size=(100,20))
+    lens = np.c_[np.arange(100), X]
+    pipeline = mp.MapperPipeline(cv.EPCover(10,0.01, lazy=True), sklearn.cluster.DBSCAN(eps=100, min_samples=1)).fit(X, X)
+
+    cover = cv.EPCover(10,0.01, lazy=True)
+    cover.fit(lens)
+    expected = ["cube{}_cluster0".format("_".join(map(str, cube))) for cube in cover.occupied_cubes(lens)]
+    assert pipeline.node_ids_ == expected
+    assert all(name.count("_") == 20 for name in pipeline.node_ids_)
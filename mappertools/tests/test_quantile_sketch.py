@@ -0,0 +1,41 @@
+import mappertools.mapper.quantile_sketch as qs
+import numpy as np
+
+
+def rank_errors(x, estimates, q):
+    xs = np.sort(x)
+    exact = np.percentile(x, q, method='nearest')
+    return np.abs(np.searchsorted(xs, estimates) - np.searchsorted(xs, exact))
+
+
+def test_small_exact():
+    x = np.random.normal(size=100)
+    sketch = qs.QuantileSketch(k=200).update(x)
+    q = np.linspace(0,100,21)
+
+    assert sketch.rank_error() == 0
+    assert np.array_equal(sketch.percentile(q), np.percentile(x, q, method='nearest'))
+
+
+def test_rank_error_bound():
+    x = np.random.exponential(size=50000)
+    sketch = qs.QuantileSketch(k=64)
+    for chunk in np.array_split(x, 13):
+        sketch.update(chunk)
+    q = np.linspace(0,100,51)
+
+    assert sketch.n == len(x)
+    assert sketch.rank_error() <= len(x) * (1 + np.log2(len(x)/64)) / 64
+    assert np.all(rank_errors(x, sketch.percentile(q), q) <= sketch.rank_error())
+
+
+def test_merge():
+    x = np.random.normal(size=20000)
+    parts = [qs.QuantileSketch(k=64).update(chunk) for chunk in np.array_split(x, 4)]
+    sketch = parts[0]
+    for part in parts[1:]:
+        sketch.merge(part)
+    q = np.linspace(0,100,51)
+
+    assert sketch.n == len(x)
+    assert np.all(rank_errors(x, sketch.percentile(q), q) <= sketch.rank_error())
@@ -0,0 +1,194 @@
+"""
+Helpers for memberships of Mapper nodes (or edges) stored in CSR layout:
+members of node i are indices[indptr[i]:indptr[i+1]].
+"""
+
+import numpy as np
+import scipy.sparse
+
+
+def memberships_to_csr(memberships):
+    """
+    Convert a sequence of member lists to CSR layout.
+
+    Parameters
+    ----------
+    memberships : iterable of lists or arrays of int
+
+    Returns
+    -------
+    (indptr, indices) : tuple of arrays
+    """
+    memberships = [np.asarray(members, dtype=np.int64) for members in memberships]
+    counts = np.fromiter((len(members) for members in memberships), dtype=np.int64, count=len(memberships))
+
+    indptr = np.zeros(len(memberships) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    indices = np.concatenate(memberships) if len(memberships) > 0 else np.empty(0, dtype=np.int64)
+    return indptr, indices
+
+
+def csr_to_memberships(indptr, indices):
+    """
+    Convert CSR layout to a list of member arrays.
+    """
+    return np.split(np.asarray(indices), indptr[1:-1])
+
+
+def incidence_matrix(indptr, indices, n_points=None):
+    """
+    Sparse binary node x point incidence matrix.
+
+    Parameters
+    ----------
+    indptr, indices : arrays
+        memberships in CSR layout.
+
+    n_points : int, optional
+        Number of points (columns). Defaults to 1 + the largest member index.
+
+    Returns
+    -------
+    M : scipy.sparse.csr_matrix [n_nodes, n_points]
+        M[i,p] = 1 if point p is a member of node i, 0 otherwise.
+    """
+    if n_points is None:
+        n_points = int(np.max(indices)) + 1 if len(indices) > 0 else 0
+
+    M = scipy.sparse.csr_matrix((np.ones(len(indices), dtype=np.int64), indices, indptr),
+                                shape=(len(indptr) - 1, n_points))
+    # repeated members count once
+    M.sum_duplicates()
+    M.data[:] = 1
+    return M
+
+
+def gather(data, indices):
+    """
+    Values of data at member indices, by fancy indexing.
+
+    Parameters
+    ----------
+    data : numpy array, or pandas Series or DataFrame
+        Data indexed by observation. Arrays are indexed by position,
+        pandas objects by index label.
+
+    indices : array of int
+    """
+    if hasattr(data, "index") and hasattr(data, "iloc"):
+        positions = data.index.get_indexer(indices)
+        if len(positions) > 0 and np.min(positions) < 0:
+            raise KeyError("Members not found in index of data")
+        return data.to_numpy()[positions]
+    return np.asarray(data)[indices]
+
+
+SEGMENT_REDUCTIONS = ('count', 'sum', 'mean', 'min', 'max', 'mode', 'var', 'median', 'quantile')
+
+def segment_reduce(values, indptr, how, q=None):
+    """
+    Reduce consecutive segments of values, at once for all segments.
+
+    Parameters
+    ----------
+    values : array [n_values] or [n_values, n_columns]
+        Values of members, in CSR layout given by indptr
+        (for example, output of gather).
+
+    indptr : array [n_segments + 1]
+        Segment i is values[indptr[i]:indptr[i+1]].
+
+    how : {'count', 'sum', 'mean', 'min', 'max', 'mode', 'var', 'median', 'quantile'}
+        Reduction to apply to each segment (and each column).
+        'mode' returns the smallest of the most common values.
+        'var', 'median' and 'quantile' are as numpy.var, numpy.median and numpy.quantile (with default options);
+        in particular, segments containing NaN reduce to NaN.
+
+    q : float in [0,1], optional
+        Quantile to compute. Required if how == 'quantile'.
+
+    Returns
+    -------
+    reduced : array [n_segments] or [n_segments, n_columns]
+        Reductions of empty segments are NaN (0 for 'count').
+    """
+    if how == 'quantile' and (q is None or not 0 <= q <= 1):
+        raise ValueError("Quantile q must be in [0,1], got {}".format(q))
+
+    values = np.asarray(values)
+    counts = np.diff(indptr)
+    if how == 'count':
+        return counts
+
+    nonempty = counts > 0
+    starts = np.asarray(indptr[:-1])[nonempty]
+    if len(starts) == 0:
+        return np.full((len(counts),) + values.shape[1:], np.nan)
+
+    if how in ('sum', 'mean', 'min', 'max'):
+        ufunc = {'sum': np.add, 'mean': np.add, 'min': np.minimum, 'max': np.maximum}[how]
+        reduced = ufunc.reduceat(values, starts, axis=0)
+        if how == 'mean':
+            reduced = reduced / counts[nonempty].reshape((-1,) + (1,) * (values.ndim - 1))
+    elif how == 'var':
+        segment_counts = counts[nonempty].reshape((-1,) + (1,) * (values.ndim - 1))
+        means = np.add.reduceat(values, starts, axis=0) / segment_counts
+        deviations = values - np.repeat(means, counts[nonempty], axis=0)
+        reduced = np.add.reduceat(deviations**2, starts, axis=0) / segment_counts
+    elif how in ('median', 'quantile'):
+        if how == 'median':
+            q = 0.5
+        if values.ndim == 1:
+            reduced = _segment_quantile(values, counts[nonempty], q)
+        else:
+            reduced = np.column_stack([_segment_quantile(values[:,c], counts[nonempty], q) for c in range(values.shape[1])])
+    elif how == 'mode':
+        if values.ndim == 1:
+            reduced = _segment_mode(values, counts[nonempty])
+        else:
+            reduced = np.column_stack([_segment_mode(values[:,c], counts[nonempty]) for c in range(values.shape[1])])
+    else:
+        raise ValueError("Unknown reduction {}".format(how))
+
+    if np.all(nonempty):
+        return reduced
+
+    ans = np.full((len(counts),) + reduced.shape[1:], np.nan,
+                  dtype=(object if reduced.dtype.kind in 'OSU' else float))
+    ans[nonempty] = reduced
+    return ans
+
+
+def _segment_mode(values, counts):
+    # values of nonempty segments, with counts[i] > 0 the size of segment i
+    uniques, codes = np.unique(values, return_inverse=True)
+    segments = np.repeat(np.arange(len(counts)), counts)
+
+    keys = segments * len(uniques) + codes.ravel()
+    keys, frequencies = np.unique(keys, return_counts=True)
+    key_segments, key_codes = keys // len(uniques), keys % len(uniques)
+
+    # per segment: highest frequency first, then smallest value
+    order = np.lexsort((key_codes, -frequencies, key_segments))
+    first = order[np.r_[True, np.diff(key_segments[order]) != 0]]
+    return uniques[key_codes[first]]
+
+
+def _segment_quantile(values, counts, q):
+    # values of nonempty segments, with counts[i] > 0 the size of segment i
+    segments = np.repeat(np.arange(len(counts)), counts)
+    values = values[np.lexsort((values, segments))]
+
+    starts = np.cumsum(counts) - counts
+    positions = q * (counts - 1)
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.minimum(lower + 1, counts - 1)
+    fractions = positions - lower
+
+    lower_values, upper_values = values[starts + lower], values[starts + upper]
+    ans = lower_values + fractions * (upper_values - lower_values)
+
+    # NaNs sort last; segments containing any propagate them, as numpy.quantile
+    if values.dtype.kind in 'fc':
+        ans = np.where(np.isnan(values[starts + counts - 1]), np.nan, ans)
+    return ans